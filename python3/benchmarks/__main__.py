@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import re
+import sys
+import logging
+import platform
+
+from argparse import ArgumentParser
+from datetime import datetime
+from json import dump
+from os import path, makedirs
+
+from hap import __version__
+
+from benchmarks.corpus import SIZES
+from benchmarks.suite import Suite, measure
+
+
+RESULTS_DIR = path.join(path.dirname(path.abspath(__file__)), "results")
+
+
+def parse_args(argv=None):
+    psr = ArgumentParser(description="Hap! extraction engine benchmarks")
+    psr.add_argument("--sizes",
+                     help="comma separated corpus sizes ({})".format(
+                        ",".join(sorted(SIZES))),
+                     default="small,medium,large")
+    psr.add_argument("--repeat",
+                     help="samples collected per benchmark",
+                     type=int, default=7)
+    psr.add_argument("--number",
+                     help="calls per sample (0 to calibrate)",
+                     type=int, default=0)
+    psr.add_argument("--seed",
+                     help="corpus generator seed",
+                     type=int, default=0)
+    psr.add_argument("--filter",
+                     help="only run benchmarks matching this regex",
+                     action="store")
+    psr.add_argument("--output",
+                     help="JSON results filepath",
+                     action="store")
+    return psr.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark suite and store results as JSON.
+    """
+
+    args = parse_args(argv)
+    sizes = [s for s in args.sizes.split(",") if s]
+    for size in sizes:
+        if size not in SIZES:
+            raise SystemExit("Unknown corpus size: {}".format(size))
+    pattern = re.compile(args.filter) if args.filter else None
+    logging.getLogger().setLevel(logging.ERROR)
+
+    results = dict()
+    with Suite(sizes, args.seed) as suite:
+        for name, group, func in suite.cases(pattern):
+            stats = measure(func, args.repeat, args.number)
+            stats["group"] = group
+            results[name] = stats
+            print("{:<48} median {:>10.1f} us  p95 {:>10.1f} us".format(
+                name, stats["median"] * 1e6, stats["p95"] * 1e6))
+
+    now = datetime.now()
+    report = {
+        "meta": {
+            "version": __version__,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "datetime": now.isoformat(),
+            "sizes": sizes,
+            "seed": args.seed,
+            "argv": sys.argv[1:],
+        },
+        "benchmarks": results,
+    }
+    output = args.output
+    if output is None:
+        filename = "{}-{}.json".format(__version__,
+                                       now.strftime("%Y%m%d-%H%M%S"))
+        output = path.join(RESULTS_DIR, filename)
+    if path.dirname(output):
+        makedirs(path.dirname(output), exist_ok=True)
+    with open(output, "w") as fd:
+        dump(report, fd, indent=4, sort_keys=True)
+    print("Results saved to {}".format(output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import List, Tuple
+
+from argparse import ArgumentParser
+from json import load
+
+from benchmarks.suite import summarize
+
+
+OK, REGRESSION, IMPROVEMENT = "ok", "REGRESSION", "improved"
+MISSING, NEW, NOISY = "missing", "new", "too few samples"
+
+
+class Comparison(object):
+    """Compare candidate benchmark results against a baseline.
+
+    A benchmark regresses when its median or its p95 grow beyond the
+    configured relative thresholds and the candidate median also lies above
+    the baseline p95, i.e. outside the noise band observed on the baseline.
+    A p95 regression alone also requires the candidate median to be slower.
+    Benchmarks with fewer samples than min_repeat on either side are not
+    judged, unless strict mode treats them as failures.
+    """
+
+    def __init__(self, baseline: dict, candidate: dict,
+                 median_threshold: float = 0.10, p95_threshold: float = 0.20,
+                 min_repeat: int = 5, groups: List[str] = None,
+                 strict: bool = False):
+        self.baseline = baseline.get("benchmarks", {})
+        self.candidate = candidate.get("benchmarks", {})
+        self.median_threshold = median_threshold
+        self.p95_threshold = p95_threshold
+        self.min_repeat = min_repeat
+        self.groups = groups
+        self.strict = strict
+
+    @staticmethod
+    def stats(result: dict) -> dict:
+        """Recompute statistics from raw samples when available.
+        """
+
+        samples = result.get("samples")
+        if isinstance(samples, list) and len(samples) > 0:
+            return summarize(samples)
+        return result
+
+    @staticmethod
+    def change(old: float, new: float) -> float:
+        if old == 0:
+            return 0.0
+        return (new - old) / old
+
+    def selected(self, name: str, result: dict) -> bool:
+        if self.groups is None:
+            return True
+        group = result.get("group", name.split(".", 1)[0])
+        return group in self.groups
+
+    def judge(self, base: dict, cand: dict) -> Tuple[str, float, float]:
+        """Compare a single benchmark.
+
+        Returns:
+            tuple: Status, median relative change and p95 relative change.
+        """
+
+        base, cand = self.stats(base), self.stats(cand)
+        median = self.change(base["median"], cand["median"])
+        p95 = self.change(base["p95"], cand["p95"])
+        if min(base["repeat"], cand["repeat"]) < self.min_repeat:
+            return NOISY, median, p95
+        if median > self.median_threshold and cand["median"] > base["p95"]:
+            return REGRESSION, median, p95
+        if p95 > self.p95_threshold and cand["median"] > base["median"]:
+            return REGRESSION, median, p95
+        if median < -self.median_threshold and cand["p95"] < base["median"]:
+            return IMPROVEMENT, median, p95
+        return OK, median, p95
+
+    def rows(self) -> list:
+        """Compare all benchmarks from both runs.
+
+        Returns:
+            list: Tuples of name, status, baseline and candidate stats and
+                  relative changes.
+        """
+
+        rows = []
+        for name in sorted(set(self.baseline) | set(self.candidate)):
+            base = self.baseline.get(name)
+            cand = self.candidate.get(name)
+            if not self.selected(name, base or cand):
+                continue
+            if base is None:
+                rows.append((name, NEW, None, self.stats(cand), None, None))
+            elif cand is None:
+                rows.append((name, MISSING, self.stats(base), None, None,
+                             None))
+            else:
+                status, median, p95 = self.judge(base, cand)
+                rows.append((name, status, self.stats(base),
+                             self.stats(cand), median, p95))
+        return rows
+
+    def failed(self, rows: list) -> bool:
+        statuses = set(row[1] for row in rows)
+        if REGRESSION in statuses:
+            return True
+        return self.strict and bool(statuses & {MISSING, NOISY})
+
+    @staticmethod
+    def table(rows: list) -> str:
+        """Readable diff table of compared benchmarks.
+        """
+
+        def usec(stats, key):
+            return "-" if stats is None else "{:.1f}".format(stats[key] * 1e6)
+
+        def pct(value):
+            return "-" if value is None else "{:+.1f}%".format(value * 100)
+
+        header = ("benchmark", "base med", "cand med", "delta",
+                  "base p95", "cand p95", "delta", "n", "status")
+        lines = []
+        for name, status, base, cand, median, p95 in rows:
+            repeat = "/".join(str(s["repeat"]) for s in (base, cand) if s)
+            lines.append((name, usec(base, "median"), usec(cand, "median"),
+                          pct(median), usec(base, "p95"), usec(cand, "p95"),
+                          pct(p95), repeat, status))
+        widths = [max(len(str(line[i])) for line in [header] + lines)
+                  for i in range(len(header))]
+        output = []
+        for line in [header] + lines:
+            cells = [str(line[0]).ljust(widths[0])]
+            cells += [str(c).rjust(w) for c, w in zip(line[1:-1], widths[1:])]
+            cells.append(str(line[-1]))
+            output.append("  ".join(cells))
+        output.insert(1, "-" * len(output[0]))
+        return "\n".join(output) + "\n(times in microseconds per call)"
+
+
+def main(argv=None):
+    """Compare two benchmark reports and fail on regressions.
+    """
+
+    psr = ArgumentParser(description="Hap! benchmark regression gate")
+    psr.add_argument("baseline", help="baseline JSON results")
+    psr.add_argument("candidate", help="candidate JSON results")
+    psr.add_argument("--median-threshold",
+                     help="tolerated relative median slowdown",
+                     type=float, default=0.10)
+    psr.add_argument("--p95-threshold",
+                     help="tolerated relative p95 slowdown",
+                     type=float, default=0.20)
+    psr.add_argument("--min-repeat",
+                     help="minimum samples required to judge a benchmark",
+                     type=int, default=5)
+    psr.add_argument("--groups",
+                     help="comma separated benchmark groups to gate",
+                     default="parser,cache,fetch")
+    psr.add_argument("--strict",
+                     help="fail on missing or undersampled benchmarks",
+                     action="store_true")
+    args = psr.parse_args(argv)
+
+    with open(args.baseline) as fd:
+        baseline = load(fd)
+    with open(args.candidate) as fd:
+        candidate = load(fd)
+    groups = [g for g in args.groups.split(",") if g] or None
+    cmp = Comparison(baseline, candidate, args.median_threshold,
+                     args.p95_threshold, args.min_repeat, groups, args.strict)
+    rows = cmp.rows()
+    print(cmp.table(rows))
+    if cmp.failed(rows):
+        regressed = [row[0] for row in rows
+                     if row[1] in (REGRESSION, MISSING, NOISY)]
+        raise SystemExit("Performance gate failed: {}".format(
+            ", ".join(regressed)))
+    print("Performance gate passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from random import Random
+
+
+WORDS = (
+    "lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipisicing",
+    "elit", "sed", "do", "eiusmod", "tempor", "incididunt", "ut", "labore",
+    "et", "dolore", "magna", "aliqua", "enim", "ad", "minim", "veniam",
+    "quis", "nostrud", "exercitation", "ullamco", "laboris", "nisi",
+)
+
+TOPICS = ("dogs", "cats", "cars", "boats", "trains", "planes")
+
+SIZES = {
+    # name       sections, items, depth, words
+    "small":    (5,        5,     3,     20),
+    "medium":   (40,       20,    5,     40),
+    "large":    (150,      50,    8,     80),
+}
+
+
+class Corpus(object):
+    """Deterministic synthetic HTML generator.
+
+    The same seed and shape always produce the same document, so results of
+    different releases are measured against identical input. Every document
+    contains the landmarks used by the benchmark dataplans.
+    """
+
+    def __init__(self, sections: int = 5, items: int = 5, depth: int = 3,
+                 words: int = 20, seed: int = 0):
+        self.sections = sections
+        self.items = items
+        self.depth = depth
+        self.words = words
+        self.random = Random(seed)
+
+    @classmethod
+    def sized(cls, size: str, seed: int = 0) -> "Corpus":
+        """Create a generator from a named size preset.
+
+        Args:
+            size (str): One of the keys of SIZES.
+            seed (int): Random seed.
+
+        Returns:
+            Corpus: Generator instance.
+        """
+
+        sections, items, depth, words = SIZES[size]
+        return cls(sections, items, depth, words, seed)
+
+    def sentence(self) -> str:
+        return " ".join(self.random.choice(WORDS) for _ in range(self.words))
+
+    def item(self, section: int, index: int) -> str:
+        price = self.random.randint(100, 99999) / 100.0
+        return (
+            "<li class=\"item\" id=\"item-{s}-{i}\">"
+            "<a href=\"/product/{s}/{i}\" title=\"Product {s}-{i}\">"
+            "Product {s}-{i}</a>"
+            "<span class=\"price\">{p:.2f} EUR</span>"
+            "<span class=\"stock\">{q} in stock</span>"
+            "<p>{t}</p>"
+            "</li>"
+        ).format(s=section, i=index, p=price, t=self.sentence(),
+                 q=self.random.randint(0, 500))
+
+    def nest(self, content: str, level: int) -> str:
+        for depth in range(level):
+            content = "<div class=\"level-{}\">{}</div>".format(depth, content)
+        return content
+
+    def section(self, section: int) -> str:
+        items = "".join(self.item(section, i) for i in range(self.items))
+        topic = self.random.choice(TOPICS)
+        body = (
+            "<h2>Section {s}</h2>"
+            "<p class=\"about\">This is a sentence about {t}.</p>"
+            "<ul class=\"items\">{i}</ul>"
+        ).format(s=section, t=topic, i=items)
+        return "<section id=\"section-{}\">{}</section>".format(
+            section, self.nest(body, self.depth))
+
+    def generate(self) -> str:
+        """Build the HTML document.
+
+        Returns:
+            str: Complete HTML document.
+        """
+
+        sections = "".join(self.section(s) for s in range(self.sections))
+        return (
+            "<!DOCTYPE html>\n<html>\n"
+            "<head><meta charset=\"utf-8\"><title>Hap Benchmark</title></head>"
+            "\n<body>\n"
+            "<a href=\"https://github.com/lexndru/hap\" title=\"Hap GitHub\" "
+            "id=\"github\">Hap GitHub</a>\n"
+            "<div class=\"clock\">12:00 AM</div>\n"
+            "{}\n"
+            "</body>\n</html>\n"
+        ).format(sections)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from copy import deepcopy
+
+
+DATAPLANS = {
+    "query_css": {
+        "declare": {"github": "string", "price": "decimal"},
+        "define": [
+            {"github": {"query_css": "#github"}},
+            {"price": [
+                {"query_css": "section:last-child li.item:last-child .price"},
+                {"remove": "[^0-9.]"},
+            ]},
+        ],
+    },
+    "query_xpath": {
+        "declare": {"url": "string", "stock": "integer"},
+        "define": [
+            {"url": {"query_xpath": "//*/a[@title='Hap GitHub']/@href"}},
+            {"stock": [
+                {"query_xpath": "(//li[@class='item'])[last()]"
+                                "/span[@class='stock']/text()"},
+                {"pattern": "(\\d+) in stock"},
+            ]},
+        ],
+    },
+    "pattern": {
+        "declare": {"topic": "string", "section": "integer"},
+        "define": [
+            {"paragraph": [
+                {"query": "section:last-child p.about"},
+                {"pattern": "This is .* about (?P<topic>.+)\\."},
+            ]},
+            {"section": [
+                {"query": "section:last-child h2"},
+                {"pattern": "Section (\\d+)"},
+            ]},
+        ],
+    },
+    "remove": {
+        "declare": {"time": "string", "alert": "string"},
+        "define": [
+            {"time": [
+                {"query": "body > div.clock"},
+                {"remove": "[^1234567890:]"},
+            ]},
+            {"alert": {"glue": "The time is :time"}},
+        ],
+    },
+    "replace": {
+        "declare": {"username": "string", "sentence": "string"},
+        "define": [
+            {"user": [
+                {"query_xpath": "//*/a[@id='github']/@href"},
+                {"pattern": "https?://.+/(?P<username>.+)/.*"},
+            ]},
+            {"sentence": [
+                {"query": "p.about"},
+                {"pattern": "(This is .* about (?P<placeholder>.+?))"},
+                {"replace": [":placeholder", ":username"]},
+            ]},
+        ],
+    },
+}
+
+
+def dataplan(directive: str, link: str) -> dict:
+    """Returns a fresh copy of a benchmark dataplan bound to a link.
+
+    Args:
+        directive (str): Key of DATAPLANS.
+        link      (str): Link to set on the dataplan.
+
+    Returns:
+        dict: Dataplan ready to be run.
+    """
+
+    plan = deepcopy(DATAPLANS[directive])
+    plan.update({"link": link})
+    return plan
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import socket
+
+from typing import List, Tuple
+
+from argparse import ArgumentParser
+from base64 import b64encode, b64decode
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from json import dump, load
+from random import Random
+from socketserver import ThreadingMixIn
+from threading import Thread, Lock
+from time import perf_counter, sleep
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import urlopen, Request
+
+
+class Cassette(object):
+    """Recorded HTTP interactions.
+
+    Each interaction keeps the request method and URL together with the
+    response status, headers, body and the time it took to be served. Bodies
+    are stored base64 encoded so binary and mis-encoded pages survive a round
+    trip through JSON.
+    """
+
+    def __init__(self, interactions: List[dict] = None):
+        self.interactions = dict()
+        for each in interactions or []:
+            self.interactions[(each["method"], each["url"])] = each
+
+    @classmethod
+    def load(cls, filepath: str) -> "Cassette":
+        with open(filepath, "r") as fd:
+            return cls(load(fd).get("interactions", []))
+
+    def save(self, filepath: str) -> None:
+        with open(filepath, "w") as fd:
+            dump({"interactions": list(self.interactions.values())}, fd,
+                 indent=4, sort_keys=True)
+
+    def add(self, url: str, body: bytes, status: int = 200,
+            headers: List[Tuple[str, str]] = None, method: str = "GET",
+            reason: str = "OK", elapsed: float = 0.0) -> None:
+        """Add or replace an interaction.
+        """
+
+        if isinstance(body, str):
+            body = body.encode("utf8")
+        if headers is None:
+            headers = [("Content-Type", "text/html; charset=utf-8")]
+        self.interactions[(method, url)] = {
+            "method": method,
+            "url": url,
+            "status": status,
+            "reason": reason,
+            "headers": [list(h) for h in headers],
+            "body": b64encode(body).decode("ascii"),
+            "elapsed": elapsed,
+        }
+
+    def find(self, method: str, url: str) -> dict:
+        return self.interactions.get((method, url))
+
+    def record(self, url: str, headers: dict = None,
+               timeout: float = 30) -> dict:
+        """Fetch a URL and store the response, including error responses.
+
+        Args:
+            url      (str): URL to fetch.
+            headers (dict): Outgoing HTTP headers.
+            timeout (float): Socket timeout in seconds.
+
+        Returns:
+            dict: Recorded interaction.
+        """
+
+        request = Request(url, headers=headers or {})
+        start = perf_counter()
+        try:
+            response = urlopen(request, timeout=timeout)
+        except HTTPError as e:
+            response = e
+        body = response.read()
+        elapsed = perf_counter() - start
+        self.add(url, body, response.getcode(), response.headers.items(),
+                 request.get_method(), response.reason, elapsed)
+        return self.find(request.get_method(), url)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Serves recorded interactions.
+
+    Requests are matched either by absolute URL, when the replayer is used
+    as an HTTP proxy, or by a "/<netloc><path>" URL built with url_for.
+    """
+
+    protocol_version = "HTTP/1.1"
+    hop_headers = ("connection", "keep-alive", "transfer-encoding",
+                   "content-length", "content-encoding")
+
+    def log_message(self, *args):
+        pass
+
+    def original_url(self) -> str:
+        if self.path.startswith("http://") \
+                or self.path.startswith("https://"):
+            return self.path
+        netloc, _, rest = self.path.lstrip("/").partition("/")
+        return "{}://{}/{}".format(self.server.scheme, netloc, rest)
+
+    def do_GET(self):
+        self.replay()
+
+    def do_HEAD(self):
+        self.replay()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        self.server.last_request = (dict(self.headers), body)
+        self.replay()
+
+    def replay(self):
+        server = self.server
+        server.hits += 1
+        method = "GET" if self.command == "HEAD" else self.command
+        interaction = server.cassette.find(method, self.original_url())
+        fault = server.fault()
+        if server.latency is None and interaction is not None:
+            sleep(interaction.get("elapsed", 0))
+        elif server.latency:
+            sleep(server.latency)
+        if fault == "reset":
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        if fault == "timeout":
+            sleep(server.stall)
+            self.close_connection = True
+            return
+        if fault is not None:
+            return self.respond(int(fault), [], b"injected error")
+        if interaction is None:
+            return self.respond(404, [], b"not recorded")
+        self.respond(interaction["status"], interaction["headers"],
+                     b64decode(interaction["body"]))
+
+    def respond(self, status: int, headers: list, body: bytes):
+        self.send_response(status)
+        for key, value in headers:
+            if key.lower() not in self.hop_headers:
+                self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        bandwidth = self.server.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        chunk = max(1, int(bandwidth / 20))
+        for offset in range(0, len(body), chunk):
+            self.wfile.write(body[offset:offset + chunk])
+            self.wfile.flush()
+            sleep(chunk / float(bandwidth))
+
+
+class ReplayServer(ThreadingMixIn, HTTPServer):
+    """Local stand-in for recorded websites.
+
+    Args:
+        cassette (Cassette): Interactions to replay.
+        latency     (float): Seconds before each response, None to replay
+                             the recorded timing.
+        bandwidth     (int): Bytes per second, 0 for unlimited.
+        error_rate  (float): Probability of injecting a fault.
+        errors       (list): Faults to choose from: HTTP status codes,
+                             "reset" or "timeout".
+        stall       (float): Seconds a "timeout" fault keeps the socket idle.
+        seed          (int): Seed of the fault injector.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, cassette: Cassette, host: str = "127.0.0.1",
+                 port: int = 0, latency: float = 0.0, bandwidth: int = 0,
+                 error_rate: float = 0.0, errors: list = None,
+                 stall: float = 30.0, seed: int = 0, scheme: str = "http"):
+        HTTPServer.__init__(self, (host, port), ReplayHandler)
+        self.cassette = cassette
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.errors = errors or [503]
+        self.stall = stall
+        self.scheme = scheme
+        self.random = Random(seed)
+        self.lock = Lock()
+        self.hits = 0
+        self.last_request = None
+        self.thread = None
+
+    @property
+    def address(self) -> str:
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def url_for(self, url: str) -> str:
+        """Local URL replaying a recorded URL.
+        """
+
+        parts = urlsplit(url)
+        local = "{}/{}{}".format(self.address, parts.netloc, parts.path or "/")
+        if parts.query:
+            local += "?" + parts.query
+        return local
+
+    def handle_error(self, request, client_address):
+        pass
+
+    def fault(self):
+        with self.lock:
+            if self.error_rate and self.random.random() < self.error_rate:
+                return self.random.choice(self.errors)
+        return None
+
+    def __enter__(self) -> "ReplayServer":
+        self.thread = Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    """Record websites into a cassette or replay a cassette locally.
+    """
+
+    psr = ArgumentParser(description="Hap! HTTP record and replay harness")
+    sub = psr.add_subparsers(dest="command")
+    rec = sub.add_parser("record", help="record URLs into a cassette")
+    rec.add_argument("cassette", help="cassette JSON filepath")
+    rec.add_argument("urls", help="URLs to record", nargs="+")
+    rec.add_argument("--user-agent", help="User-Agent header",
+                     default="Hap! replay recorder")
+    srv = sub.add_parser("serve", help="replay a cassette")
+    srv.add_argument("cassette", help="cassette JSON filepath")
+    srv.add_argument("--port", type=int, default=8765)
+    srv.add_argument("--latency", type=float, default=None,
+                     help="seconds per response (default: as recorded)")
+    srv.add_argument("--bandwidth", type=int, default=0,
+                     help="bytes per second (default: unlimited)")
+    srv.add_argument("--error-rate", type=float, default=0.0,
+                     help="probability of injecting a fault")
+    srv.add_argument("--errors", default="503",
+                     help="comma separated faults: status, reset, timeout")
+    srv.add_argument("--seed", type=int, default=0)
+    args = psr.parse_args(argv)
+
+    if args.command == "record":
+        cassette = Cassette()
+        for url in args.urls:
+            each = cassette.record(url, {"User-Agent": args.user_agent})
+            print("{} {} {:.3f}s".format(each["status"], url,
+                                         each["elapsed"]))
+        cassette.save(args.cassette)
+    elif args.command == "serve":
+        errors = [e if e in ("reset", "timeout") else int(e)
+                  for e in args.errors.split(",") if e]
+        server = ReplayServer(Cassette.load(args.cassette), port=args.port,
+                              latency=args.latency, bandwidth=args.bandwidth,
+                              error_rate=args.error_rate, errors=errors,
+                              seed=args.seed)
+        print("Replaying {} interaction(s) on {}".format(
+            len(server.cassette.interactions), server.address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        psr.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import tracemalloc
+
+from typing import Callable, List
+
+from math import ceil, sqrt
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+
+from hap.cache import Cache
+from hap.parser import HTMLParser
+
+from benchmarks.corpus import Corpus
+from benchmarks.dataplans import DATAPLANS, dataplan
+from benchmarks.replay import Cassette, ReplayServer
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Percentile with linear interpolation between closest ranks.
+
+    Args:
+        samples (list): Measured values.
+        pct    (float): Percentile between 0 and 100.
+
+    Returns:
+        float: Interpolated percentile.
+    """
+
+    ordered = sorted(samples)
+    if len(ordered) == 0:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100.0
+    low, high = int(rank), int(ceil(rank))
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples: List[float]) -> dict:
+    """Summary statistics of a list of timings.
+
+    Args:
+        samples (list): Seconds per call of each repeat.
+
+    Returns:
+        dict: Statistics including the raw samples.
+    """
+
+    mean = sum(samples) / len(samples)
+    variance = sum((s - mean) ** 2 for s in samples) / len(samples)
+    return {
+        "samples": samples,
+        "repeat": len(samples),
+        "min": min(samples),
+        "mean": mean,
+        "median": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "stdev": sqrt(variance),
+    }
+
+
+def measure(func: Callable, repeat: int = 7, number: int = 0,
+            budget: float = 0.1) -> dict:
+    """Time a callable and record its peak Python memory.
+
+    If number is zero it is calibrated so that one repeat takes at least the
+    given budget of seconds. Memory is measured in a separate call because
+    tracing allocations skews timings. Allocations made by libxml2 itself are
+    not visible to tracemalloc.
+
+    Args:
+        func   (callable): Zero-argument function to measure.
+        repeat      (int): How many samples to collect.
+        number      (int): Calls per sample.
+        budget    (float): Minimum seconds per sample when calibrating.
+
+    Returns:
+        dict: Timing statistics in seconds per call and peak memory in bytes.
+    """
+
+    func()
+    if number < 1:
+        number = 1
+        while True:
+            start = perf_counter()
+            for _ in range(number):
+                func()
+            if perf_counter() - start >= budget or number >= 1 << 20:
+                break
+            number *= 2
+    samples = []
+    for _ in range(repeat):
+        start = perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((perf_counter() - start) / number)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = summarize(samples)
+    stats.update({"number": number, "peak_memory": peak})
+    return stats
+
+
+class Suite(object):
+    """Collection of extraction engine benchmarks.
+
+    Each benchmark prepares its input outside of the measured callable, so
+    only the targeted step is timed. Documents are written to a temporary
+    directory which also hosts the cache used by the benchmarks. Fetch
+    benchmarks are served by a local replay server without added latency,
+    so they measure the client side of the fetch path.
+    """
+
+    benchmarks = []
+
+    def __init__(self, sizes: List[str], seed: int = 0):
+        self.sizes = sizes
+        self.seed = seed
+        self.documents = dict()
+        self.workdir = None
+        self.server = None
+
+    @classmethod
+    def register(cls, group: str, name: str, sized: bool = True):
+        """Decorator to register a benchmark factory.
+
+        The factory receives the suite and a size name and returns the
+        zero-argument callable to measure.
+        """
+
+        def wrapper(factory):
+            cls.benchmarks.append((group, name, sized, factory))
+            return factory
+        return wrapper
+
+    def __enter__(self) -> "Suite":
+        self.workdir = mkdtemp(prefix="hap-bench-")
+        self.cache_directory = Cache.directory
+        Cache.directory = path.join(self.workdir, "cache")
+        return self
+
+    def __exit__(self, *args):
+        Cache.directory = self.cache_directory
+        if self.server is not None:
+            self.server.__exit__(*args)
+        rmtree(self.workdir, ignore_errors=True)
+
+    def document(self, size: str) -> str:
+        """Generated HTML document for a size, written once to disk.
+        """
+
+        if size not in self.documents:
+            html = Corpus.sized(size, self.seed).generate()
+            filepath = path.join(self.workdir, "{}.html".format(size))
+            with open(filepath, "w") as fd:
+                fd.write(html)
+            self.documents[size] = (html, filepath)
+        return self.documents[size][0]
+
+    def link(self, size: str) -> str:
+        self.document(size)
+        return HTMLParser.FILE_PROTOCOL + self.documents[size][1]
+
+    def url(self, size: str) -> str:
+        """Replayed URL serving the document of a size.
+        """
+
+        if self.server is None:
+            cassette = Cassette()
+            for each in self.sizes:
+                cassette.add(self.remote(each), self.document(each))
+            self.server = ReplayServer(cassette).__enter__()
+        return self.server.url_for(self.remote(size))
+
+    def remote(self, size: str) -> str:
+        return "http://bench.hap.local/{}.html".format(size)
+
+    def parser(self, size: str, directive: str = "query_css") -> HTMLParser:
+        psr = HTMLParser(dataplan(directive, self.link(size)))
+        psr.source = self.document(size)
+        return psr.prepare_source_code()
+
+    def cases(self, pattern=None):
+        """Yields names and callables of the selected benchmarks.
+        """
+
+        for group, name, sized, factory in self.benchmarks:
+            for size in (self.sizes if sized else [None]):
+                fullname = "{}.{}".format(group, name)
+                if size is not None:
+                    fullname = "{}:{}".format(fullname, size)
+                if pattern is not None and not pattern.search(fullname):
+                    continue
+                yield fullname, group, factory(self, size)
+
+
+@Suite.register("parser", "prepare_source_code")
+def bench_prepare_source_code(suite, size):
+    psr = suite.parser(size)
+    return psr.prepare_source_code
+
+
+@Suite.register("parser", "perform_query.css")
+def bench_perform_query_css(suite, size):
+    psr = suite.parser(size)
+    query = "section:last-child li.item:last-child .price"
+    return lambda: psr.perform_query(query)
+
+
+@Suite.register("parser", "perform_query.xpath")
+def bench_perform_query_xpath(suite, size):
+    psr = suite.parser(size)
+    query = "(//li[@class='item'])[last()]/span[@class='stock']/text()"
+    return lambda: psr.perform_query(query, xpath=True)
+
+
+@Suite.register("parser", "perform_pattern")
+def bench_perform_pattern(suite, size):
+    psr = suite.parser(size)
+    text = psr.source_code.cssselect("section:last-child")[0].text_content()
+
+    def perform():
+        psr.last_result = text
+        return psr.perform_pattern(r"(?s).*?about (?P<topic>\w+)\.")
+    return perform
+
+
+@Suite.register("parser", "prepare_declare", sized=False)
+def bench_prepare_declare(suite, size):
+    psr = HTMLParser(dataplan("query_css", "file:///dev/null"))
+    types = ("string", "integer", "decimal", "float", "boolean", "text")
+    declarations, data = dict(), dict()
+    for n in range(120):
+        key, datatype = "field_{}".format(n), types[n % len(types)]
+        declarations[key] = datatype
+        data[key] = "true" if datatype == "boolean" else str(n * 3)
+    psr.data = data
+    psr.records = dict()
+    return lambda: psr.prepare_declare(declarations)
+
+
+def bench_run(directive):
+    def factory(suite, size):
+        link = suite.link(size)
+        plan = dataplan(directive, link)
+        return lambda: HTMLParser(plan, no_cache=True).run()
+    return factory
+
+
+for directive in sorted(DATAPLANS):
+    Suite.register("parser", "run.{}".format(directive))(bench_run(directive))
+
+
+@Suite.register("parser", "run.memo_hit")
+def bench_run_memo_hit(suite, size):
+    plan = dataplan("query_css", suite.link(size))
+    HTMLParser(plan).run()
+    return lambda: HTMLParser(plan).run()
+
+
+@Suite.register("cache", "write_link")
+def bench_cache_write(suite, size):
+    html = suite.document(size)
+    link = "http://localhost/{}".format(size)
+    return lambda: Cache.write_link(link, html)
+
+
+@Suite.register("cache", "read_link")
+def bench_cache_read(suite, size):
+    link = "http://localhost/{}".format(size)
+    ok, status = Cache.write_link(link, suite.document(size))
+    if not ok:
+        raise RuntimeError(status)
+    return lambda: Cache.read_link(link)
+
+
+@Suite.register("fetch", "open_url")
+def bench_open_url(suite, size):
+    psr = HTMLParser(dataplan("query_css", suite.url(size)), no_cache=True)
+    psr.link = suite.url(size)
+    return psr.open_url
+
+
+@Suite.register("fetch", "open_url.cache_write")
+def bench_open_url_cache(suite, size):
+    psr = HTMLParser(dataplan("query_css", suite.url(size)))
+    psr.link = suite.url(size)
+    return psr.open_url
+
+
+@Suite.register("fetch", "run")
+def bench_fetch_run(suite, size):
+    link = suite.url(size)
+    return lambda: HTMLParser(dataplan("query_css", link), no_cache=True).run()
@@ -22,3 +22,15 @@
 
 
 __version__ = "1.3.2"
+
+
+def extract(dataplan, source=None, link=None, no_cache=False,
+            encoding=None):
+    """Run a dataplan in-process; see hap.api.extract.
+
+    The extraction engine is imported on first use, keeping "import hap"
+    cheap.
+    """
+
+    from hap.api import extract as run
+    return run(dataplan, source, link, no_cache, encoding)
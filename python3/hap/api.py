@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import List, Union
+
+from hap.log import Log
+from hap.field import Field
+from hap.error import HapError, DataplanError
+from hap.parser import HTMLParser
+from hap.reader import FileReader
+
+
+class Result(object):
+    """Outcome of one extraction.
+
+    A result always carries the records collected so far, even if some
+    definitions failed or the run was interrupted, together with every error
+    that occurred. A run is successful only if it has no errors.
+    """
+
+    def __init__(self, records: dict = None, errors: List[HapError] = None,
+                 link: str = None):
+        self.records = records if records is not None else dict()
+        self.errors = errors if errors is not None else list()
+        self.link = link
+
+    @property
+    def ok(self) -> bool:
+        return len(self.errors) == 0
+
+    @property
+    def error(self) -> Union[HapError, None]:
+        """First error of the run, if any.
+        """
+
+        return self.errors[0] if len(self.errors) > 0 else None
+
+    def raise_for_error(self) -> "Result":
+        """Raise the first error of the run, if any.
+        """
+
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def __repr__(self) -> str:
+        return "<Result link={!r} records={} errors={}>".format(
+            self.link, len(self.records), len(self.errors))
+
+
+def extract(dataplan: Union[dict, str], source: Union[str, bytes] = None,
+            link: str = None, no_cache: bool = False,
+            encoding: str = None) -> Result:
+    """Run a dataplan and return its result without ever exiting.
+
+    Args:
+        dataplan (dict): Dataplan, or filepath of a JSON dataplan.
+        source    (str): HTML document to parse instead of fetching the link.
+        link      (str): Link overwriting the one from the dataplan.
+        no_cache (bool): Whether to bypass the cache.
+        encoding  (str): Encoding of a bytes source, detected if None.
+
+    Returns:
+        Result: Records and errors of the run.
+    """
+
+    if isinstance(dataplan, str):
+        ok, data = FileReader(dataplan).read()
+        if not ok or not isinstance(data, dict):
+            error = DataplanError("Cannot read dataplan {}: {}".format(
+                dataplan, data if not ok else "not a JSON object"))
+            return Result(errors=[error], link=link)
+        dataplan = data
+    if not isinstance(dataplan, dict):
+        error = DataplanError("Unexpected dataplan received: required dict")
+        return Result(errors=[error], link=link)
+    if link is not None:
+        dataplan = dict(dataplan, **{Field.LINK: link})
+    elif source is not None and Field.LINK not in dataplan:
+        dataplan = dict(dataplan, **{Field.LINK: "about:blank"})
+
+    psr = HTMLParser(dataplan, no_cache=no_cache, source=source)
+    psr.encoding = encoding
+    try:
+        psr.run()
+    except HapError as e:
+        Log.error("%s", e)
+        psr.errors.insert(0, e)
+    return Result(psr.get_records(), psr.errors, psr.link)
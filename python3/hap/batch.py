@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+    FIRST_COMPLETED, wait
+from itertools import islice
+
+from hap.api import extract
+from hap.log import Log
+
+
+def extract_item(dataplan: dict, item: Tuple[str, Any, str]) -> dict:
+    """Run a dataplan over one document.
+
+    Args:
+        dataplan (dict): Dataplan to run.
+        item    (tuple): Key (link or member path), source and encoding.
+
+    Returns:
+        dict: Key, records and errors of the document. Errors never
+              propagate, so one bad document cannot stop a batch.
+    """
+
+    key, source, encoding = item
+    try:
+        result = extract(dataplan, source, key, no_cache=True,
+                         encoding=encoding)
+    except Exception as e:
+        return failure(key, e)
+    return summary(key, result)
+
+
+def fetch_item(dataplan: dict, link: str, no_cache: bool = False) -> dict:
+    """Fetch a link and run a dataplan over it, without raising.
+    """
+
+    try:
+        result = extract(dataplan, link=link, no_cache=no_cache)
+    except Exception as e:
+        return failure(link, e)
+    return summary(link, result)
+
+
+def summary(key: str, result: Any) -> dict:
+    return {
+        "link": key,
+        "records": result.records,
+        "errors": [str(e) for e in result.errors],
+    }
+
+
+def failure(key: str, error: Exception) -> dict:
+    Log.error("Cannot extract %s: %s", key, error)
+    return {"link": key, "records": dict(), "errors": [str(error)]}
+
+
+def extract_chunk(dataplan: dict,
+                  chunk: List[Tuple[str, Any, str]]) -> List[dict]:
+    return [extract_item(dataplan, item) for item in chunk]
+
+
+class Batch(object):
+    """Runs a dataplan over a stream of documents.
+
+    Documents are grouped in chunks distributed to a pool of worker
+    processes; only a bounded number of chunks is in flight, so sources of
+    any size are consumed lazily. Results are yielded as soon as their chunk
+    completes, not in the order of the documents. With a single worker the
+    documents are processed in-process.
+    """
+
+    def __init__(self, dataplan: dict, workers: int = 4,
+                 chunk_size: int = 16, backlog: int = 2):
+        self.dataplan = dataplan
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.backlog = max(1, backlog)
+
+    def chunks(self, items: Iterable) -> Iterator[list]:
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, self.chunk_size))
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    def run(self, items: Iterable[Tuple[str, Any, str]]) -> Iterator[dict]:
+        """Extract records from (key, source, encoding) items.
+        """
+
+        if self.workers == 1:
+            for item in items:
+                yield extract_item(self.dataplan, item)
+            return
+        limit = self.workers * self.backlog
+        with ProcessPoolExecutor(self.workers) as pool:
+            pending = set()
+            for chunk in self.chunks(items):
+                pending.add(pool.submit(extract_chunk, self.dataplan, chunk))
+                if len(pending) < limit:
+                    continue
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+            for future in pending:
+                yield from future.result()
+
+
+def fetch_links(dataplan: dict, links: Iterable[str], workers: int = 4,
+                no_cache: bool = False) -> Iterator[dict]:
+    """Fetch links and extract their records on a pool of threads.
+
+    Links are consumed lazily, only a couple per thread are queued at any
+    time, and results are yielded as soon as they complete.
+    """
+
+    workers = max(1, workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for link in links:
+            pending.add(pool.submit(fetch_item, dataplan, link, no_cache))
+            if len(pending) < workers * 2:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def report(results: Iterable[dict], emit: Callable = None) -> Tuple[int, int]:
+    total, failed = 0, 0
+    for result in results:
+        total += 1
+        failed += 1 if len(result["errors"]) > 0 else 0
+        if emit is not None:
+            emit(result)
+    Log.info("Extracted %d document(s), %d with errors", total, failed)
+    return total, failed
+
+
+def run_batch(dataplan: dict, items: Iterable[Tuple[str, Any, str]],
+              workers: int = 4, emit: Callable = None) -> Tuple[int, int]:
+    """Run a dataplan over many documents and emit one result per document.
+
+    Returns:
+        tuple: Number of documents and number of failed documents.
+    """
+
+    return report(Batch(dataplan, workers).run(items), emit)
+
+
+def run_links(dataplan: dict, links: Iterable[str], workers: int = 4,
+              no_cache: bool = False, emit: Callable = None) \
+        -> Tuple[int, int]:
+    """Run a dataplan over many links and emit one result per link.
+
+    Returns:
+        tuple: Number of links and number of failed links.
+    """
+
+    return report(fetch_links(dataplan, links, workers, no_cache), emit)
@@ -21,20 +21,20 @@
 # THE SOFTWARE.
 
 import sys
-import uuid
+
+from os import path
 
 from hap import __version__
 
-from hap.log import Log
 from hap.shell import Shell
-from hap.reader import FileReader
-from hap.writer import FileWriter
-from hap.parser import HTMLParser
-from hap.util import print_json, SAMPLES_MESSAGE
 
 
 def main():
     """Hap! bootstrap.
+
+    Modules which are expensive to import (lxml, urllib, the service modes)
+    are loaded only once the arguments ask for them, so short invocations
+    such as --version and --sample stay fast.
     """
 
     # Parse shell arguments
@@ -45,12 +45,42 @@ def main():
         return print("Hap! v{}".format(__version__))
 
     # Log config
+    from hap.log import Log
     Log.configure(not Shell.silent and Shell.verbose)
 
     # Dump info and exit
     if Shell.sample:
+        from hap.util import SAMPLES_MESSAGE
         return print(SAMPLES_MESSAGE)
 
+    # Default request policies for dataplans without their own
+    if Shell.timeout is not None:
+        from hap.client import Client
+        Client.connect_timeout = Client.read_timeout = Shell.timeout
+    if Shell.retries is not None:
+        from hap.retry import RetryPolicy
+        RetryPolicy.retries = max(0, Shell.retries)
+    if Shell.rate_limit is not None:
+        from hap.throttle import RateLimiter
+        RateLimiter.rate = Shell.rate_limit
+    if Shell.stream or Shell.max_body is not None:
+        from hap.parser import HTMLParser
+        HTMLParser.stream = HTMLParser.stream or Shell.stream
+        HTMLParser.max_body = Shell.max_body or HTMLParser.max_body
+
+    # Run as a long-lived extraction service
+    if Shell.serve is not None:
+        from hap.server import serve
+        return serve(Shell.serve, Shell.workers, no_cache=Shell.no_cache)
+
+    # Run dataplans periodically
+    if Shell.schedule is not None:
+        from hap.scheduler import schedule
+        return schedule(Shell.schedule, Shell.workers, Shell.no_cache,
+                        Shell.save, Shell.silent)
+
+    from hap.reader import FileReader
+
     # Input reader
     def read_json():
         if not sys.stdin.isatty():
@@ -80,10 +110,74 @@ def main():
     if not isinstance(data_in, dict):
         raise SystemExit("Corrupted input provided. Please fix and try again")
 
+    # Links and documents may be filtered by a regex
+    if Shell.match is not None:
+        from re import compile, error
+        try:
+            compile(Shell.match)
+        except error as e:
+            raise SystemExit("Invalid --match: {}".format(e))
+
+    # Run dataplan over an archive or a corpus
+    if Shell.warc is not None or Shell.corpus is not None:
+        from hap.batch import run_batch
+        from hap.parser import HTMLParser
+        from hap.util import print_json_line
+        mimetypes = tuple(Shell.mime or HTMLParser.supported_mime_types)
+        if Shell.warc is not None:
+            from hap.warc import WARCReader
+            if not path.isfile(Shell.warc):
+                raise SystemExit("Not a file: {}".format(Shell.warc))
+            reader = WARCReader(Shell.warc)
+        else:
+            from hap.corpus import CorpusReader
+            if not path.exists(Shell.corpus):
+                raise SystemExit("No such corpus: {}".format(Shell.corpus))
+            reader = CorpusReader(Shell.corpus)
+        documents = reader.documents(Shell.match, mimetypes)
+        emit = None if Shell.silent else print_json_line
+        try:
+            run_batch(data_in, documents, Shell.workers, emit)
+        except ValueError as e:
+            raise SystemExit("Cannot read archive: {}".format(e))
+        return
+
+    # Run dataplan over the links of a sitemap
+    if Shell.sitemap is not None:
+        from time import time
+        from hap.batch import run_links
+        from hap.error import FetchError
+        from hap.sitemap import Sitemap
+        from hap.util import print_json_line
+        since, started = None, time()
+        if Shell.since is not None:
+            since = Sitemap.lastmod(Shell.since)
+            if since is None:
+                raise SystemExit("Invalid date: {}".format(Shell.since))
+        elif not Shell.no_cache:
+            since = Sitemap.last_run(Shell.sitemap)
+        headers = data_in.get("config", {}).get("headers")
+        sitemap = Sitemap(Shell.sitemap, since, headers)
+        emit = None if Shell.silent else print_json_line
+        try:
+            _, failed = run_links(data_in, sitemap.links(Shell.match),
+                                  Shell.workers, Shell.no_cache, emit)
+        except FetchError as e:
+            raise SystemExit(str(e))
+        if Shell.since is not None or Shell.no_cache:
+            return
+        if failed > 0 or len(sitemap.failures) > 0:
+            Log.warn("Incomplete run over %s: %d link(s) and %d sitemap(s) "
+                     "failed, next run starts from the last complete one",
+                     Shell.sitemap, failed, len(sitemap.failures))
+        else:
+            Sitemap.save_run(Shell.sitemap, started)
+        return
+
     # Log shell params
     if Shell.verbose and not Shell.silent:
-        Log.info("Filepath: {}".format(Shell.input))
-        Log.info("Save to file? {}".format(Shell.save))
+        Log.info("Filepath: %s", Shell.input)
+        Log.info("Save to file? %s", Shell.save)
 
     # Update link?
     if Shell.link is not None:
@@ -93,21 +187,42 @@ def main():
     if data_in.get("link", "") == "":
         raise SystemExit("No link provided. See --help")
 
+    # Crawl every page reachable from the link
+    if "crawl" in data_in:
+        from hap.crawl import crawl
+        from hap.error import DataplanError
+        from hap.util import print_json_line
+        emit = None if Shell.silent else print_json_line
+        try:
+            crawl(data_in, Shell.workers, Shell.no_cache, emit)
+        except DataplanError as e:
+            raise SystemExit(str(e))
+        return
+
     # Parse document
+    from hap.error import HapError
+    from hap.parser import HTMLParser
     psr = HTMLParser(data_in, no_cache=Shell.no_cache,
                      refresh=(Shell.save and Shell.refresh))
-    psr.run()
+    try:
+        psr.run()
+    except HapError as e:
+        Log.error("%s", e)
+        raise SystemExit(str(e))
     records = psr.get_records()
     dataplan = psr.get_dataplan()
 
     # Update dataplan
     if Shell.save:
+        from hap.writer import FileWriter
         filename = Shell.input
         if filename is None:
-            filename = "{}.json".format(uuid.uuid4().hex)
+            from uuid import uuid4
+            filename = "{}.json".format(uuid4().hex)
         fw = FileWriter(filename)
         fw.write(dataplan)
 
     # Print output
     if not Shell.silent:
+        from hap.util import print_json
         print_json(records)
@@ -20,12 +20,22 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from typing import Tuple
-
-from os import path, makedirs
+from typing import Any, Tuple, Union
+
+from collections import OrderedDict
+from copy import deepcopy
+from hashlib import sha1
+from json import dumps, loads
+from contextlib import contextmanager
+from os import path, makedirs, fdopen, replace, remove, stat
+from tempfile import mkstemp
+from threading import Lock
 from urllib.parse import urlparse
 from re import sub
 from time import time
+from zlib import crc32
+
+from hap.flight import file_lock
 
 
 class Cache(object):
@@ -33,17 +43,83 @@ class Cache(object):
 
     Adds support to cache an URL's content and store it as much as the user
     wants. Cache files are named after the URI.
+
+    Long-running processes can also keep the most recently used entries in
+    memory, in front of the cache directory.
+
+    Cache files start with a header line holding the length and the CRC32
+    of the content. Writes go to a temporary file which atomically replaces
+    the cache file, so concurrent readers see either the previous or the
+    new entry; entries failing validation are treated as missing.
     """
 
+    HEADER = b"HAPCACHE"
+
+    failure_policies = {
+        # class        base seconds, max seconds
+        r"dns":        (5 * 60,      24 * 60 * 60),
+        r"connection": (60,          60 * 60),
+        r"timeout":    (60,          60 * 60),
+        r"429":        (60,          60 * 60),
+        r"4xx":        (60 * 60,     24 * 60 * 60),
+        r"5xx":        (30,          30 * 60),
+        r"size":       (60 * 60,     24 * 60 * 60),
+        r"error":      (60,          60 * 60),
+    }
+
     directory = ".cache"
     cache_ttl = 60 * 60  # 1 hour in seconds
+    memory, memory_size, memory_lock = OrderedDict(), 0, Lock()
 
     @classmethod
-    def get_file(cls, link: str) -> str:
+    def keep_in_memory(cls, size: int) -> None:
+        """Keep up to size entries in an in-memory LRU.
+
+        Args:
+            size (int): Maximum number of entries, 0 to disable.
+        """
+
+        with cls.memory_lock:
+            cls.memory_size = max(0, size)
+            while len(cls.memory) > cls.memory_size:
+                cls.memory.popitem(last=False)
+
+    @classmethod
+    def remember(cls, cache: str, data: Union[str, bytes],
+                 mtime: float = None, charset: str = None) -> None:
+        if cls.memory_size == 0:
+            return
+        with cls.memory_lock:
+            cls.memory[cache] = (mtime or time(), data, charset)
+            cls.memory.move_to_end(cache)
+            if len(cls.memory) > cls.memory_size:
+                cls.memory.popitem(last=False)
+
+    @classmethod
+    def recall(cls, cache: str) -> Union[Tuple[Any, str], None]:
+        if cls.memory_size == 0:
+            return None
+        with cls.memory_lock:
+            entry = cls.memory.get(cache)
+            if entry is None:
+                return None
+            if time() - entry[0] > cls.cache_ttl:
+                del cls.memory[cache]
+                return None
+            cls.memory.move_to_end(cache)
+            return entry[1:]
+
+    @classmethod
+    def get_file(cls, link: str, variant: str = None) -> str:
         """Make link ASCII friendly.
 
+        The query string is kept as a short digest, so links differing only
+        by their query get distinct files of a bounded length.
+
         Args:
-            link (unicode): URI to access.
+            link    (unicode): URI to access.
+            variant (unicode): Distinguishes requests of the same URI, e.g.
+                               by method and body.
 
         Returns:
             unicode: Filename for URI.
@@ -55,6 +131,11 @@ class Cache(object):
             cache_file += cls.file_friendly(url.netloc)
         if url.path:
             cache_file += cls.file_friendly(url.path)
+        if url.query:
+            query = sha1(url.query.encode("utf8")).hexdigest()[:16]
+            cache_file += "_q" + query
+        if variant:
+            cache_file += "_" + cls.file_friendly(variant)
         return cache_file.strip("_")
 
     @classmethod
@@ -68,28 +149,105 @@ class Cache(object):
             tuple: Boolean for success read and string for content or error.
         """
 
+        ok, entry = cls.load(cache)
+        return ok, entry[0] if ok else entry
+
+    @classmethod
+    def load(cls, cache: str) -> Tuple[bool, Union[Tuple[Any, str], str]]:
+        """Read content and charset from cache if exists.
+
+        Args:
+            cache (unicode): Filename of cache.
+
+        Returns:
+            tuple: Boolean for success read and a tuple of content and
+                   charset (None if unknown) or error.
+        """
+
+        entry = cls.recall(cache)
+        if entry is not None:
+            return True, entry
         filepath = cls.file_path(cache)
-        if cache and path.exists(filepath):
-            last_mtime = path.getmtime(filepath)
+        try:
+            last_mtime = path.getmtime(filepath) if cache else None
+        except OSError:
+            last_mtime = None
+        if last_mtime is not None:
             if time() - last_mtime > cls.cache_ttl:
                 return False, "cache has expired since {}".format(last_mtime)
             try:
-                with open(filepath, "r") as f:
-                    data = f.read()
-                    if len(data) == 0:
-                        return False, "empty file"
-                    return True, data
+                with open(filepath, "rb") as f:
+                    raw = f.read()
+                if len(raw) == 0:
+                    return False, "empty file"
+                ok, entry = cls.unpack(raw)
+                if ok:
+                    data, charset = entry
+                    cls.remember(cache, data, last_mtime, charset)
+                return ok, entry
             except Exception as e:
                 return False, str(e)
         return False, "no cache to read"
 
     @classmethod
-    def write(cls, cache_path: str, cache: str) -> Tuple[bool, str]:
+    def pack(cls, data: Union[str, bytes],
+             charset: str = None) -> Tuple[bytes, bytes]:
+        """Prepare the header and the payload of a cache file.
+
+        Args:
+            data    (mixt): Content to be cached, as text or any bytes-like
+                            object such as a memory-mapped file.
+            charset  (str): Encoding of bytes content, if known.
+
+        Returns:
+            tuple: Header line and content as bytes-like object.
+        """
+
+        kind = b"bytes"
+        if isinstance(data, str):
+            kind, data = b"text", data.encode("utf8")
+        header = b"%s length=%d crc32=%08x type=%s" % (
+            cls.HEADER, len(data), crc32(data), kind)
+        if charset and kind == b"bytes":
+            header += b" charset=" + charset.encode("ascii")
+        return header + b"\n", data
+
+    @classmethod
+    def unpack(cls, raw: bytes) -> Tuple[bool, Union[Tuple[Any, str], str]]:
+        """Validate a cache file and extract its content.
+
+        Args:
+            raw (bytes): Content of the cache file.
+
+        Returns:
+            tuple: Boolean for valid content and a tuple of content and
+                   charset or error.
+        """
+
+        header, newline, data = raw.partition(b"\n")
+        fields = header.split()
+        if not newline or len(fields) == 0 or fields[0] != cls.HEADER:
+            return False, "missing cache header"
+        try:
+            meta = dict(f.decode("ascii").split("=", 1) for f in fields[1:])
+            length, checksum = int(meta["length"]), int(meta["crc32"], 16)
+        except Exception:
+            return False, "corrupted cache header"
+        if len(data) != length or crc32(data) != checksum:
+            return False, "checksum mismatch"
+        if meta.get("type") == "text":
+            return True, (data.decode("utf8"), None)
+        return True, (data, meta.get("charset"))
+
+    @classmethod
+    def write(cls, cache_path: str, cache: str,
+              charset: str = None) -> Tuple[bool, str]:
         """Write content to cache file.
 
         Args:
             cache_path (unicode): Filename to save at.
             cache      (unicode): Content to be cached.
+            charset        (str): Encoding of bytes content, if known.
 
         Returns:
             tuple: Boolean for success read and string for size or error.
@@ -100,43 +258,189 @@ class Cache(object):
         if len(cache) == 0:
             return False, "missing cache data"
         try:
-            if not path.isdir(cls.directory):
-                makedirs(cls.directory)
-            with open(cls.file_path(cache_path), "w") as f:
-                f.write(cache)
-                return True, "ok"
+            cls.commit(cls.file_path(cache_path), *cls.pack(cache, charset))
+            cls.remember(cache_path, cache, charset=charset)
+            return True, "ok"
+        except Exception as e:
+            return False, str(e)
+
+    @classmethod
+    def commit(cls, filepath: str, *chunks: bytes) -> None:
+        """Atomically replace a file of the cache directory.
+
+        Args:
+            filepath (unicode): File to replace.
+            chunks     (bytes): Content to write.
+        """
+
+        makedirs(cls.directory, exist_ok=True)
+        fd, temp = mkstemp(prefix=".", suffix=".tmp", dir=cls.directory)
+        try:
+            with fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            replace(temp, filepath)
+        except BaseException:
+            remove(temp)
+            raise
+
+    @classmethod
+    def failure_ttl(cls, failure: str, failures: int,
+                    policies: dict = None) -> float:
+        """Seconds a failure is remembered, doubling with every consecutive
+        failure up to the maximum of its policy.
+
+        Args:
+            failure  (unicode): Failure class.
+            failures     (int): Consecutive failures, including this one.
+            policies    (dict): Policies overwriting failure_policies.
+
+        Returns:
+            float: Backoff in seconds.
+        """
+
+        policies = policies or cls.failure_policies
+        base, limit = policies.get(failure) \
+            or cls.failure_policies.get(failure) \
+            or cls.failure_policies["error"]
+        return min(limit, base * 2 ** (max(1, failures) - 1))
+
+    @classmethod
+    def read_failure(cls, link: str,
+                     variant: str = None) -> Tuple[bool, Union[dict, str]]:
+        """Read the remembered failure of a link.
+
+        Args:
+            link    (unicode): Link to lookup.
+            variant (unicode): Request variant of the link.
+
+        Returns:
+            tuple: True and the failure entry if it has not expired yet,
+                   otherwise False and the entry or an error.
+        """
+
+        try:
+            with open(cls.failure_path(link, variant), "r") as f:
+                entry = loads(f.read())
         except Exception as e:
             return False, str(e)
-        return False, "no cache to write"
+        if not isinstance(entry, dict) \
+                or not isinstance(entry.get("until", 0), (int, float)):
+            return False, "Invalid failure entry"
+        return time() < entry.get("until", 0), entry
+
+    @classmethod
+    def write_failure(cls, link: str, failure: str, message: str,
+                      policies: dict = None,
+                      variant: str = None) -> Tuple[bool, str]:
+        """Remember a failed fetch of a link.
+
+        Consecutive failures are counted, even after an entry expired, until
+        the link is fetched successfully again.
+
+        Args:
+            link     (unicode): Link which failed.
+            failure  (unicode): Failure class.
+            message  (unicode): Error message.
+            policies    (dict): Policies overwriting failure_policies.
+            variant  (unicode): Request variant of the link.
+
+        Returns:
+            tuple: Boolean for success write and string for status or error.
+        """
+
+        _, previous = cls.read_failure(link, variant)
+        failures = 1
+        if isinstance(previous, dict) \
+                and isinstance(previous.get("failures"), int):
+            failures += previous["failures"]
+        ttl = cls.failure_ttl(failure, failures, policies)
+        entry = {"class": failure, "message": message,
+                 "failures": failures, "until": time() + ttl}
+        try:
+            cls.commit(cls.failure_path(link, variant),
+                       dumps(entry).encode("utf8"))
+            return True, "ok"
+        except Exception as e:
+            return False, str(e)
+
+    @classmethod
+    def clear_failure(cls, link: str, variant: str = None) -> None:
+        try:
+            remove(cls.failure_path(link, variant))
+        except OSError:
+            pass
+
+    @classmethod
+    def failure_path(cls, link: str, variant: str = None) -> str:
+        return cls.file_path(cls.get_file(link, variant)) + ".fail"
 
     @classmethod
-    def read_link(cls, link: str) -> Tuple[bool, str]:
+    def read_link(cls, link: str, variant: str = None) -> Tuple[bool, str]:
         """Read cache by link if exists.
 
         Args:
-            link (unicode): Link to lookup for cache.
+            link    (unicode): Link to lookup for cache.
+            variant (unicode): Request variant of the link.
 
         Returns:
             tuple: Boolean for success read and string for content or error.
         """
 
-        cache_file = cls.get_file(link)
+        cache_file = cls.get_file(link, variant)
         return cls.read(cache_file)
 
     @classmethod
-    def write_link(cls, link: str, data: str) -> Tuple[bool, str]:
+    def load_link(cls, link: str, variant: str = None) \
+            -> Tuple[bool, Union[Tuple[Any, str], str]]:
+        """Read cache and its charset by link if exists.
+
+        Args:
+            link    (unicode): Link to lookup for cache.
+            variant (unicode): Request variant of the link.
+
+        Returns:
+            tuple: Boolean for success read and a tuple of content and
+                   charset or error.
+        """
+
+        return cls.load(cls.get_file(link, variant))
+
+    @classmethod
+    def write_link(cls, link: str, data: str, variant: str = None,
+                   charset: str = None) -> Tuple[bool, str]:
         """Write cache by link.
 
         Args:
-            link (unicode): Link to create filename of cache.
-            data (unicode): Content to be cached.
+            link    (unicode): Link to create filename of cache.
+            data    (unicode): Content to be cached.
+            variant (unicode): Request variant of the link.
+            charset     (str): Encoding of bytes content, if known.
 
         Returns:
             tuple: Boolean for success read and string for size or error.
         """
 
-        cache_filename = cls.get_file(link)
-        return cls.write(cache_filename, data)
+        cache_filename = cls.get_file(link, variant)
+        return cls.write(cache_filename, data, charset)
+
+    @classmethod
+    @contextmanager
+    def lock_link(cls, link: str, variant: str = None):
+        """Hold the cross-process lock of a link's cache entry.
+
+        Args:
+            link    (unicode): Link whose cache entry is locked.
+            variant (unicode): Request variant of the link.
+        """
+
+        try:
+            makedirs(cls.directory, exist_ok=True)
+        except OSError:
+            yield
+            return
+        with file_lock(cls.file_path(cls.get_file(link, variant)) + ".lock"):
+            yield
 
     @classmethod
     def file_friendly(cls, string: str) -> str:
@@ -163,3 +467,49 @@ class Cache(object):
         """
 
         return path.join(cls.directory, filename)
+
+
+class ResultMemo(object):
+    """In-process memo of the results extracted from local files.
+
+    Results are keyed by the path, inode, modification time and size of a
+    file together with a hash of the definitions, so an unchanged file is
+    not parsed again by the same definitions.
+    """
+
+    size = 256
+    entries, lock = OrderedDict(), Lock()
+
+    @classmethod
+    def key(cls, filepath: str, plan: Any) -> Union[tuple, None]:
+        """Memo key of a file and a plan, None if the file cannot be stat.
+        """
+
+        try:
+            st = stat(filepath)
+        except OSError:
+            return None
+        digest = sha1(dumps(plan, sort_keys=True, default=str).encode("utf8"))
+        return (path.realpath(filepath), st.st_ino, st.st_mtime_ns,
+                st.st_size, digest.hexdigest())
+
+    @classmethod
+    def get(cls, key: tuple) -> Union[Tuple[dict, list], None]:
+        with cls.lock:
+            entry = cls.entries.get(key)
+            if entry is not None:
+                cls.entries.move_to_end(key)
+        if entry is None:
+            return None
+        data, errors = entry
+        return deepcopy(data), list(errors)
+
+    @classmethod
+    def put(cls, key: tuple, data: dict, errors: list) -> None:
+        if cls.size == 0:
+            return
+        with cls.lock:
+            cls.entries[key] = (deepcopy(data), list(errors))
+            cls.entries.move_to_end(key)
+            while len(cls.entries) > cls.size:
+                cls.entries.popitem(last=False)
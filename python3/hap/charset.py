@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Any, Union
+
+from codecs import BOM_UTF8, BOM_UTF16_BE, BOM_UTF16_LE, lookup, \
+    getincrementaldecoder
+from re import compile, IGNORECASE
+
+from lxml import html
+
+
+class Charset(object):
+    """Character encoding detection of HTML documents.
+
+    The encoding is taken, in order, from a byte order mark, the charset of
+    the Content-Type header or a <meta> declaration found in the first
+    sniff_size bytes of the document. Without any of these, a prefix which
+    is valid UTF-8 is assumed to be UTF-8, otherwise the fallback applies.
+    The detected encoding is given to lxml, which decodes the document
+    natively.
+    """
+
+    sniff_size, fallback = 4096, "windows-1252"
+
+    BOMS = (
+        # mark,       encoding
+        (BOM_UTF8,     "utf-8"),
+        (BOM_UTF16_LE, "utf-16"),
+        (BOM_UTF16_BE, "utf-16"),
+    )
+
+    # Labels browsers treat as windows-1252, a superset of them
+    aliases = {
+        "ascii": "windows-1252",
+        "us-ascii": "windows-1252",
+        "iso-8859-1": "windows-1252",
+        "iso8859-1": "windows-1252",
+        "latin1": "windows-1252",
+        "latin-1": "windows-1252",
+    }
+
+    meta = compile(br"""<meta[^>]*?charset\s*=\s*["']?\s*([-\w.:]+)""",
+                   IGNORECASE)
+    known = dict()
+
+    @classmethod
+    def name(cls, label: str) -> Union[str, None]:
+        """Name of an encoding as understood by lxml.
+
+        Args:
+            label (str): Encoding label, e.g. from a charset declaration.
+
+        Returns:
+            str: Encoding name, or None if the label is unknown.
+        """
+
+        label = label.strip().lower()
+        label = cls.aliases.get(label, label)
+        if label in cls.known:
+            return cls.known[label]
+        candidates = [label]
+        try:
+            codec = lookup(label).name
+            candidates += [codec, codec.replace("_", "-")]
+        except LookupError:
+            pass
+        found = None
+        for candidate in candidates:
+            try:
+                html.HTMLParser(encoding=candidate)
+                found = candidate
+                break
+            except LookupError:
+                continue
+        cls.known[label] = found
+        return found
+
+    @classmethod
+    def detect(cls, data: Any, declared: str = None) -> str:
+        """Encoding of a document.
+
+        Args:
+            data     (mixt): Document as bytes or any bytes-like object.
+            declared  (str): Charset of the Content-Type header, if any.
+
+        Returns:
+            str: Encoding name.
+        """
+
+        head = bytes(data[:cls.sniff_size])
+        for mark, encoding in cls.BOMS:
+            if head.startswith(mark):
+                return encoding
+        found = cls.meta.search(head)
+        for label in (declared, found and found.group(1).decode("ascii")):
+            encoding = cls.name(label) if label else None
+            if encoding is not None:
+                return encoding
+        try:
+            getincrementaldecoder("utf-8")().decode(head, final=False)
+            return "utf-8"
+        except UnicodeDecodeError:
+            return cls.fallback
+
+    @classmethod
+    def parser(cls, encoding: str = None,
+               huge_tree: bool = False) -> html.HTMLParser:
+        """New lxml HTML parser decoding documents with an encoding.
+        """
+
+        return html.HTMLParser(encoding=encoding, huge_tree=huge_tree)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Any, Tuple
+
+from hashlib import sha1
+from json import dumps
+from os import path
+from threading import Lock
+from urllib.parse import urlencode
+
+
+class Payload(object):
+    """Method and body of an outgoing request.
+
+    A body is either built from a "form" map (URL encoded), a "json" value,
+    a raw "payload" string (or map, URL encoded), or streamed from a "file".
+    Requests with a body default to POST.
+    """
+
+    FORM, JSON = "application/x-www-form-urlencoded", "application/json"
+    chunk_size = 64 * 1024
+
+    def __init__(self, method: str = None, data: bytes = None,
+                 filepath: str = None, content_type: str = None):
+        has_body = data is not None or filepath is not None
+        self.method = (method or ("POST" if has_body else "GET")).upper()
+        self.data, self.filepath = data, filepath
+        self.content_type = content_type
+        plain = self.method == "GET" and not has_body
+        self.digest = None if plain else self.hash()
+
+    @classmethod
+    def from_config(cls, settings: dict) -> "Payload":
+        """Payload from a dataplan "request" map.
+
+        Raises:
+            ValueError: If the body cannot be encoded or the file is missing.
+        """
+
+        method, ctype = settings.get("method"), settings.get("content_type")
+        if "form" in settings:
+            return cls(method, urlencode(settings["form"]).encode("utf8"),
+                       content_type=ctype or cls.FORM)
+        if "json" in settings:
+            data = dumps(settings["json"], sort_keys=True).encode("utf8")
+            return cls(method, data, content_type=ctype or cls.JSON)
+        if "file" in settings:
+            filepath = str(settings["file"])
+            if not path.isfile(filepath):
+                raise ValueError("Payload file does not exist: {}"
+                                 .format(filepath))
+            return cls(method, filepath=filepath, content_type=ctype)
+        payload = settings.get("payload")
+        if isinstance(payload, dict):
+            return cls(method, urlencode(payload).encode("utf8"),
+                       content_type=ctype or cls.FORM)
+        if isinstance(payload, str):
+            return cls(method, payload.encode("utf8"), content_type=ctype)
+        return cls(method)
+
+    def hash(self) -> str:
+        digest = sha1(self.method.encode("ascii"))
+        if self.data is not None:
+            digest.update(self.data)
+        elif self.filepath is not None:
+            with open(self.filepath, "rb") as fd:
+                for chunk in iter(lambda: fd.read(self.chunk_size), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()[:16]
+
+    @property
+    def variant(self) -> str:
+        """Cache variant of the request, None for a plain GET.
+        """
+
+        if self.digest is None:
+            return None
+        return "{}_{}".format(self.method, self.digest)
+
+    def body(self) -> Tuple[Any, dict]:
+        """Fresh request body and its headers.
+
+        A file body is opened for streaming and must be closed by the caller
+        once the request is sent.
+        """
+
+        headers = dict()
+        if self.content_type:
+            headers["Content-Type"] = self.content_type
+        if self.filepath is not None:
+            headers["Content-Length"] = str(path.getsize(self.filepath))
+            return open(self.filepath, "rb"), headers
+        return self.data, headers
+
+
+class Client(object):
+    """Outgoing HTTP requests wrapper.
+
+    Openers are built once per configuration, i.e. per read timeout and
+    proxy, and reused by every request. The HTTP stack of urllib is only
+    imported once the first opener is built, so file:// and inline runs
+    never load it.
+    The default timeouts apply when a dataplan does not configure its own
+    and can be changed from the command line.
+    """
+
+    connect_timeout = 10.0
+    read_timeout = 30.0
+    openers, lock = dict(), Lock()
+
+    @classmethod
+    def timeouts(cls, value: Any = None) -> Tuple[float, float]:
+        """Connect and read timeouts from a dataplan "timeout" value.
+
+        Args:
+            value (mixt): Seconds for both, or a map with "connect" and
+                          "read" seconds; missing values use the defaults.
+
+        Returns:
+            tuple: Connect and read timeouts in seconds.
+        """
+
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value), float(value)
+        connect, read = cls.connect_timeout, cls.read_timeout
+        if isinstance(value, dict):
+            connect = float(value.get("connect", connect))
+            read = float(value.get("read", read))
+        return connect, read
+
+    @classmethod
+    def opener(cls, read_timeout: float = None, proxy: str = None):
+        """Cached opener for a read timeout and proxy.
+
+        Without a proxy, urllib falls back to the proxies of the environment.
+        """
+
+        from urllib.request import ProxyHandler, build_opener
+        from hap.transport import TimeoutHTTPHandler, TimeoutHTTPSHandler
+        key = (read_timeout, proxy)
+        with cls.lock:
+            opener = cls.openers.get(key)
+            if opener is None:
+                handlers = [TimeoutHTTPHandler(read_timeout),
+                            TimeoutHTTPSHandler(read_timeout)]
+                if proxy is not None:
+                    handlers.append(ProxyHandler({"http": proxy,
+                                                  "https": proxy}))
+                opener = cls.openers[key] = build_opener(*handlers)
+        return opener
+
+    @classmethod
+    def open(cls, request: Any, timeouts: Tuple[float, float] = None,
+             proxy: str = None):
+        """Send a request, optionally through a proxy, and return the
+        response stream.
+
+        Raises:
+            Exception: Errors of urllib, e.g. HTTPError or URLError.
+        """
+
+        connect, read = timeouts or cls.timeouts()
+        return cls.opener(read, proxy).open(request, timeout=connect)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Callable, Iterator, Tuple
+
+from mimetypes import guess_type
+from os import path, walk
+from re import compile
+from tarfile import open as open_tar, TarError
+from zipfile import ZipFile, BadZipFile
+
+
+class CorpusReader(object):
+    """Lazy reader of a corpus of saved documents.
+
+    A corpus is a directory tree, a tar archive (optionally compressed) or a
+    zip archive. Members are read one at a time straight from the archive,
+    nothing is extracted to disk. Tar archives are read as a stream, so a
+    compressed bundle is decompressed exactly once from start to end.
+    """
+
+    def __init__(self, location: str):
+        self.location = location
+
+    @property
+    def kind(self) -> str:
+        if path.isdir(self.location):
+            return "directory"
+        if not path.isfile(self.location):
+            raise ValueError("No such corpus: {}".format(self.location))
+        with open(self.location, "rb") as fd:
+            magic = fd.read(4)
+        if magic.startswith(b"PK"):
+            return "zip"
+        return "tar"
+
+    def members(self, accept: Callable[[str], bool] = None) \
+            -> Iterator[Tuple[str, bytes]]:
+        """Iterate over (member path, content) of the corpus.
+
+        Args:
+            accept (callable): Filter of member paths, checked before a
+                               member is read.
+
+        Raises:
+            ValueError: If the corpus cannot be read.
+        """
+
+        kind, accept = self.kind, accept or (lambda name: True)
+        try:
+            if kind == "directory":
+                yield from self.read_directory(accept)
+            elif kind == "zip":
+                yield from self.read_zip(accept)
+            else:
+                yield from self.read_tar(accept)
+        except (TarError, BadZipFile, EOFError) as e:
+            raise ValueError("Cannot read {} corpus: {}".format(kind, e))
+
+    def read_directory(self, accept: Callable) \
+            -> Iterator[Tuple[str, bytes]]:
+        for root, dirs, files in walk(self.location):
+            dirs.sort()
+            for name in sorted(files):
+                filepath = path.join(root, name)
+                member = path.relpath(filepath, self.location)
+                if not accept(member):
+                    continue
+                with open(filepath, "rb") as fd:
+                    data = fd.read()
+                yield member, data
+
+    def read_zip(self, accept: Callable) -> Iterator[Tuple[str, bytes]]:
+        with ZipFile(self.location) as archive:
+            for info in archive.infolist():
+                if info.filename.endswith("/") or not accept(info.filename):
+                    continue
+                yield info.filename, archive.read(info)
+
+    def read_tar(self, accept: Callable) -> Iterator[Tuple[str, bytes]]:
+        with open_tar(self.location, "r|*") as archive:
+            for info in archive:
+                if not info.isfile() or not accept(info.name):
+                    continue
+                yield info.name, archive.extractfile(info).read()
+
+    def documents(self, match: str = None,
+                  mimetypes: Tuple[str, ...] = None) \
+            -> Iterator[Tuple[str, bytes, None]]:
+        """Iterate over (member path, content, charset) of the documents,
+        as expected by the batch runner.
+
+        Args:
+            match      (str): Regular expression the member path must contain.
+            mimetypes (tuple): Accepted MIME types guessed from the member
+                               name, all if empty.
+        """
+
+        pattern = compile(match) if match else None
+
+        def accept(name: str) -> bool:
+            if pattern is not None and not pattern.search(name):
+                return False
+            return not mimetypes or guess_type(name)[0] in mimetypes
+
+        for name, data in self.members(accept):
+            yield name, data, None
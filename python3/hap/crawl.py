@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Any, Callable, Iterator, List, Tuple, Union
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from hashlib import md5, sha1
+from json import dumps
+from math import ceil, log
+from re import compile
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from lxml import etree
+from lxml.cssselect import CSSSelector
+
+from hap.log import Log
+from hap.field import Field
+from hap.error import DataplanError
+from hap.parser import HTMLParser
+
+
+class BloomFilter(object):
+    """Probabilistic set of strings with a fixed memory footprint.
+
+    Sized for an expected number of items and a false positive rate; a
+    false positive makes the crawler skip a page it has never seen, it
+    never visits a page twice.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, int(capacity))
+        self.size = int(ceil(-capacity * log(error_rate) / log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item: str) -> Iterator[int]:
+        digest = md5(item.encode("utf8")).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7))
+                   for p in self.positions(item))
+
+    def add(self, item: str) -> None:
+        for p in self.positions(item):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+
+class Frontier(object):
+    """Queue of links to crawl, each admitted at most once.
+
+    Links are compared in their normalized form, kept in a set or, for
+    very large crawls, in a Bloom filter. No more than max_pages links are
+    ever admitted.
+    """
+
+    DEFAULT_PORTS = {"http": "80", "https": "443"}
+    SCHEMES = ("http", "https", "file")
+
+    def __init__(self, max_pages: int = None, bloom: int = None):
+        self.max_pages = max_pages
+        self.seen = BloomFilter(bloom) if bloom else set()
+        self.queue, self.admitted = deque(), 0
+
+    @classmethod
+    def normalize(cls, url: str) -> Union[str, None]:
+        """Canonical form of a link, or None if it cannot be crawled.
+
+        The scheme and host are lowercased, default ports, fragments and
+        empty paths are dropped and query parameters are sorted.
+        """
+
+        try:
+            parts = urlsplit(url.strip())
+            port = parts.port
+        except ValueError:
+            return None
+        scheme = parts.scheme.lower()
+        if scheme not in cls.SCHEMES:
+            return None
+        netloc = (parts.hostname or "").lower()
+        if parts.username is not None:
+            netloc = "{}@{}".format(parts.netloc.rpartition("@")[0], netloc)
+        if port is not None and str(port) != cls.DEFAULT_PORTS.get(scheme):
+            netloc = "{}:{}".format(netloc, port)
+        query = urlencode(sorted(parse_qsl(parts.query, True)))
+        return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+    def add(self, url: str, depth: int) -> bool:
+        """Queue a normalized link unless it was seen or the limit is hit.
+        """
+
+        if self.max_pages is not None and self.admitted >= self.max_pages:
+            return False
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        self.queue.append((url, depth))
+        self.admitted += 1
+        return True
+
+    def pop(self) -> Tuple[str, int]:
+        return self.queue.popleft()
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+
+class Rule(object):
+    """Link extraction rule: a CSS selector or XPath expression whose
+    matches hold links in an attribute, optionally filtered by a regex.
+    """
+
+    def __init__(self, settings: Union[str, dict]):
+        if isinstance(settings, str):
+            settings = {"query": settings}
+        if not isinstance(settings, dict):
+            raise DataplanError("Crawl rules must be selectors or maps")
+        self.css = settings.get("query", settings.get("query_css"))
+        self.xpath = settings.get("query_xpath")
+        if self.css is None and self.xpath is None:
+            raise DataplanError("Crawl rule without a query: {}".format(
+                settings))
+        self.attr = settings.get("attr", "href")
+        match = settings.get("match")
+        try:
+            if self.css is not None:
+                CSSSelector(self.css, translator="html")
+            else:
+                etree.XPath(self.xpath)
+            self.match = compile(match) if match else None
+        except Exception as e:
+            raise DataplanError("Invalid crawl rule {}: {}".format(
+                settings, e))
+
+    @classmethod
+    def parse(cls, settings: Any) -> List["Rule"]:
+        if settings is None:
+            return list()
+        if isinstance(settings, list):
+            return [cls(s) for s in settings]
+        return [cls(settings)]
+
+    def links(self, tree: Any, base: str) -> Iterator[str]:
+        """Absolute links found by the rule in a parsed document.
+        """
+
+        if self.css is not None:
+            found = tree.cssselect(self.css)
+        else:
+            found = tree.xpath(self.xpath)
+            found = found if isinstance(found, list) else [found]
+        for item in found:
+            value = item.get(self.attr) if hasattr(item, "get") else item
+            if not isinstance(value, str) or value.strip() == "":
+                continue
+            link = urljoin(base, value.strip())
+            if self.match is None or self.match.search(link):
+                yield link
+
+
+class Pagination(object):
+    """Numeric pagination of listing links, such as "?page=N" or
+    "/page/N". A template is the link without its page number.
+    """
+
+    patterns = (
+        compile(r"([?&](?:page|p|pg)=)(\d+)(?=&|$)"),
+        compile(r"(/page/)(\d+)(?=/|\?|$)"),
+    )
+
+    @classmethod
+    def parse(cls, url: str) -> Union[Tuple[Tuple[str, str], int], None]:
+        """Template and page number of a link, or None.
+        """
+
+        for pattern in cls.patterns:
+            found = list(pattern.finditer(url))
+            if len(found) > 0:
+                number = found[-1]
+                template = url[:number.start(2)], url[number.end(2):]
+                return template, int(number.group(2))
+        return None
+
+    @classmethod
+    def link(cls, template: Tuple[str, str], number: int) -> str:
+        return "{}{}{}".format(template[0], number, template[1])
+
+
+class Crawler(object):
+    """Runs a dataplan over every page reachable from its link.
+
+    The "crawl" section of the dataplan has "next" rules for pagination,
+    whose pages are crawled at the same depth, and "follow" rules for
+    pages one level deeper (e.g. details), up to "max_depth" levels and
+    "max_pages" pages in total. Unless "same_host" is false, only links to
+    the host of the starting link are crawled. A "bloom" capacity stores
+    seen links in a Bloom filter instead of a set.
+
+    With "prefetch" set, pagination links with a page number are fetched
+    ahead: the next prefetch pages are queued along with each one, instead
+    of waiting for it to be parsed. A prefetched page that fails, is empty
+    or repeats another page of the listing is not reported and ends the
+    prefetching of that listing.
+
+    Pages are fetched and parsed by a pool of threads through the regular
+    parser, so the cache, rate limits and concurrency windows apply.
+    """
+
+    max_depth, max_pages, prefetch = 1, 1000, 0
+
+    def __init__(self, dataplan: dict, workers: int = 4,
+                 no_cache: bool = False):
+        settings = dataplan.get(Field.CRAWL)
+        if not isinstance(settings, dict):
+            raise DataplanError("Wrong type: section '{}' must be {}".format(
+                Field.CRAWL, dict))
+        link = dataplan.get(Field.LINK)
+        if not isinstance(link, str) or Frontier.normalize(link) is None:
+            raise DataplanError("Crawling requires a http(s) or file link")
+        self.dataplan, self.link = dataplan, Frontier.normalize(link)
+        self.workers, self.no_cache = max(1, workers), no_cache
+        self.next = Rule.parse(settings.get("next"))
+        self.follow = Rule.parse(settings.get("follow"))
+        self.max_depth = self.count(settings, "max_depth", self.max_depth)
+        self.max_pages = self.count(settings, "max_pages", self.max_pages,
+                                    optional=True)
+        self.same_host = bool(settings.get("same_host", True))
+        self.host = urlsplit(self.link).netloc
+        self.frontier = Frontier(self.max_pages, self.count(
+            settings, "bloom", None, optional=True))
+        self.prefetch = self.count(settings, "prefetch", self.prefetch)
+        self.listings, self.speculative = set(), set()
+        self.digests, self.bounds = dict(), dict()
+
+    @classmethod
+    def count(cls, settings: dict, key: str, default: Any,
+              optional: bool = False) -> Union[int, None]:
+        """Non-negative integer setting of the "crawl" section; optional
+        settings may also be null.
+
+        Raises:
+            DataplanError: If the value is not valid.
+        """
+
+        value = settings.get(key, default)
+        if optional and value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, int) \
+                or value < 0:
+            raise DataplanError("Crawl setting '{}' must be a non-negative "
+                                "integer, got {!r}".format(key, value))
+        return value
+
+    def visit(self, link: str, depth: int) -> Tuple[dict, list, list]:
+        """Run the dataplan on one page. Every error is recorded in the
+        result of the page, so one bad page never stops the crawl.
+
+        Returns:
+            tuple: Result of the page, its (link, depth) pagination links
+                   and its (link, depth) links to follow.
+        """
+
+        psr = HTMLParser(dict(self.dataplan, **{Field.LINK: link}),
+                         no_cache=self.no_cache)
+        try:
+            psr.run()
+        except Exception as e:
+            Log.error("%s", e)
+            psr.errors.insert(0, e)
+        pages, links = list(), list()
+        try:
+            tree = self.tree(psr)
+            if tree is not None:
+                pages.extend((url, depth) for rule in self.next
+                             for url in rule.links(tree, link))
+                links.extend((url, depth + 1) for rule in self.follow
+                             for url in rule.links(tree, link))
+        except Exception as e:
+            Log.error("Cannot find links of %s: %s", link, e)
+            psr.errors.append(e)
+        result = {
+            "link": link,
+            "depth": depth,
+            "records": psr.get_records(),
+            "errors": [str(e) for e in psr.errors],
+        }
+        return result, pages, links
+
+    def tree(self, psr: HTMLParser) -> Any:
+        """Parsed document of a page, also for unchanged local files whose
+        results were reused without parsing them.
+        """
+
+        if getattr(psr, "source_code", None) is None and \
+                psr.memo is not None:
+            psr.prepare_source_file(psr.link[len(psr.FILE_PROTOCOL):])
+        return getattr(psr, "source_code", None)
+
+    def admit(self, link: str, depth: int) -> bool:
+        url = Frontier.normalize(link)
+        if url is None or depth > self.max_depth:
+            return False
+        if self.same_host and urlsplit(url).netloc != self.host:
+            return False
+        return self.frontier.add(url, depth)
+
+    def paginate(self, link: str, depth: int) -> None:
+        """Queue a pagination link and prefetch the pages after it, unless
+        they are already queued or past the end of the listing.
+        """
+
+        url = Frontier.normalize(link)
+        if url is None:
+            return
+        if self.admit(url, depth):
+            self.listings.add(url)
+        parsed = Pagination.parse(url) if self.prefetch > 0 else None
+        if parsed is None:
+            return
+        template, number = parsed
+        bound = self.bounds.get(template)
+        for ahead in range(number + 1, number + 1 + self.prefetch):
+            if bound is not None and ahead >= bound:
+                break
+            url = Pagination.link(template, ahead)
+            if self.admit(url, depth):
+                self.listings.add(url)
+                self.speculative.add(url)
+
+    def accept(self, result: dict, pages: list, links: list) -> bool:
+        """Check a crawled pagination page and end the prefetching of its
+        listing at a failed, empty or repeated page. Pages complete in any
+        order, so a page repeats the lowest numbered page of its content.
+
+        Returns:
+            bool: False if the page is a prefetched page past the end of
+                  its listing.
+        """
+
+        url = result["link"]
+        parsed = Pagination.parse(url) if url in self.listings else None
+        if parsed is None or len(result["errors"]) > 0:
+            return self.keep(url, parsed, result["errors"])
+        records = {k: v for k, v in result["records"].items()
+                   if k != "_datetime"}
+        found = sorted(link for link, _ in pages + links)
+        if len(found) == 0 and all(v is None for v in records.values()):
+            return self.keep(url, parsed, "empty")
+        digest = sha1(dumps([records, found], sort_keys=True,
+                            default=str).encode("utf8")).hexdigest()
+        template, number = parsed
+        seen = self.digests.setdefault(template, dict())
+        if seen.setdefault(digest, number) < number:
+            return self.keep(url, parsed, "repeated")
+        seen[digest] = number
+        return True
+
+    def keep(self, url: str, parsed: Any, reason: Any) -> bool:
+        """Whether to report a page; a prefetched page is only reported if
+        there is no reason to stop prefetching its listing.
+        """
+
+        if parsed is None or not reason or url not in self.speculative:
+            return True
+        template, number = parsed
+        self.bounds[template] = min(self.bounds.get(template, number), number)
+        Log.debug("Stopped prefetching at %s: %s", url, reason)
+        return False
+
+    def run(self) -> Iterator[dict]:
+        """Crawl from the link of the dataplan and yield one result per
+        page, in the order pages complete.
+        """
+
+        self.paginate(self.link, 0)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = set()
+            while len(self.frontier) > 0 or len(pending) > 0:
+                while len(self.frontier) > 0 and \
+                        len(pending) < self.workers:
+                    pending.add(pool.submit(self.visit, *self.frontier.pop()))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result, pages, links = future.result()
+                    if not self.accept(result, pages, links):
+                        continue
+                    for link, depth in pages:
+                        self.paginate(link, depth)
+                    for link, depth in links:
+                        self.admit(link, depth)
+                    yield result
+        Log.info("Crawled %d page(s)", self.frontier.admitted)
+
+
+def crawl(dataplan: dict, workers: int = 4, no_cache: bool = False,
+          emit: Callable = None) -> Tuple[int, int]:
+    """Crawl a dataplan and emit one result per page.
+
+    Returns:
+        tuple: Number of pages and number of failed pages.
+    """
+
+    total, failed = 0, 0
+    for result in Crawler(dataplan, workers, no_cache).run():
+        total += 1
+        failed += 1 if len(result["errors"]) > 0 else 0
+        if emit is not None:
+            emit(result)
+    return total, failed
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import socket
+
+
+class HapError(Exception):
+    """Base class of all errors raised by Hap!
+    """
+
+
+class DataplanError(HapError):
+    """The dataplan is malformed or uses unsupported features.
+    """
+
+
+class FetchError(HapError):
+    """The document behind a link cannot be retrieved.
+
+    The failure attribute holds the class of the failure as returned by
+    classify_failure, if known.
+    """
+
+    def __init__(self, message: str, link: str = None, failure: str = None):
+        super(FetchError, self).__init__(message)
+        self.link = link
+        self.failure = failure
+
+
+class UnsupportedContentError(FetchError):
+    """The link responded with a MIME type Hap! cannot parse.
+    """
+
+    def __init__(self, message: str, link: str = None,
+                 mimetype: str = None):
+        super(UnsupportedContentError, self).__init__(message, link)
+        self.mimetype = mimetype
+
+
+class BodyTooLargeError(FetchError):
+    """The body of a response exceeds the maximum size allowed.
+    """
+
+    def __init__(self, message: str, link: str = None, size: int = None):
+        super(BodyTooLargeError, self).__init__(message, link, "size")
+        self.size = size
+
+
+class ExtractionError(HapError):
+    """A single definition or declaration failed; other fields may still
+    have been collected.
+    """
+
+    def __init__(self, message: str, key: str = None):
+        super(ExtractionError, self).__init__(message)
+        self.key = key
+
+
+def classify_failure(error: Exception) -> str:
+    """Class of a failed fetch: "dns", "timeout", "connection", "429",
+    "4xx", "5xx", "size" or "error".
+
+    Args:
+        error (Exception): Error raised while fetching, e.g. by urlopen.
+
+    Returns:
+        str: Failure class.
+    """
+
+    if isinstance(error, FetchError) and error.failure is not None:
+        return error.failure
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        if code == 429:
+            return "429"
+        if 400 <= code < 500:
+            return "4xx"
+        if code >= 500:
+            return "5xx"
+    reason = getattr(error, "reason", error)
+    if isinstance(reason, socket.gaierror):
+        return "dns"
+    if isinstance(reason, socket.timeout):
+        return "timeout"
+    if isinstance(reason, OSError):
+        return "connection"
+    return "error"
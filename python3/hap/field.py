@@ -65,7 +65,13 @@ class Field(object):
     """
 
     RECORDS, META, CONFIG, HEADERS = r"records", r"meta", r"config", r"headers"
-    PAYLOAD, PROXIES = r"payload", r"proxies"
+    PAYLOAD, PROXIES, INTERVAL = r"payload", r"proxies", r"interval"
+    NEGATIVE_CACHE, TIMEOUT = r"negative_cache", r"timeout"
+    RETRIES, CIRCUIT_BREAKER = r"retries", r"circuit_breaker"
+    RATE_LIMIT, CONCURRENCY = r"rate_limit", r"concurrency"
+    REQUEST, STREAM = r"request", r"stream"
+    MAX_BODY, SPOOL, HUGE_TREE = r"max_body", r"spool", r"huge_tree"
+    CRAWL = r"crawl"
 
     LINK, DECLARE, DEFINE = r"link", r"declare", r"define"
 
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Any, Callable, Hashable, Tuple
+
+from contextlib import contextmanager
+from threading import Event, Lock
+
+try:
+    from fcntl import flock, LOCK_EX, LOCK_UN
+except ImportError:  # pragma: no cover
+    flock = None
+
+
+class Call(object):
+    """An in-flight call and its outcome.
+    """
+
+    def __init__(self):
+        self.done = Event()
+        self.value, self.error = None, None
+
+
+class SingleFlight(object):
+    """Collapse concurrent calls for the same key into one.
+
+    The first caller of a key runs the function; callers arriving while it
+    is in flight wait for it and share its return value or its exception.
+    """
+
+    def __init__(self):
+        self.calls = dict()
+        self.lock = Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run func once for all concurrent callers of key.
+
+        Returns:
+            tuple: Value returned by func and whether it was shared.
+        """
+
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+        try:
+            call.value = func()
+            return call.value, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+@contextmanager
+def file_lock(filepath: str):
+    """Exclusive advisory lock shared by all processes of the host.
+
+    Lock files are left in place; removing them would race with processes
+    waiting on the same file. Platforms without fcntl get no locking.
+    """
+
+    if flock is None:  # pragma: no cover
+        yield
+        return
+    with open(filepath, "a") as fd:
+        flock(fd.fileno(), LOCK_EX)
+        try:
+            yield
+        finally:
+            flock(fd.fileno(), LOCK_UN)
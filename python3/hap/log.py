@@ -25,34 +25,46 @@ import logging
 
 class Log(object):
     """Log wrapper. That's it...
+
+    Messages take lazy %-style arguments and are formatted only when the
+    record is actually emitted, so a debug call below the configured level
+    costs a single level check.
     """
 
     config = {
         r"format": r"%(asctime)-15s %(message)s"
     }
 
+    logger = logging.getLogger()
+
     @classmethod
     def configure(cls, verbose=False):
         cls.config["level"] = logging.DEBUG if verbose else logging.INFO
         logging.basicConfig(**cls.config)
 
     @classmethod
-    def info(cls, message: str):
-        logging.info(message)
+    def is_debug(cls) -> bool:
+        return cls.logger.isEnabledFor(logging.DEBUG)
+
+    @classmethod
+    def info(cls, message: str, *args):
+        if cls.logger.isEnabledFor(logging.INFO):
+            cls.logger.info(message, *args)
 
     @classmethod
-    def debug(cls, message: str):
-        logging.debug(message)
+    def debug(cls, message: str, *args):
+        if cls.logger.isEnabledFor(logging.DEBUG):
+            cls.logger.debug(message, *args)
 
     @classmethod
-    def warn(cls, message: str):
-        logging.warning(message)
+    def warn(cls, message: str, *args):
+        cls.logger.warning(message, *args)
 
     @classmethod
-    def error(cls, message: str):
-        logging.error(message)
+    def error(cls, message: str, *args):
+        cls.logger.error(message, *args)
 
     @classmethod
-    def fatal(cls, message: str):
-        cls.error(message)
-        raise SystemExit(message)
+    def fatal(cls, message: str, *args):
+        cls.error(message, *args)
+        raise SystemExit(message % args if args else message)
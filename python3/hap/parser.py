@@ -22,17 +22,25 @@
 
 from typing import Tuple, Any, Union
 
-from collections import Callable
-
-from lxml import html
-from time import time
-from urllib.request import urlopen, Request
+from lxml import html, etree
+from time import time, sleep, monotonic
+from mmap import mmap, ACCESS_READ
+from tempfile import SpooledTemporaryFile, TemporaryFile
 from re import sub, compile, IGNORECASE
-from os import path
+from os import path, fstat
+from urllib.parse import urlsplit
 
 from hap.log import Log
-from hap.cache import Cache
+from hap.cache import Cache, ResultMemo
 from hap.field import Field
+from hap.flight import SingleFlight
+from hap.client import Client, Payload
+from hap.retry import RetryPolicy, CircuitBreaker
+from hap.throttle import RateLimiter, Concurrency, AdaptiveWindow
+from hap.proxy import ProxyManager
+from hap.charset import Charset
+from hap.error import DataplanError, FetchError, UnsupportedContentError, \
+    BodyTooLargeError, ExtractionError, classify_failure
 
 
 class HTMLParser(object):
@@ -48,8 +56,14 @@ class HTMLParser(object):
     refresh_records, no_cache = False, False
     headers, payload, proxies = dict(), None, None
     supported_mime_types = ("text/html", "application/xhtml+xml")
+    stream, chunk_size, block_size = False, 16 * 1024, 1024 * 1024
+    probe_limit = 4 * 1024 * 1024
+    max_body, truncate_body, spool_size = None, False, 8 * 1024 * 1024
+    huge_tree = False
+    flights = SingleFlight()
 
     FILE_PROTOCOL = "file://"
+    full_html = compile(br"^\s*<(?:html|!doctype)", IGNORECASE)
     HTTP_PROTOCOL = "http://"
     HTTPS_PROTOCOL = "https://"
 
@@ -63,19 +77,32 @@ class HTMLParser(object):
     )
 
     def __init__(self, dataplan: dict = None, no_cache: bool = False,
-                 refresh: bool = False):
+                 refresh: bool = False, source: Union[str, bytes] = None):
         if not isinstance(dataplan, dict):
-            raise Exception("Unexpected dataplan received: required dict")
+            raise DataplanError("Unexpected dataplan received: required dict")
         self.dataplan = dataplan
         self.no_cache = no_cache
         self.refresh_records = refresh
+        self.source = source
+        self.data, self.records, self.headers = dict(), dict(), dict()
+        self.errors = list()
+        self.negative_cache, self.failure_policies = True, None
+        self.timeouts, self.retry = Client.timeouts(), RetryPolicy()
+        self.circuit_breaker, self.rate_limit = None, None
+        self.concurrency, self.payload = None, Payload()
+        self.truncated, self.encoding = False, None
+        self.memo_key, self.memo = None, None
         Log.debug("HTML Parser initialized")
 
     def run(self) -> "HTMLParser":
         """Run parser across all sections.
 
-        Rises:
-            SystemExit: If a fatal log occurs.
+        Failed definitions and conversions do not stop the run; they are
+        logged and collected in the errors list of the parser.
+
+        Raises:
+            DataplanError: If the dataplan is invalid.
+            FetchError: If the link cannot be retrieved or parsed.
 
         Returns:
             self: Parser instance.
@@ -84,7 +111,7 @@ class HTMLParser(object):
         records = self.dataplan.get(Field.RECORDS)
         if isinstance(records, list) and len(records) > 0:
             n_data = len(records)
-            Log.debug("Found {} stored record(s) in dataplan".format(n_data))
+            Log.debug("Found %d stored record(s) in dataplan", n_data)
 
         if self.refresh_records and Field.RECORDS in self.dataplan:
             del self.dataplan[Field.RECORDS]
@@ -95,14 +122,15 @@ class HTMLParser(object):
             key_exists = sec in self.dataplan
             if not key_exists:
                 if required:
-                    Log.fatal("Missing required section: '{}'".format(sec))
+                    raise DataplanError(
+                        "Missing required section: '{}'".format(sec))
                 else:
                     continue
             if key_exists and not isinstance(data, datatype):
-                err = (sec, datatype)
-                Log.fatal("Wrong type: section '{}' must be {}".format(*err))
+                raise DataplanError("Wrong type: section '{}' must be {}"
+                                    .format(sec, datatype))
             if not hasattr(self, "prepare_{}".format(sec)):
-                Log.fatal("Unsupported section '{}'".format(sec))
+                raise DataplanError("Unsupported section '{}'".format(sec))
             getattr(self, "prepare_{}".format(sec))(data)
 
         Log.debug("Logging records datetime...")
@@ -147,18 +175,21 @@ class HTMLParser(object):
 
         for key, datatype in declarations.items():
             if key not in self.data:
-                Log.warn("No data found for key '{}'".format(key))
+                Log.warn("No data found for key '%s'", key)
             value = self.data.get(key)
             convert_func = Field.DATA_TYPES.get(datatype)
-            if value is not None and isinstance(convert_func, Callable):
+            if value is not None and callable(convert_func):
                 try:
                     value = convert_func(value)
                 except Exception as e:
                     value = None
-                    Log.warn("Cannot convert value because {}".format(e))
+                    Log.warn("Cannot convert value because %s", e)
+                    self.errors.append(ExtractionError(
+                        "Cannot convert value because {}".format(e), key))
             self.records.update({key: value})
-            args = (key, value, datatype)
-            Log.debug("Updating records with '{}' as '{}' ({})".format(*args))
+            if __debug__:
+                Log.debug("Updating records with '%s' as '%s' (%s)",
+                          key, value, datatype)
 
     def prepare_define(self, definitions: list) -> None:
         """The "define" protocol.
@@ -170,9 +201,18 @@ class HTMLParser(object):
         order to be valid. An assignment is just what it sounds. The defined
         property is being assiged to a given value. A performer is a built-in
         function applied.
+
+        Results extracted from an unchanged local file are reused.
         """
 
+        if self.memo is not None:
+            data, errors = self.memo
+            self.data.update(data)
+            self.errors.extend(errors)
+            return
         [self.parse_definition(d) for d in definitions if len(d) > 0]
+        if self.memo_key is not None:
+            ResultMemo.put(self.memo_key, self.data, self.errors)
 
     def parse_definition(self, entry: dict) -> None:
         """A "define" protocol helper.
@@ -181,16 +221,18 @@ class HTMLParser(object):
         """
 
         if len(entry) != 1:
-            warning_msg = "Incorrect definition entry: expected one key, " \
-                          "got {n} ..."
-            Log.warn(warning_msg.format(n=len(entry)))
+            Log.warn("Incorrect definition entry: expected one key, "
+                     "got %d ...", len(entry))
         try:
             self.def_key, val = list(entry.items()).pop()
-            Log.debug("Parsing definition for '{}'".format(self.def_key))
+            if __debug__:
+                Log.debug("Parsing definition for '%s'", self.def_key)
             key_value = self.eval_def_value(val)
             self.keep_first_non_empty(self.def_key, key_value)
         except Exception as e:
-            Log.error("Cannot parse definitions: {}".format(e))
+            Log.error("Cannot parse definitions: %s", e)
+            self.errors.append(ExtractionError(
+                "Cannot parse definitions: {}".format(e), self.def_key))
 
     def keep_first_non_empty(self, key: str, value: str) -> None:
         """A "define" protocol helper.
@@ -216,8 +258,9 @@ class HTMLParser(object):
         self.last_result = None
         if isinstance(value, str):
             self.last_result = value
-            key, result = self.def_key, self.last_result
-            Log.debug("Performing {}:assignment => {}".format(key, result))
+            if __debug__:
+                Log.debug("Performing %s:assignment => %s",
+                          self.def_key, self.last_result)
         elif isinstance(value, dict):
             self.last_result = self.perform(**value)
         elif isinstance(value, list):
@@ -264,29 +307,28 @@ class HTMLParser(object):
         if query is not None:
             query_css = query
         if query_css is not None:
+            directive, argument = "query:css", query_css
             self.last_result = self.perform_query(query_css)
-            Log.debug("Performing {}:query:css '{}' => {}".format(
-                        self.def_key, query_css, self.last_result))
         elif query_xpath is not None:
+            directive, argument = "query:xpath", query_xpath
             self.last_result = self.perform_query(query_xpath, xpath=True)
-            Log.debug("Performing {}:query:xpath '{}' => {}".format(
-                        self.def_key, query_xpath, self.last_result))
         elif pattern is not None:
+            directive, argument = "pattern", pattern
             self.last_result = self.perform_pattern(pattern)
-            Log.debug("Performing {}:pattern '{}' => {}".format(
-                        self.def_key, pattern, self.last_result))
         elif remove is not None:
+            directive, argument = "remove", remove
             self.last_result = self.perform_remove(remove)
-            Log.debug("Performing {}:remove '{}' => {}".format(
-                        self.def_key, remove, self.last_result))
         elif glue is not None:
+            directive, argument = "glue", glue
             self.last_result = self.perform_glue(glue)
-            Log.debug("Performing {}:glue '{}' => {}".format(
-                        self.def_key, glue, self.last_result))
         elif replace is not None:
+            directive, argument = "replace", replace
             self.last_result = self.perform_replace(*replace)
-            Log.debug("Performing {}:replace '{}' => {}".format(
-                        self.def_key, replace, self.last_result))
+        else:
+            return self.last_result
+        if __debug__:
+            Log.debug("Performing %s:%s '%s' => %s", self.def_key,
+                      directive, argument, self.last_result)
         return self.last_result
 
     def perform_query(self, query: str,
@@ -425,16 +467,148 @@ class HTMLParser(object):
         Configure requester with HTTP client-related options such as
         User-Agent, Content-Type, and other HTTP headers.
 
-        Only HTTP headers are supported at the moment.
+        The "negative_cache" option is either false, to always retry failed
+        links, or a map of failure classes to the seconds (or a list of base
+        and maximum seconds) a failure is remembered for.
+
+        The "request" option (or a plain "payload") sets the method and body
+        of the request: a "form" map, a "json" value, a raw "payload" or a
+        "file" to stream.
+
+        The "stream" option parses the page while it is downloaded and stops
+        the download once every declared field is found.
+
+        The "max_body" option aborts, or truncates, downloads of bodies
+        larger than the given bytes. Bodies larger than "spool" bytes are
+        downloaded to a temporary file and parsed from a memory map. The
+        "huge_tree" option lifts the limits of lxml on very large documents.
+
+        The "timeout", "retries" and "circuit_breaker" options tune how long
+        a request may take, how often a transient failure is retried and
+        when a failing host is no longer requested. The "rate_limit" option
+        caps the requests per second sent to the host of the link and the
+        "concurrency" option bounds its requests in flight. The "proxies"
+        option maps URL schemes to a proxy or a pool of proxies.
         """
 
         for k, v in configuration.items():
             if k == Field.HEADERS and isinstance(v, dict):
                 self.headers = v
-            elif k == Field.PAYLOAD and isinstance(v, str):
-                self.payload = v
+            elif k == Field.PAYLOAD and isinstance(v, (str, dict)):
+                self.prepare_request({Field.PAYLOAD: v})
+            elif k == Field.REQUEST and isinstance(v, dict):
+                self.prepare_request(v)
             elif k == Field.PROXIES and isinstance(v, dict):
                 self.proxies = v
+            elif k == Field.NEGATIVE_CACHE:
+                self.prepare_failure_policies(v)
+            elif k == Field.TIMEOUT:
+                self.timeouts = self.prepare_option(k, Client.timeouts, v)
+            elif k == Field.RETRIES:
+                self.retry = self.prepare_option(
+                    k, RetryPolicy.from_config, v)
+            elif k == Field.CIRCUIT_BREAKER and isinstance(v, dict):
+                self.prepare_option(k, CircuitBreaker, None,
+                                    v.get("threshold"), v.get("reset"))
+                self.circuit_breaker = v
+            elif k == Field.RATE_LIMIT:
+                self.rate_limit = v
+            elif k == Field.CONCURRENCY:
+                if isinstance(v, dict):
+                    self.prepare_option(k, AdaptiveWindow, None,
+                                        v.get("initial"), v.get("min"),
+                                        v.get("max"))
+                self.concurrency = v
+            elif k == Field.MAX_BODY:
+                self.prepare_max_body(v)
+            elif k == Field.SPOOL and isinstance(v, int):
+                self.spool_size = max(0, v)
+            elif k == Field.HUGE_TREE and isinstance(v, bool):
+                self.huge_tree = v
+            elif k == Field.STREAM and isinstance(v, (bool, dict)):
+                self.prepare_stream(v)
+
+    def prepare_option(self, name: str, build: Any, *args: Any) -> Any:
+        """A "config" protocol helper.
+
+        Build the value of an option, e.g. timeouts or a retry policy.
+
+        Raises:
+            DataplanError: If the option is malformed.
+        """
+
+        try:
+            return build(*args)
+        except (TypeError, ValueError) as e:
+            raise DataplanError("Invalid {}: {}".format(name, e))
+
+    def prepare_stream(self, settings: Union[bool, dict]) -> None:
+        """A "config" protocol helper.
+
+        Streaming is enabled by true or a map with the "chunk_size" bytes
+        read at once, which must be a positive integer.
+        """
+
+        self.stream = settings is not False
+        if not isinstance(settings, dict) or "chunk_size" not in settings:
+            return
+        size = settings.get("chunk_size")
+        if isinstance(size, int) and not isinstance(size, bool) and size > 0:
+            self.chunk_size = size
+        else:
+            Log.warn("Ignoring invalid chunk_size: %s", size)
+
+    def prepare_max_body(self, limit: Union[int, dict, None]) -> None:
+        """A "config" protocol helper.
+
+        The limit is a number of bytes, or a map of "size" bytes and an
+        "action" to take on larger bodies: "abort" (default) or "truncate".
+        """
+
+        action = None
+        if isinstance(limit, dict):
+            action, limit = limit.get("action"), limit.get("size")
+        if limit is None or isinstance(limit, int) \
+                and not isinstance(limit, bool) and limit > 0:
+            self.max_body = limit
+            self.truncate_body = limit is not None and action == "truncate"
+        else:
+            Log.warn("Ignoring invalid max_body: %s", limit)
+
+    def prepare_request(self, settings: dict) -> None:
+        """A "config" protocol helper.
+
+        Raises:
+            DataplanError: If the request body cannot be prepared.
+        """
+
+        try:
+            self.payload = Payload.from_config(settings)
+        except (TypeError, ValueError) as e:
+            raise DataplanError("Invalid request: {}".format(e))
+
+    def prepare_failure_policies(self, policies: Union[bool, dict]) -> None:
+        """A "config" protocol helper.
+
+        Merge negative cache policies of the dataplan with the defaults.
+        """
+
+        if isinstance(policies, bool):
+            self.negative_cache = policies
+            return
+        if not isinstance(policies, dict):
+            return Log.warn("Ignoring invalid negative_cache: %s", policies)
+        self.failure_policies = dict(Cache.failure_policies)
+        for failure, policy in policies.items():
+            if isinstance(policy, list) and len(policy) == 2:
+                base, limit = policy
+            else:
+                base, limit = policy, policy
+            if any(isinstance(v, bool) or not isinstance(v, (int, float))
+                   or v < 0 for v in (base, limit)):
+                Log.warn("Ignoring invalid policy for %s", failure)
+                continue
+            self.failure_policies[failure] = (float(base), float(limit))
 
     def prepare_meta(self, metafields: dict) -> None:
         """The "meta" protocol.
@@ -446,41 +620,64 @@ class HTMLParser(object):
         if len(metafields) > 0:
             Log.debug("Listing meta fields")
             for k, v in metafields.items():
-                Log.debug(" {} = {}".format(k, v))
+                Log.debug(" %s = %s", k, v)
 
     def prepare_link(self, link: str) -> Any:
         """The "link" protocol.
 
-        Set or update the link of the dataplan. Can be cached.
+        Set or update the link of the dataplan. Can be cached. If the parser
+        was given a source, the link is only recorded and nothing is fetched.
         """
 
         self.link = link
+        if self.source is not None:
+            Log.debug("Using provided source for link: %s", link)
+            return self.prepare_source_code()
         if link.startswith(self.FILE_PROTOCOL):
             filepath = link[len(self.FILE_PROTOCOL):]
             if not path.exists(filepath):
-                Log.fatal("Cannot get content from file: file does not exist")
-            Log.debug("Getting content from local file: {}".format(link))
-            content = ""
-            with open(filepath) as fd:
-                content = fd.read()
-            return self.prepare_source_code_from_cache(content)
+                raise FetchError("Cannot get content from file: "
+                                 "file does not exist", link)
+            Log.debug("Getting content from local file: %s", link)
+            if not self.no_cache:
+                self.memo_key = ResultMemo.key(filepath, {
+                    Field.DEFINE: self.dataplan.get(Field.DEFINE),
+                    "huge_tree": self.huge_tree})
+                self.memo = ResultMemo.get(self.memo_key)
+                if self.memo is not None:
+                    Log.debug("Reusing results of unchanged file: %s", link)
+                    return self
+            return self.prepare_source_file(filepath)
         elif link.startswith(self.HTTP_PROTOCOL) \
                 or link.startswith(self.HTTPS_PROTOCOL):
             if not self.no_cache:
-                ok, cache = Cache.read_link(self.link)
+                ok, cache = Cache.load_link(self.link, self.payload.variant)
                 if ok:
-                    Log.debug("Getting content from cache: {}".format(link))
-                    return self.prepare_source_code_from_cache(cache)
-            Log.debug("Getting content from URL: {}".format(link))
-            self.open_url()
+                    Log.debug("Getting content from cache: %s", link)
+                    return self.prepare_source_code_from_cache(*cache)
+            Log.debug("Getting content from URL: %s", link)
+            self.fetch_link()
             return self.prepare_source_code()
-        Log.fatal("Unsupported link protocol: must be file or http(s)")
+        raise DataplanError("Unsupported link protocol: "
+                            "must be file or http(s)")
+
+    def prepare_source_file(self, filepath: str) -> "HTMLParser":
+        """Map a local file in memory and parse it without reading it into
+        a string first.
+        """
 
-    def prepare_source_code_from_cache(self, cache_src: str) -> "HTMLParser":
+        with open(filepath, "rb") as fd:
+            if fstat(fd.fileno()).st_size == 0:
+                return self.prepare_source_code_from_cache(b"")
+            content = mmap(fd.fileno(), 0, access=ACCESS_READ)
+        return self.prepare_source_code_from_cache(content)
+
+    def prepare_source_code_from_cache(self, cache_src: Union[str, bytes],
+                                       encoding: str = None) -> "HTMLParser":
         """Set source to cached source.
         """
 
-        self.source = cache_src
+        self.source, self.encoding = cache_src, encoding
         return self.prepare_source_code()
 
     def prepare_source_code(self) -> "HTMLParser":
@@ -488,11 +685,86 @@ class HTMLParser(object):
 
         Raises a warning if source is not set. The HTML document has the root
         node set to "html".
+
+        Bytes are decoded by lxml itself, with the encoding detected from
+        the response headers, a byte order mark or a <meta> declaration.
+
+        Raises:
+            FetchError: If the source is missing or cannot be parsed, e.g.
+                        it is empty or holds only comments.
         """
 
         if self.source is None:
-            Log.fatal("Source code not completed!")
-        self.source_code = html.fromstring(self.source)
+            raise FetchError("Source code not completed!", self.link)
+        try:
+            self.source_code = self.parse_source()
+        except etree.LxmlError as e:
+            raise FetchError("Cannot parse document: {}".format(e),
+                             self.link)
+        return self
+
+    def parse_source(self) -> Any:
+        """Parse the source with the semantics of html.fromstring, whatever
+        its type: a fragment document is rooted at its single element.
+        Mapped buffers of full documents are parsed in place; fragments,
+        usually small, are copied to bytes first.
+        """
+
+        if isinstance(self.source, str):
+            parser = Charset.parser(huge_tree=self.huge_tree)
+            return html.fromstring(self.source, parser=parser)
+        if self.encoding is None:
+            self.encoding = Charset.detect(self.source)
+        parser = Charset.parser(self.encoding, self.huge_tree)
+        if isinstance(self.source, bytes):
+            return html.fromstring(self.source, parser=parser)
+        if self.full_html.match(self.source[:Charset.sniff_size]):
+            return html.document_fromstring(self.source, parser=parser)
+        return html.fromstring(bytes(self.source), parser=parser)
+
+    def fetch_link(self) -> "HTMLParser":
+        """Fetch the link once for all concurrent requests of it.
+
+        Threads asking for the same link while it is being downloaded wait
+        for that download and share its body. Links are the same when they
+        differ at most by their fragment and send the same request. Unless
+        the cache is disabled, the download also holds the link's cache lock,
+        so other processes wait for it and then read the fresh cache entry
+        instead of fetching the link again. A recently failed link fails
+        again without being fetched until its negative cache entry expires.
+
+        Streamed and truncated downloads may stop early for this dataplan
+        only, so they are never shared.
+        """
+
+        def download():
+            if self.no_cache:
+                return self.open_url().source, self.encoding
+            with Cache.lock_link(self.link, self.payload.variant):
+                ok, cache = Cache.load_link(self.link, self.payload.variant)
+                if ok:
+                    Log.debug("Getting content from cache: %s", self.link)
+                    return cache
+                if self.negative_cache:
+                    failed, entry = Cache.read_failure(
+                        self.link, self.payload.variant)
+                    if failed:
+                        raise FetchError(
+                            "Cannot reach link: {} (cached {} failure, "
+                            "retry in {:.0f}s)".format(
+                                entry.get("message"), entry.get("class"),
+                                entry.get("until") - time()),
+                            self.link, entry.get("class"))
+                return self.open_url().source, self.encoding
+
+        if self.stream or self.truncate_body:
+            self.source, self.encoding = download()
+            return self
+        key = (urlsplit(self.link)._replace(fragment="").geturl(),
+               self.payload.variant)
+        (self.source, self.encoding), shared = self.flights.do(key, download)
+        if shared:
+            Log.debug("Shared in-flight download of %s", self.link)
         return self
 
     def open_url(self) -> "HTMLParser":
@@ -500,44 +772,255 @@ class HTMLParser(object):
 
         Access an URL and read it's content. Can be cached.
 
+        Every attempt waits for the rate limit and for a free concurrency slot
+        of the host. Transient failures are retried with a jittered backoff as
+        long as the retry policy allows it, and a host whose circuit breaker
+        is open is not requested at all.
+
         If URL returns a non-OK (200) status code, a warning is printed, but if
-        it return a non-HTML content-type, a fatal log is set.
-        """
-
-        status, source = self.read_url(self.link)
-        if not status:
-            Log.fatal("Cannot reach link: {}".format(source))
-        if status and not str(source.code).startswith("2"):
-            Log.warn("Non-2xx status code: {}".format(source.code))
-        if hasattr(source.info(), "gettype"):
-            mimetype = source.info().gettype()
-            if mimetype not in self.supported_mime_types:
-                Log.fatal("Unsupported content, got {}".format(mimetype))
-        self.source = source.read()
-        if not self.no_cache:
-            ok, status = Cache.write_link(self.link, self.source)
+        it return a non-HTML content-type, an UnsupportedContentError is
+        raised. The body is kept as bytes along with its detected encoding.
+        """
+
+        remember = not self.no_cache and self.negative_cache
+        host = urlsplit(self.link).netloc
+        breaker = CircuitBreaker.of(host, self.circuit_breaker)
+        attempt = 0
+        while True:
+            attempt += 1
+            if not breaker.allow():
+                raise FetchError("Cannot reach link: circuit open for {}"
+                                 .format(host), self.link, "circuit")
+            RateLimiter.acquire(host, self.rate_limit)
+            try:
+                status, source, failure = self.request_url(host)
+            except UnsupportedContentError:
+                breaker.record(None)
+                raise
+            if status:
+                break
+            breaker.record(failure)
+            headers = getattr(source, "headers", None)
+            retry_after = headers.get("Retry-After") if headers else None
+            if hasattr(source, "close"):
+                source.close()
+            if self.retry.should_retry(failure, attempt, self.payload.method):
+                delay = self.retry.delay(attempt, retry_after)
+                Log.warn("Retrying %s in %.2fs after %s failure: %s",
+                         self.link, delay, failure, source)
+                sleep(delay)
+                continue
+            if remember:
+                ok, err = Cache.write_failure(self.link, failure, str(source),
+                                              self.failure_policies,
+                                              self.payload.variant)
+                if not ok:
+                    Log.warn(err)
+            if isinstance(source, FetchError):
+                raise source
+            raise FetchError("Cannot reach link: {}".format(source),
+                             self.link, failure)
+        breaker.record(None)
+        if remember:
+            Cache.clear_failure(self.link, self.payload.variant)
+        self.source = source
+        if not self.no_cache and not self.truncated:
+            ok, status = Cache.write_link(self.link, self.source,
+                                          self.payload.variant, self.encoding)
             if not ok:
                 Log.warn(status)
         return self
 
-    def read_url(self, url: str, **kwargs) -> Tuple[bool, str]:
+    def request_url(self, host: str) -> Tuple[bool, Any, Union[str, None]]:
+        """Download the link once within the concurrency window of its host.
+
+        The request goes through a proxy of the pool configured for the
+        scheme of the link, if any. The latency and outcome of the request
+        adapt the window and the health of the proxy.
+
+        Returns:
+            tuple: Boolean status, body or exception and failure class.
+        """
+
+        pool = ProxyManager.pool(urlsplit(self.link).scheme, self.proxies)
+        window = Concurrency.window(host, self.concurrency)
+        window.acquire()
+        proxy = pool.acquire() if pool is not None else None
+        started, failure = monotonic(), "error"
+        try:
+            status, source = self.read_url(self.link, proxy and proxy.url)
+            if status:
+                status, source = self.read_response(source)
+            failure = None if status else classify_failure(source)
+            return status, source, failure
+        finally:
+            latency = monotonic() - started
+            window.release(latency, failure)
+            if proxy is not None:
+                pool.release(proxy, latency, failure)
+
+    def read_response(self, response: Any) -> Tuple[bool, Any]:
+        """Read the body of an HTTP response and close it.
+
+        Args:
+            response (stream): HTTP response returned by read_url.
+
+        Raises:
+            UnsupportedContentError: If the content type is not HTML.
+
+        Returns:
+            tuple: Boolean status and body or exception.
+        """
+
+        try:
+            if not str(response.code).startswith("2"):
+                Log.warn("Non-2xx status code: %s", response.code)
+            headers = response.info()
+            if headers.get("Content-Type") is not None:
+                mimetype = headers.get_content_type()
+                if mimetype not in self.supported_mime_types:
+                    raise UnsupportedContentError(
+                        "Unsupported content, got {}".format(mimetype),
+                        self.link, mimetype)
+            declared = headers.get_content_charset()
+            body = self.read_body(response, declared)
+            self.encoding = Charset.detect(body, declared)
+            return True, body
+        except UnsupportedContentError:
+            raise
+        except Exception as e:
+            return False, e
+        finally:
+            response.close()
+
+    def read_body(self, response: Any,
+                  declared: str = None) -> Union[bytes, mmap]:
+        """Read the body of an HTTP response in chunks.
+
+        Bodies larger than max_body bytes raise a BodyTooLargeError, or are
+        truncated if configured so. Bodies larger than spool_size bytes are
+        written to a temporary file and returned memory-mapped; a spool_size
+        of 0 writes every body straight to the file.
+
+        In streaming mode, the definitions are evaluated against the part
+        of the document received so far, each time the received size has
+        doubled, so probing costs about as much as parsing the whole page
+        once. Once every declared field is found with the same values as
+        at the previous probe, the rest of the body is not downloaded.
+        Past probe_limit bytes the body is downloaded without probing.
+
+        A truncated or partially downloaded body marks the parser as
+        truncated, so it is not cached.
+
+        Args:
+            response (stream): HTTP response returned by read_url.
+            declared    (str): Charset of the Content-Type header, if any.
+
+        Raises:
+            BodyTooLargeError: If the body is too large to be downloaded.
+
+        Returns:
+            mixt: Body as bytes or memory-mapped file.
+        """
+
+        pull, root, previous, due = None, None, None, self.chunk_size
+        if self.stream:
+            encoding = Charset.name(declared) if declared else None
+            pull = etree.HTMLPullParser(events=("start",), encoding=encoding)
+            pull.set_element_class_lookup(html.HtmlElementClassLookup())
+        size = self.chunk_size if self.stream else self.block_size
+        if self.spool_size > 0:
+            spool = SpooledTemporaryFile(self.spool_size)
+        else:
+            spool = TemporaryFile()
+        received = 0
+        try:
+            while True:
+                chunk = response.read(size)
+                if not chunk:
+                    break
+                if self.max_body and received + len(chunk) > self.max_body:
+                    if not self.truncate_body:
+                        raise BodyTooLargeError(
+                            "Body exceeds {} bytes".format(self.max_body),
+                            self.link, self.max_body)
+                    chunk = chunk[:self.max_body - received]
+                    self.truncated = True
+                    Log.warn("Truncating body at %d bytes", self.max_body)
+                received += len(chunk)
+                spool.write(chunk)
+                if self.truncated:
+                    break
+                if pull is None:
+                    continue
+                pull.feed(chunk)
+                for _, element in pull.read_events():
+                    root = root if root is not None else element
+                if received < due or root is None:
+                    continue
+                found, due = self.probe(root), received * 2
+                if found is not None and found == previous:
+                    self.truncated = True
+                    Log.debug("Every field found after %d bytes, "
+                              "stop reading", received)
+                    break
+                previous = found
+                if received > self.probe_limit:
+                    Log.debug("No fields found in %d bytes, stop probing",
+                              received)
+                    pull = None
+            if received <= self.spool_size:
+                spool.seek(0)
+                return spool.read()
+            spool.flush()
+            return mmap(spool.fileno(), 0, access=ACCESS_READ)
+        finally:
+            spool.close()
+
+    def probe(self, root: Any) -> Union[dict, None]:
+        """Evaluate the definitions against a partial document.
+
+        Args:
+            root (HtmlElement): Root of the document received so far.
+
+        Returns:
+            dict: Defined values if every declared field is found, or None.
+        """
+
+        declarations = self.dataplan.get(Field.DECLARE)
+        definitions = self.dataplan.get(Field.DEFINE)
+        if not isinstance(declarations, dict) \
+                or not isinstance(definitions, list):
+            return None
+        probe = type(self)(self.dataplan, no_cache=True, source=b"")
+        probe.source_code = root
+        probe.prepare_define(definitions)
+        if any(probe.data.get(k) is None for k in declarations):
+            return None
+        return probe.data
+
+    def read_url(self, url: str, proxy: str = None) -> Tuple[bool, Any]:
         """Retrieve HTTP stream by a request.
 
         Args:
-            url      (str): URL to access.
-            proxies (dict): List of proxy addresses to use.
+            url   (str): URL to access.
+            proxy (str): Proxy address to send the request through.
 
         Returns:
-            tuple: Boolean status and HTTP stream resource or error.
+            tuple: Boolean status and HTTP stream resource or exception.
         """
 
+        request = self.decorate_headers(url)
         try:
-            return True, urlopen(self.decorate_headers(url), **kwargs)
+            return True, Client.open(request, self.timeouts, proxy)
         except Exception as e:
-            return False, str(e)
+            return False, e
+        finally:
+            if hasattr(request.data, "close"):
+                request.data.close()
 
     def decorate_headers(self, link: str) -> Any:
-        """Add headers to request.
+        """Add method, body and headers to request.
 
         Args:
             link (str): Link to access
@@ -546,10 +1029,13 @@ class HTMLParser(object):
             requester: HTTP stream requester.
         """
 
+        from urllib.request import Request
+        data, headers = self.payload.body()
+        headers.update(self.headers)
         if self.headers:
-            Log.debug("Outgoing HTTP headers: {}".format(self.headers))
-            return Request(link, headers=self.headers)
-        return Request(link)
+            Log.debug("Outgoing HTTP headers: %s", self.headers)
+        return Request(link, data=data, headers=headers,
+                       method=self.payload.method)
 
     @classmethod
     def run_get_records(cls, data: dict, no_cache: bool) -> dict:
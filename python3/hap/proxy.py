@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Any, Union
+
+from itertools import count
+from threading import Lock
+from time import monotonic
+
+from hap.log import Log
+
+
+class Proxy(object):
+    """A proxy server with its load, latency and health.
+
+    After threshold consecutive failures a proxy rests for cooldown seconds,
+    doubling with every further failure, and is only used meanwhile if no
+    other proxy of its pool is healthy.
+    """
+
+    threshold, cooldown, max_cooldown, smoothing = 3, 30.0, 600.0, 0.2
+    failures = ("connection", "timeout", "dns")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight, self.requests, self.errors = 0, 0, 0
+        self.consecutive, self.latency, self.resting_until = 0, None, 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return monotonic() >= self.resting_until
+
+    def record(self, latency: float, failure: Union[str, None]) -> None:
+        self.in_flight -= 1
+        self.requests += 1
+        if failure in self.failures:
+            self.errors += 1
+            self.consecutive += 1
+            if self.consecutive >= self.threshold:
+                rest = min(self.max_cooldown, self.cooldown * 2 ** (
+                    self.consecutive - self.threshold))
+                self.resting_until = monotonic() + rest
+                Log.warn("Proxy %s failed %d times, resting %.0fs",
+                         self.url, self.consecutive, rest)
+            return
+        self.consecutive = 0
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency": self.latency,
+            "healthy": self.healthy,
+        }
+
+
+class ProxyPool(object):
+    """Proxies used in turn ("round-robin") or by fewest requests in flight
+    and lowest latency ("least-loaded").
+    """
+
+    ROUND_ROBIN, LEAST_LOADED = "round-robin", "least-loaded"
+
+    def __init__(self, urls: list, strategy: str = ROUND_ROBIN):
+        self.proxies = [Proxy(url) for url in urls]
+        self.strategy = strategy
+        self.turns = count()
+        self.lock = Lock()
+
+    def acquire(self) -> Proxy:
+        """Select a proxy and count a request in flight through it.
+        """
+
+        with self.lock:
+            candidates = [p for p in self.proxies if p.healthy]
+            if len(candidates) == 0:
+                candidates = [min(self.proxies,
+                                  key=lambda p: p.resting_until)]
+            if self.strategy == self.LEAST_LOADED:
+                proxy = min(candidates, key=lambda p: (
+                    p.in_flight, p.latency or 0.0))
+            else:
+                proxy = candidates[next(self.turns) % len(candidates)]
+            proxy.in_flight += 1
+        return proxy
+
+    def release(self, proxy: Proxy, latency: float,
+                failure: Union[str, None] = None) -> None:
+        """Record the outcome of a request sent through a proxy.
+        """
+
+        with self.lock:
+            proxy.record(latency, failure)
+
+
+class ProxyManager(object):
+    """Registry of proxy pools built from dataplan "proxies" settings.
+
+    The "proxies" setting maps URL schemes to a proxy address or a list of
+    addresses, with an optional "strategy". Pools are shared by dataplans
+    with the same proxies, so the health of a proxy is learned only once.
+    """
+
+    STRATEGY = "strategy"
+    pools, lock = dict(), Lock()
+
+    @classmethod
+    def pool(cls, scheme: str, proxies: Any) -> Union[ProxyPool, None]:
+        """Proxy pool for a scheme, None to connect directly.
+        """
+
+        if not isinstance(proxies, dict):
+            return None
+        urls = proxies.get(scheme)
+        if isinstance(urls, str):
+            urls = [urls]
+        if not isinstance(urls, list) or len(urls) == 0:
+            return None
+        strategy = proxies.get(cls.STRATEGY, ProxyPool.ROUND_ROBIN)
+        if strategy not in (ProxyPool.ROUND_ROBIN, ProxyPool.LEAST_LOADED):
+            Log.warn("Unknown proxy strategy %s, using round-robin", strategy)
+            strategy = ProxyPool.ROUND_ROBIN
+        key = (scheme, tuple(urls), strategy)
+        with cls.lock:
+            pool = cls.pools.get(key)
+            if pool is None:
+                pool = cls.pools[key] = ProxyPool(urls, strategy)
+        return pool
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        """Load and health of every proxy, for observability.
+        """
+
+        with cls.lock:
+            pools = list(cls.pools.values())
+        return {p.url: p.snapshot() for pool in pools for p in pool.proxies}
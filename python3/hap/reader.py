@@ -22,7 +22,10 @@
 
 from typing import Tuple, Union
 
+from copy import deepcopy
 from json import loads
+from os import stat
+from threading import Lock
 
 
 class FileReader(object):
@@ -53,3 +56,38 @@ class FileReader(object):
             return loads(data)
         except Exception:
             return None
+
+
+class DataplanStore(object):
+    """Memoized dataplan loader for long-running processes.
+
+    Parsed dataplans are kept in memory and reloaded only when the file's
+    modification time or size changes. Every load returns a private copy,
+    since running a dataplan updates it.
+    """
+
+    def __init__(self):
+        self.plans = dict()
+        self.lock = Lock()
+
+    def load(self, filepath: str) -> Tuple[bool, Union[dict, str]]:
+        """Returns a copy of the dataplan stored at filepath.
+        """
+
+        try:
+            st = stat(filepath)
+        except OSError as e:
+            return False, str(e)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            cached = self.plans.get(filepath)
+        if cached is None or cached[0] != signature:
+            ok, data = FileReader(filepath).read()
+            if not ok:
+                return False, data
+            if not isinstance(data, dict):
+                return False, "Dataplan is not a valid JSON object"
+            cached = (signature, data)
+            with self.lock:
+                self.plans[filepath] = cached
+        return True, deepcopy(cached[1])
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Any, Union
+
+from random import uniform
+from threading import Lock
+from time import time
+
+
+class RetryPolicy(object):
+    """Retries of failed fetches with jittered exponential backoff.
+
+    Only idempotent requests are retried and only for transient failure
+    classes. The delay before retry n is drawn uniformly between zero and
+    backoff * 2 ** (n - 1), capped at max_backoff ("full jitter"), unless
+    the server asked for a longer Retry-After within that cap.
+    """
+
+    retries, backoff, max_backoff = 2, 0.5, 30.0
+    failures = ("connection", "timeout", "429", "5xx")
+    idempotent = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, retries: int = None, backoff: float = None,
+                 max_backoff: float = None, failures: list = None):
+        if retries is not None:
+            self.retries = max(0, int(retries))
+        if backoff is not None:
+            self.backoff = max(0.0, float(backoff))
+        if max_backoff is not None:
+            self.max_backoff = max(0.0, float(max_backoff))
+        if failures is not None:
+            self.failures = tuple(failures)
+
+    @classmethod
+    def from_config(cls, value: Any) -> "RetryPolicy":
+        """Policy from a dataplan "retries" value.
+
+        Args:
+            value (mixt): Number of retries, or a map with "retries",
+                          "backoff", "max_backoff" and "on" (list of failure
+                          classes).
+        """
+
+        if isinstance(value, int) and not isinstance(value, bool):
+            return cls(retries=value)
+        if isinstance(value, dict):
+            return cls(value.get("retries"), value.get("backoff"),
+                       value.get("max_backoff"), value.get("on"))
+        return cls()
+
+    def should_retry(self, failure: str, attempt: int,
+                     method: str = "GET") -> bool:
+        """Whether a failed attempt (counting from 1) is retried.
+        """
+
+        return attempt <= self.retries and failure in self.failures \
+            and method.upper() in self.idempotent
+
+    def delay(self, attempt: int, retry_after: Union[str, None] = None):
+        """Seconds to wait before retrying a failed attempt.
+        """
+
+        cap = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        wait = uniform(0, cap)
+        try:
+            wait = max(wait, min(float(retry_after), self.max_backoff))
+        except (TypeError, ValueError):
+            pass
+        return wait
+
+
+class CircuitBreaker(object):
+    """Per-host circuit breaker.
+
+    After threshold consecutive transient failures the circuit of a host
+    opens and requests to it fail fast. Once reset seconds passed, a single
+    trial request is let through (half-open): its success closes the
+    circuit, its failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    threshold, reset = 5, 30.0
+    trips = ("dns", "connection", "timeout", "429", "5xx")
+    breakers, registry_lock = dict(), Lock()
+
+    def __init__(self, host: str, threshold: int = None,
+                 reset: float = None):
+        self.host = host
+        self.lock = Lock()
+        self.configure(threshold, reset)
+        self.failures, self.opened_at, self.trial = 0, None, False
+
+    def configure(self, threshold: int = None, reset: float = None) -> None:
+        """Update the settings given, keeping the state of the circuit.
+        """
+
+        with self.lock:
+            if threshold is not None:
+                self.threshold = max(1, int(threshold))
+            if reset is not None:
+                self.reset = max(0.0, float(reset))
+
+    @classmethod
+    def of(cls, host: str, settings: dict = None) -> "CircuitBreaker":
+        """Shared breaker of a host, created on first use.
+
+        Settings are per host: the ones given update the shared breaker, so
+        the latest dataplan to set them wins.
+
+        Args:
+            host      (str): Network location of the host.
+            settings (dict): Optional "threshold" and "reset" seconds.
+        """
+
+        settings = settings if isinstance(settings, dict) else {}
+        with cls.registry_lock:
+            breaker = cls.breakers.get(host)
+            if breaker is None:
+                return cls.breakers.setdefault(host, cls(
+                    host, settings.get("threshold"), settings.get("reset")))
+        breaker.configure(settings.get("threshold"), settings.get("reset"))
+        return breaker
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time() - self.opened_at >= self.reset:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        """Whether a request to the host may be sent now.
+        """
+
+        with self.lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def record(self, failure: Union[str, None]) -> None:
+        """Record the outcome of a request: None on success, or the failure
+        class.
+        """
+
+        with self.lock:
+            self.trial = False
+            if failure is None or failure not in self.trips:
+                self.failures, self.opened_at = 0, None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Callable, Union
+
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from heapq import heappush, heappop
+from itertools import count
+from os import path
+from random import uniform
+from re import match
+from threading import BoundedSemaphore, Condition, Event
+from time import time
+from urllib.parse import urlsplit
+
+from hap.log import Log
+from hap.field import Field
+from hap.parser import HTMLParser
+from hap.throttle import RateLimiter, Concurrency
+from hap.reader import DataplanStore
+from hap.writer import FileWriter
+from hap.util import print_json_line
+
+
+UNITS = {"": 1, "s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_interval(value: Union[int, float, str, None]) -> Union[float, None]:
+    """Convert an interval such as 90, "90s", "15m", "1.5h" or "1d" to
+    seconds.
+
+    Returns:
+        float: Seconds, or None if the value is not a valid interval.
+    """
+
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value > 0 else None
+    if not isinstance(value, str):
+        return None
+    found = match(r"^\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*$", value.lower())
+    if found is None:
+        return None
+    seconds = float(found.group(1)) * UNITS[found.group(2)]
+    return seconds if seconds > 0 else None
+
+
+class Job(object):
+    """A dataplan scheduled for periodic runs.
+    """
+
+    def __init__(self, filepath: str, interval: float):
+        self.filepath = filepath
+        self.interval = interval
+        self.running = False
+        self.runs = 0
+        self.host, self.rate_limit = None, None
+
+
+class Scheduler(object):
+    """Runs every dataplan of a directory periodically.
+
+    Dataplans are kept in a priority queue ordered by their next due time.
+    The interval of a dataplan is read from "interval" in its "meta" or
+    "config" section. Due dataplans are dispatched to a bounded pool of
+    workers; when every worker is busy the scheduler waits instead of piling
+    up work, a dataplan still running when it becomes due again skips that
+    tick, and a dataplan is rescheduled only after its run completes. Random
+    jitter spreads runs sharing the same interval.
+
+    A due dataplan whose host is over its rate limit is pushed back until
+    the host accepts requests again, so its worker goes to dataplans of
+    other hosts meanwhile.
+    """
+
+    def __init__(self, directory: str, workers: int = 4,
+                 interval: float = 3600, jitter: float = 0.1,
+                 no_cache: bool = False, save: bool = False,
+                 rescan: float = 60, emit: Callable = print_json_line):
+        self.directory = directory
+        self.workers = max(1, workers)
+        self.interval = interval
+        self.jitter = jitter
+        self.no_cache = no_cache
+        self.save = save
+        self.rescan = rescan
+        self.emit = emit
+        self.jobs, self.queue, self.sequence = dict(), list(), count()
+        self.plans = DataplanStore()
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.slots = BoundedSemaphore(self.workers)
+        self.changed = Condition()
+        self.stopped = Event()
+        self.last_scan = 0
+
+    def job_interval(self, dataplan: dict) -> float:
+        for section in (Field.META, Field.CONFIG):
+            fields = dataplan.get(section)
+            if isinstance(fields, dict):
+                seconds = parse_interval(fields.get(Field.INTERVAL))
+                if seconds is not None:
+                    return seconds
+        return self.interval
+
+    def job_host(self, job: Job, dataplan: dict) -> None:
+        link, config = dataplan.get(Field.LINK), dataplan.get(Field.CONFIG)
+        parts = urlsplit(link) if isinstance(link, str) else None
+        job.host = parts.netloc if parts and parts.scheme in (
+            "http", "https") else None
+        if isinstance(config, dict):
+            job.rate_limit = config.get(Field.RATE_LIMIT)
+
+    def spread(self, interval: float) -> float:
+        return uniform(0, self.jitter * interval) if self.jitter > 0 else 0
+
+    def push(self, job: Job, due: float) -> None:
+        with self.changed:
+            heappush(self.queue, (due, next(self.sequence), job.filepath))
+            self.changed.notify()
+
+    def scan(self) -> None:
+        """Pick up new, changed and removed dataplans from the directory.
+        """
+
+        self.last_scan = time()
+        found = set()
+        for filepath in sorted(glob(path.join(self.directory, "*.json"))):
+            ok, dataplan = self.plans.load(filepath)
+            if not ok:
+                Log.warn("Skipping dataplan %s: %s", filepath, dataplan)
+                continue
+            found.add(filepath)
+            interval = self.job_interval(dataplan)
+            job = self.jobs.get(filepath)
+            if job is None:
+                job = self.jobs[filepath] = Job(filepath, interval)
+                Log.debug("Scheduling %s every %.1fs", filepath, interval)
+                self.push(job, self.last_scan + self.spread(interval))
+            elif job.interval != interval:
+                Log.debug("Rescheduling %s every %.1fs", filepath, interval)
+                job.interval = interval
+            self.job_host(job, dataplan)
+        for filepath in set(self.jobs) - found:
+            Log.debug("Unscheduling %s", filepath)
+            del self.jobs[filepath]
+        if Log.is_debug():
+            for host, window in sorted(Concurrency.snapshot().items()):
+                Log.debug("Concurrency of %s: %s", host, window)
+
+    def run(self) -> None:
+        """Dispatch due dataplans until stopped.
+        """
+
+        Log.info("Scheduling dataplans from %s with %d worker(s)",
+                 self.directory, self.workers)
+        self.scan()
+        while not self.stopped.is_set():
+            if time() - self.last_scan >= self.rescan:
+                self.scan()
+            with self.changed:
+                wait = self.rescan - (time() - self.last_scan)
+                if len(self.queue) > 0:
+                    wait = min(wait, self.queue[0][0] - time())
+                if wait > 0:
+                    self.changed.wait(wait)
+                    continue
+                if len(self.queue) == 0:
+                    continue
+                due, _, filepath = heappop(self.queue)
+            job = self.jobs.get(filepath)
+            if job is None:
+                continue
+            if job.running:
+                Log.warn("Dataplan %s is still running, skipping tick",
+                         filepath)
+                continue
+            if job.host is not None:
+                wait = RateLimiter.delay(job.host, job.rate_limit)
+                if wait > 0:
+                    self.push(job, time() + wait)
+                    continue
+            self.slots.acquire()
+            lag = time() - due
+            if lag > job.interval:
+                Log.warn("Scheduler lags %.1fs behind for %s", lag, filepath)
+            job.running = True
+            self.pool.submit(self.execute, job)
+
+    def execute(self, job: Job) -> None:
+        """Run one dataplan and reschedule it.
+        """
+
+        started = time()
+        try:
+            ok, dataplan = self.plans.load(job.filepath)
+            if not ok:
+                raise Exception(dataplan)
+            psr = HTMLParser(dataplan, no_cache=self.no_cache)
+            psr.run()
+            job.runs += 1
+            if self.save:
+                FileWriter(job.filepath).write(psr.get_dataplan())
+            self.emit({"dataplan": job.filepath,
+                       "records": psr.get_records()})
+        except Exception as e:
+            Log.error("Dataplan %s failed: %s", job.filepath, e)
+        finally:
+            job.running = False
+            self.slots.release()
+            if job.filepath in self.jobs:
+                due = max(started + job.interval, time())
+                self.push(job, due + self.spread(job.interval))
+
+    def stop(self) -> None:
+        self.stopped.set()
+        with self.changed:
+            self.changed.notify()
+
+    def close(self) -> None:
+        self.stop()
+        self.pool.shutdown(wait=True)
+
+
+def schedule(directory: str, workers: int = 4, no_cache: bool = False,
+             save: bool = False, silent: bool = False) -> None:
+    """Run the scheduler until interrupted.
+    """
+
+    if not path.isdir(directory):
+        raise SystemExit("Not a directory: {}".format(directory))
+    emit = (lambda data: None) if silent else print_json_line
+    scheduler = Scheduler(directory, workers, no_cache=no_cache, save=save,
+                          emit=emit)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        Log.info("Shutting down...")
+    finally:
+        scheduler.close()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Tuple
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from json import dumps, loads
+from os import path, getcwd, remove
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from hap import __version__
+from hap.log import Log
+from hap.api import extract
+from hap.cache import Cache
+from hap.error import DataplanError, FetchError, UnsupportedContentError
+from hap.reader import DataplanStore
+from hap.throttle import Concurrency
+from hap.proxy import ProxyManager
+from hap.util import DecimalEncoder
+
+
+class ExtractionHandler(BaseHTTPRequestHandler):
+    """JSON API of the extraction service.
+
+    POST /extract accepts an object with a "dataplan" (inline object or path
+    relative to the service root), an optional "html" source, an optional
+    "link" to overwrite the dataplan's link and an optional "no_cache" flag.
+    It responds with the extracted records and the errors of the run; a
+    run which could not complete responds with an error status. GET /health
+    reports liveness and GET /stats the concurrency windows of hosts and the
+    health of proxies.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt: str, *args):
+        Log.debug("serve: " + fmt, *args)
+
+    def reply(self, status: int, data: dict) -> None:
+        body = dumps(data, cls=DecimalEncoder, ensure_ascii=False)
+        body = body.encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/health":
+            return self.reply(200, {"status": "ok", "version": __version__})
+        if self.path.rstrip("/") == "/stats":
+            return self.reply(200, {"concurrency": Concurrency.snapshot(),
+                                    "proxies": ProxyManager.snapshot()})
+        self.reply(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/extract":
+            return self.reply(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = loads(self.rfile.read(length).decode("utf8"))
+        except Exception as e:
+            return self.reply(400, {"error": "Invalid JSON: {}".format(e)})
+        if not isinstance(request, dict):
+            return self.reply(400, {"error": "Request must be an object"})
+        future = self.server.pool.submit(self.server.extract, request)
+        status, data = future.result()
+        self.reply(status, data)
+
+
+class ExtractionService(object):
+    """Warm state shared by all requests of the extraction service.
+
+    Dataplans loaded by path are memoized, fetched pages stay in the
+    in-memory cache and extractions run in a bounded pool of workers.
+    """
+
+    statuses = (
+        # error,                  HTTP status
+        (UnsupportedContentError, 415),
+        (FetchError,              502),
+        (DataplanError,           422),
+    )
+
+    def __init__(self, root: str = None, workers: int = 4,
+                 no_cache: bool = False, memory: int = 256):
+        self.root = path.realpath(root or getcwd())
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.plans = DataplanStore()
+        self.no_cache = no_cache
+        Cache.keep_in_memory(memory)
+
+    def dataplan(self, reference) -> Tuple[bool, dict]:
+        """Resolve an inline dataplan or a path under the service root.
+        """
+
+        if isinstance(reference, dict):
+            return True, reference
+        if not isinstance(reference, str):
+            return False, "Dataplan must be an object or a filepath"
+        filepath = path.realpath(path.join(self.root, reference))
+        if path.commonpath([self.root, filepath]) != self.root:
+            return False, "Dataplan path is outside of service root"
+        return self.plans.load(filepath)
+
+    def extract(self, request: dict) -> Tuple[int, dict]:
+        """Run one extraction request.
+
+        Returns:
+            tuple: HTTP status code and response object.
+        """
+
+        ok, dataplan = self.dataplan(request.get("dataplan"))
+        if not ok:
+            return 400, {"error": dataplan}
+        source = request.get("html")
+        if source is not None and not isinstance(source, str):
+            return 400, {"error": "HTML source must be a string"}
+        link = request.get("link")
+        if link is not None:
+            link = str(link)
+        no_cache = bool(request.get("no_cache", self.no_cache))
+        try:
+            result = extract(dataplan, source, link, no_cache)
+        except Exception as e:
+            Log.error("Extraction failed: %s", e)
+            return 500, {"error": str(e)}
+        response = {
+            "records": result.records,
+            "errors": [str(e) for e in result.errors],
+        }
+        for error, status in self.statuses:
+            if isinstance(result.error, error):
+                response.update({"error": str(result.error)})
+                return status, response
+        return 200, response
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+
+
+class TCPExtractionServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class UnixExtractionServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = self.server_address, 0
+
+
+def create_server(address: str, service: ExtractionService) -> HTTPServer:
+    """Bind the extraction service to a TCP or Unix socket address.
+
+    Args:
+        address            (str): "host:port", ":port" or "unix:/path".
+        service (ExtractionService): Warm service state.
+
+    Returns:
+        server: Bound server, not yet serving.
+    """
+
+    if address.startswith("unix:"):
+        filepath = address[len("unix:"):]
+        if path.exists(filepath):
+            remove(filepath)
+        server = UnixExtractionServer(filepath, ExtractionHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = TCPExtractionServer((host or "127.0.0.1", int(port)),
+                                     ExtractionHandler)
+    server.pool = service.pool
+    server.extract = service.extract
+    return server
+
+
+def serve(address: str, workers: int = 4, no_cache: bool = False) -> None:
+    """Run the extraction service until interrupted.
+    """
+
+    service = ExtractionService(workers=workers, no_cache=no_cache)
+    server = create_server(address, service)
+    Log.info("Serving Hap! v%s on %s with %d worker(s)", __version__,
+             address, workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        Log.info("Shutting down...")
+    finally:
+        server.server_close()
+        service.close()
@@ -60,6 +60,73 @@ class Shell(object):
         cls.psr.add_argument("--silent",
                              help="suppress any output",
                              action="store_true")
+        cls.psr.add_argument("--timeout",
+                             help="default connect and read timeout",
+                             metavar="SECONDS",
+                             type=float,
+                             action="store")
+        cls.psr.add_argument("--retries",
+                             help="default retries of failed requests",
+                             metavar="N",
+                             type=int,
+                             action="store")
+        cls.psr.add_argument("--rate-limit",
+                             help="default requests per second per host",
+                             metavar="RPS",
+                             type=float,
+                             action="store")
+        cls.psr.add_argument("--max-body",
+                             help="default maximum size of a page",
+                             metavar="BYTES",
+                             type=int,
+                             action="store")
+        cls.psr.add_argument("--stream",
+                             help="parse pages while downloading them",
+                             action="store_true")
+        cls.psr.add_argument("--serve",
+                             help="run extraction service on host:port "
+                                  "or unix:/path",
+                             metavar="ADDRESS",
+                             action="store")
+        cls.psr.add_argument("--schedule",
+                             help="periodically run dataplans from directory",
+                             metavar="DIRECTORY",
+                             action="store")
+        cls.psr.add_argument("--warc",
+                             help="run dataplan over the responses of a "
+                                  "WARC archive",
+                             metavar="FILE",
+                             action="store")
+        cls.psr.add_argument("--corpus",
+                             help="run dataplan over the documents of a "
+                                  "directory, tar or zip archive",
+                             metavar="PATH",
+                             action="store")
+        cls.psr.add_argument("--sitemap",
+                             help="run dataplan over the links of a sitemap "
+                                  "or sitemap index",
+                             metavar="URL",
+                             action="store")
+        cls.psr.add_argument("--since",
+                             help="only use sitemap links modified since a "
+                                  "date (default: last run)",
+                             metavar="DATE",
+                             action="store")
+        cls.psr.add_argument("--match",
+                             help="only use links or paths matching a "
+                                  "regex",
+                             metavar="REGEX",
+                             action="store")
+        cls.psr.add_argument("--mime",
+                             help="only use archived responses of a MIME "
+                                  "type (repeatable)",
+                             metavar="TYPE",
+                             action="append")
+        cls.psr.add_argument("--workers",
+                             help="number of extraction workers",
+                             type=int,
+                             default=4,
+                             action="store")
         cls.psr.add_argument("--version",
                              help="print version number",
                              action="store_true")
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Any, Iterator, Tuple, Union
+
+from datetime import datetime, timedelta, timezone
+from gzip import GzipFile
+from json import dumps, loads
+from re import compile
+from urllib.parse import urlsplit
+
+from lxml import etree
+
+from hap.log import Log
+from hap.cache import Cache
+from hap.client import Client
+from hap.error import FetchError
+
+
+class Sitemap(object):
+    """Streaming reader of sitemaps and sitemap indexes.
+
+    Sitemaps are parsed incrementally and every entry is dropped once
+    read, so sitemaps of any size are read in constant memory; gzipped
+    sitemaps are decompressed on the fly. The sitemaps of an index are
+    read one after another, skipping those not modified since the given
+    time, and only links modified since then (or without a "lastmod") are
+    returned.
+
+    The time of the last complete run over a sitemap is kept in the cache
+    directory, so the next run can start from it. Child sitemaps that
+    cannot be read are skipped and collected in failures, as such a run
+    is not complete.
+    """
+
+    GZIP_MAGIC = b"\x1f\x8b"
+    FILE_PROTOCOL = "file://"
+    W3C_DATETIME = compile(r"(\d{4})(?:-(\d{2})(?:-(\d{2})(?:T(\d{2}):(\d{2})"
+                           r"(?::(\d{2})(?:\.(\d+))?)?"
+                           r"(Z|[+-]\d{2}:?\d{2})?)?)?)?$")
+
+    max_depth = 4
+    state_file = "sitemaps.json"
+
+    def __init__(self, location: str, since: float = None,
+                 headers: dict = None, timeouts: Tuple[float, float] = None):
+        self.location = location
+        self.since = since
+        self.headers = headers or dict()
+        self.timeouts = timeouts
+        self.failures = list()
+
+    @classmethod
+    def lastmod(cls, value: str) -> Union[float, None]:
+        """Timestamp of a W3C datetime, from "2018" or "2018-05" to
+        "2018-05-01T10:30:00.5+02:00", None if invalid. Missing parts are
+        the earliest possible, and times without a timezone are in UTC.
+        """
+
+        found = cls.W3C_DATETIME.match((value or "").strip())
+        if found is None:
+            return None
+        year, month, day, hour, minute, second, fraction, zone = \
+            found.groups()
+        tz = timezone.utc
+        if zone is not None and zone != "Z":
+            sign = -1 if zone[0] == "-" else 1
+            offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[-2:]))
+            tz = timezone(sign * offset)
+        try:
+            moment = datetime(int(year), int(month or 1), int(day or 1),
+                              int(hour or 0), int(minute or 0),
+                              int(second or 0),
+                              int((fraction or "0")[:6].ljust(6, "0")), tz)
+        except ValueError:
+            return None
+        return moment.timestamp()
+
+    @classmethod
+    def state(cls) -> dict:
+        try:
+            with open(Cache.file_path(cls.state_file), "rb") as fd:
+                state = loads(fd.read().decode("utf8"))
+        except (OSError, ValueError):
+            return dict()
+        return state if isinstance(state, dict) else dict()
+
+    @classmethod
+    def last_run(cls, location: str) -> Union[float, None]:
+        """Start time of the last complete run over a sitemap, if any.
+        """
+
+        return cls.state().get(location)
+
+    @classmethod
+    def save_run(cls, location: str, started: float) -> None:
+        state = cls.state()
+        state[location] = started
+        Cache.commit(Cache.file_path(cls.state_file),
+                     dumps(state, sort_keys=True).encode("utf8"))
+
+    def open(self, location: str) -> Any:
+        """Stream of a local or remote sitemap.
+        """
+
+        if location.startswith(self.FILE_PROTOCOL):
+            return open(location[len(self.FILE_PROTOCOL):], "rb")
+        if urlsplit(location).scheme in ("http", "https"):
+            from urllib.request import Request
+            request = Request(location, headers=self.headers)
+            return Client.open(request, self.timeouts)
+        return open(location, "rb")
+
+    def decompress(self, stream: Any) -> Any:
+        """Decompress a stream on the fly if it is gzipped.
+        """
+
+        if stream.peek(2)[:2] == self.GZIP_MAGIC:
+            return GzipFile(fileobj=stream, mode="rb")
+        return stream
+
+    def parse(self, location: str) -> Iterator[Tuple[str, str, Any]]:
+        """Iterate over the ("url" or "sitemap", loc, lastmod) entries of a
+        sitemap or sitemap index.
+        """
+
+        with self.open(location) as raw, self.decompress(raw) as stream:
+            events = etree.iterparse(stream, events=("end",),
+                                     resolve_entities=False, no_network=True)
+            for _, element in events:
+                kind = etree.QName(element).localname
+                if kind not in ("url", "sitemap"):
+                    continue
+                fields = {etree.QName(e).localname: (e.text or "").strip()
+                          for e in element if isinstance(e.tag, str)}
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+                if fields.get("loc"):
+                    yield kind, fields["loc"], self.lastmod(
+                        fields.get("lastmod"))
+
+    def modified(self, lastmod: Union[float, None]) -> bool:
+        return self.since is None or lastmod is None or lastmod >= self.since
+
+    def read(self, location: str, depth: int = 0,
+             visited: set = None) -> Iterator[str]:
+        """Links of a sitemap, following the sitemaps of an index after the
+        index itself is read.
+
+        Raises:
+            FetchError: If the sitemap cannot be read.
+        """
+
+        visited = visited if visited is not None else set()
+        visited.add(location)
+        children = list()
+        try:
+            for kind, loc, lastmod in self.parse(location):
+                if not self.modified(lastmod):
+                    continue
+                if kind == "url":
+                    yield loc
+                elif loc not in visited:
+                    children.append(loc)
+        except (OSError, EOFError, etree.XMLSyntaxError) as e:
+            raise FetchError("Cannot read sitemap {}: {}".format(
+                location, e), location)
+        for child in children:
+            if depth >= self.max_depth:
+                Log.warn("Sitemap %s is nested too deep", child)
+                break
+            try:
+                yield from self.read(child, depth + 1, visited)
+            except FetchError as e:
+                Log.error("%s", e)
+                self.failures.append(e)
+
+    def links(self, match: str = None) -> Iterator[str]:
+        """Modified links of the sitemap, optionally matching a regex.
+        """
+
+        pattern = compile(match) if match else None
+        for link in self.read(self.location):
+            if pattern is None or pattern.search(link):
+                yield link
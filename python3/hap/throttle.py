@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Any, Tuple, Union
+
+from threading import Condition, Lock
+from time import monotonic, sleep
+
+from hap.log import Log
+
+
+class TokenBucket(object):
+    """Token bucket allowing rate requests per second in bursts of up to
+    burst requests.
+
+    Reservations may drive the bucket into debt, so concurrent callers are
+    handed consecutive slots instead of racing for the next token.
+    """
+
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate, self.burst = float(rate), max(1.0, float(burst))
+        self.tokens, self.stamp = self.burst, monotonic()
+        self.lock = Lock()
+
+    def update(self, rate: float, burst: float = 1) -> None:
+        """Change the rate and burst, keeping the tokens left.
+        """
+
+        with self.lock:
+            self.refill(monotonic())
+            self.rate, self.burst = float(rate), max(1.0, float(burst))
+            self.tokens = min(self.burst, self.tokens)
+
+    def refill(self, now: float) -> None:
+        elapsed, self.stamp = now - self.stamp, now
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it.
+        """
+
+        with self.lock:
+            self.refill(monotonic())
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def delay(self) -> float:
+        """Seconds until a token is available, without taking it.
+        """
+
+        with self.lock:
+            self.refill(monotonic())
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class RateLimiter(object):
+    """Per-host request rate limits.
+
+    Each host gets its own token bucket, so a slow limit on one site never
+    holds back requests to other sites. The default rate applies to hosts
+    of dataplans without a "rate_limit" of their own; None means unlimited.
+    """
+
+    rate, burst = None, 1
+    buckets, lock = dict(), Lock()
+
+    @classmethod
+    def settings(cls, value: Any = None) -> Tuple[Union[float, None], float]:
+        """Rate and burst from a dataplan "rate_limit" value.
+
+        Args:
+            value (mixt): Requests per second, or a map with "rate" and
+                          "burst"; missing values use the defaults.
+
+        Returns:
+            tuple: Requests per second (None if unlimited) and burst.
+        """
+
+        rate, burst = cls.rate, cls.burst
+        if isinstance(value, dict):
+            rate = value.get("rate", rate)
+            burst = value.get("burst", burst)
+        elif value is not None and not isinstance(value, bool):
+            rate = value
+        try:
+            rate = float(rate) if rate is not None else None
+            burst = max(1.0, float(burst))
+        except (TypeError, ValueError):
+            Log.warn("Ignoring invalid rate_limit: %s", value)
+            return cls.settings()
+        if rate is not None and rate <= 0:
+            rate = None
+        return rate, burst
+
+    @classmethod
+    def bucket(cls, host: str, value: Any = None) -> Union[TokenBucket, None]:
+        """Token bucket of a host, None if the host is not limited.
+
+        A host keeps a single bucket: a different rate or burst updates it
+        without refilling it, so switching limits never hands out a fresh
+        burst.
+        """
+
+        rate, burst = cls.settings(value)
+        with cls.lock:
+            bucket = cls.buckets.get(host)
+            if rate is None:
+                return None
+            if bucket is None:
+                bucket = cls.buckets[host] = TokenBucket(rate, burst)
+            elif (bucket.rate, bucket.burst) != (rate, burst):
+                bucket.update(rate, burst)
+        return bucket
+
+    @classmethod
+    def acquire(cls, host: str, value: Any = None) -> float:
+        """Wait until a request to the host is allowed.
+
+        Returns:
+            float: Seconds waited.
+        """
+
+        bucket = cls.bucket(host, value)
+        wait = bucket.reserve() if bucket is not None else 0.0
+        if wait > 0:
+            if __debug__:
+                Log.debug("Throttling %s for %.2fs", host, wait)
+            sleep(wait)
+        return wait
+
+    @classmethod
+    def delay(cls, host: str, value: Any = None) -> float:
+        """Seconds until a request to the host would be allowed.
+        """
+
+        bucket = cls.bucket(host, value)
+        return bucket.delay() if bucket is not None else 0.0
+
+
+class AdaptiveWindow(object):
+    """AIMD limit of the requests in flight to one host.
+
+    While latency stays close to the fastest response seen, every completed
+    request of a fully used window grows it by 1/window, roughly one request
+    per round trip. A 429, 5xx, timeout or connection failure, or a smoothed
+    latency grown past tolerance times the baseline, halves the window, at
+    most once per round trip.
+    """
+
+    initial, minimum, maximum = 4.0, 1.0, 64.0
+    decrease, tolerance, slack, smoothing = 0.5, 2.0, 0.05, 0.2
+    congestion = ("429", "5xx", "timeout", "connection")
+
+    def __init__(self, host: str, initial: float = None,
+                 minimum: float = None, maximum: float = None):
+        self.host = host
+        if minimum is not None:
+            self.minimum = max(1.0, float(minimum))
+        if maximum is not None:
+            self.maximum = max(self.minimum, float(maximum))
+        initial = self.initial if initial is None else float(initial)
+        self.window = min(self.maximum, max(self.minimum, initial))
+        self.in_flight, self.baseline, self.latency = 0, None, None
+        self.decreased_at = 0.0
+        self.changed = Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self.window)
+
+    def acquire(self) -> None:
+        """Wait for a free slot of the window and take it.
+        """
+
+        with self.changed:
+            while self.in_flight >= self.limit:
+                self.changed.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, failure: Union[str, None] = None):
+        """Free a slot and adapt the window to the outcome of its request.
+
+        Args:
+            latency (float): Seconds the request took.
+            failure   (str): Failure class, None on success.
+        """
+
+        with self.changed:
+            busy = self.in_flight >= self.limit
+            self.in_flight -= 1
+            if failure in self.congestion:
+                self.shrink()
+            elif failure is None:
+                self.observe(latency)
+                if self.latency > self.baseline * self.tolerance + self.slack:
+                    self.shrink()
+                elif busy:
+                    self.window = min(self.maximum,
+                                      self.window + 1.0 / self.window)
+            self.changed.notify_all()
+
+    def observe(self, latency: float) -> None:
+        if self.baseline is None:
+            self.baseline = self.latency = latency
+            return
+        self.baseline = min(latency, self.baseline * 1.01)
+        self.latency += self.smoothing * (latency - self.latency)
+
+    def shrink(self) -> None:
+        now = monotonic()
+        if now - self.decreased_at < (self.latency or 0.0):
+            return
+        self.decreased_at = now
+        self.window = max(self.minimum, self.window * self.decrease)
+        if __debug__:
+            Log.debug("Concurrency of %s backs off to %d", self.host,
+                      self.limit)
+
+    def snapshot(self) -> dict:
+        return {
+            "window": round(self.window, 2),
+            "in_flight": self.in_flight,
+            "latency": self.latency,
+            "baseline": self.baseline,
+        }
+
+
+class Concurrency(object):
+    """Registry of the adaptive concurrency windows of hosts.
+    """
+
+    windows, lock = dict(), Lock()
+
+    @classmethod
+    def window(cls, host: str, value: Any = None) -> AdaptiveWindow:
+        """Shared window of a host, created on first use.
+
+        Args:
+            host (str): Network location of the host.
+            value (mixt): Dataplan "concurrency": a fixed number of requests
+                          in flight, or a map with "initial", "min" and
+                          "max".
+        """
+
+        with cls.lock:
+            window = cls.windows.get(host)
+            if window is None:
+                if isinstance(value, dict):
+                    window = AdaptiveWindow(host, value.get("initial"),
+                                            value.get("min"),
+                                            value.get("max"))
+                elif isinstance(value, (int, float)) \
+                        and not isinstance(value, bool) and value >= 1:
+                    window = AdaptiveWindow(host, value, value, value)
+                else:
+                    window = AdaptiveWindow(host)
+                cls.windows[host] = window
+        return window
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        """Current window of every host, for observability.
+        """
+
+        with cls.lock:
+            windows = list(cls.windows.items())
+        return {host: window.snapshot() for host, window in windows}
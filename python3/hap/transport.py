@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from functools import partial
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.request import HTTPHandler, HTTPSHandler
+
+
+class TimeoutHTTPConnection(HTTPConnection):
+    """HTTP connection with distinct connect and read timeouts.
+
+    The timeout given by urllib bounds the connect; once connected, the
+    socket switches to the read timeout, which bounds every read including
+    the wait for the response headers.
+    """
+
+    def __init__(self, *args, read_timeout: float = None, **kwargs):
+        super(TimeoutHTTPConnection, self).__init__(*args, **kwargs)
+        self.read_timeout = read_timeout
+
+    def connect(self):
+        super(TimeoutHTTPConnection, self).connect()
+        if self.read_timeout is not None:
+            self.sock.settimeout(self.read_timeout)
+
+
+class TimeoutHTTPSConnection(HTTPSConnection):
+    """HTTPS counterpart of TimeoutHTTPConnection.
+    """
+
+    def __init__(self, *args, read_timeout: float = None, **kwargs):
+        super(TimeoutHTTPSConnection, self).__init__(*args, **kwargs)
+        self.read_timeout = read_timeout
+
+    def connect(self):
+        super(TimeoutHTTPSConnection, self).connect()
+        if self.read_timeout is not None:
+            self.sock.settimeout(self.read_timeout)
+
+
+class TimeoutHTTPHandler(HTTPHandler):
+
+    def __init__(self, read_timeout: float = None):
+        super(TimeoutHTTPHandler, self).__init__()
+        self.read_timeout = read_timeout
+
+    def http_open(self, req):
+        return self.do_open(partial(TimeoutHTTPConnection,
+                                    read_timeout=self.read_timeout), req)
+
+
+class TimeoutHTTPSHandler(HTTPSHandler):
+
+    def __init__(self, read_timeout: float = None):
+        super(TimeoutHTTPSHandler, self).__init__()
+        self.read_timeout = read_timeout
+
+    def https_open(self, req):
+        return self.do_open(partial(TimeoutHTTPSConnection,
+                                    read_timeout=self.read_timeout), req,
+                            context=self._context)
@@ -55,3 +55,16 @@ def print_json(data: dict, retval: bool = False) -> Union[str, None]:
     if retval:
         return json_data
     print(json_data)
+
+
+def print_json_line(data: dict, retval: bool = False) -> Union[str, None]:
+    """Outputs compact single-line JSON, e.g. for NDJSON streams.
+
+    If retval is set to True, it returns output instead of printing.
+    """
+
+    json_data = dumps(data, cls=DecimalEncoder, sort_keys=True,
+                      ensure_ascii=False)
+    if retval:
+        return json_data
+    print(json_data, flush=True)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from typing import Iterator, Tuple, Union
+
+from email.parser import BytesHeaderParser
+from gzip import GzipFile
+from re import compile
+from zlib import decompress, MAX_WBITS
+
+from hap.log import Log
+
+
+class Record(object):
+    """A WARC record: its type, target URI, headers and content block.
+    """
+
+    def __init__(self, headers: dict, block: bytes):
+        self.headers = headers
+        self.block = block
+
+    @property
+    def type(self) -> str:
+        return self.headers.get("warc-type", "")
+
+    @property
+    def target(self) -> str:
+        return self.headers.get("warc-target-uri", "").strip("<>")
+
+
+class Response(object):
+    """HTTP response archived in a WARC response record.
+    """
+
+    def __init__(self, url: str, status: int, headers, body: bytes):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def mimetype(self) -> str:
+        return self.headers.get_content_type() \
+            if "Content-Type" in self.headers else ""
+
+    @property
+    def charset(self) -> Union[str, None]:
+        return self.headers.get_content_charset()
+
+
+class WARCReader(object):
+    """Streaming reader of WARC files.
+
+    Records are read one at a time, so archives of any size are processed
+    in constant memory. Compressed archives are read gzip member by member,
+    as written by crawlers ("record at time" compression).
+    """
+
+    GZIP_MAGIC = b"\x1f\x8b"
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+
+    def open(self):
+        with open(self.filepath, "rb") as fd:
+            compressed = fd.read(2) == self.GZIP_MAGIC
+        if compressed:
+            return GzipFile(self.filepath, "rb")
+        return open(self.filepath, "rb")
+
+    def records(self) -> Iterator[Record]:
+        """Iterate over the records of the archive.
+
+        A record without a valid length is skipped, along with everything
+        up to the next record.
+
+        Raises:
+            ValueError: If the archive is malformed.
+        """
+
+        with self.open() as stream:
+            resync = False
+            while True:
+                line = stream.readline()
+                if not line:
+                    return
+                if not line.strip():
+                    continue
+                if not line.startswith(b"WARC/"):
+                    if resync:
+                        continue
+                    raise ValueError("Not a WARC record: {!r}".format(
+                        line[:40]))
+                resync, headers = False, dict()
+                for line in iter(stream.readline, b""):
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("utf8", "replace") \
+                        .partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    Log.warn("Skipping WARC record without a valid length: "
+                             "%s", headers.get("warc-target-uri", ""))
+                    resync = True
+                    continue
+                block = stream.read(length)
+                if len(block) != length:
+                    raise ValueError("Truncated WARC record")
+                yield Record(headers, block)
+
+    def responses(self, match: str = None,
+                  mimetypes: Tuple[str, ...] = None,
+                  successful: bool = True) -> Iterator[Response]:
+        """Iterate over the HTTP responses of the archive.
+
+        Args:
+            match       (str): Regular expression the URL must contain.
+            mimetypes (tuple): Accepted MIME types, all if empty.
+            successful (bool): Only 2xx responses, skipping redirects and
+                               error pages.
+        """
+
+        pattern = compile(match) if match else None
+        for record in self.records():
+            if record.type != "response":
+                continue
+            if not record.headers.get("content-type", "").startswith(
+                    "application/http"):
+                continue
+            if pattern is not None and not pattern.search(record.target):
+                continue
+            response = self.parse_http(record)
+            if response is None:
+                continue
+            if successful and not 200 <= response.status < 300:
+                continue
+            if mimetypes and response.mimetype not in mimetypes:
+                continue
+            yield response
+
+    def documents(self, match: str = None,
+                  mimetypes: Tuple[str, ...] = None) \
+            -> Iterator[Tuple[str, bytes, str]]:
+        """Iterate over (URL, body, charset) of the archived responses, as
+        expected by the batch runner.
+        """
+
+        for response in self.responses(match, mimetypes):
+            yield response.url, response.body, response.charset
+
+    @classmethod
+    def parse_http(cls, record: Record) -> Union[Response, None]:
+        """Split an archived HTTP response into status, headers and body.
+
+        Chunked transfer encoding and gzip or deflate content encodings are
+        undone, so the body is the document as served.
+        """
+
+        head, sep, body = record.block.partition(b"\r\n\r\n")
+        if not sep:
+            return None
+        status_line, _, header_lines = head.partition(b"\r\n")
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/") \
+                or not parts[1].isdigit():
+            return None
+        headers = BytesHeaderParser().parsebytes(header_lines + b"\r\n")
+        try:
+            if "chunked" in headers.get("Transfer-Encoding", "").lower():
+                body = cls.dechunk(body)
+            encoding = headers.get("Content-Encoding", "").lower()
+            if encoding in ("gzip", "x-gzip"):
+                body = decompress(body, 16 + MAX_WBITS)
+            elif encoding == "deflate":
+                body = decompress(body)
+        except Exception:
+            return None
+        return Response(record.target, int(parts[1]), headers, body)
+
+    @classmethod
+    def dechunk(cls, body: bytes) -> bytes:
+        chunks, offset = list(), 0
+        while offset < len(body):
+            end = body.index(b"\r\n", offset)
+            size = int(body[offset:end].split(b";")[0], 16)
+            if size == 0:
+                break
+            chunks.append(body[end + 2:end + 2 + size])
+            offset = end + 2 + size + 2
+        return b"".join(chunks)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from os import remove
+from unittest import TestCase
+
+import hap
+
+from hap.error import HapError, DataplanError, FetchError, ExtractionError
+from hap.writer import FileWriter
+
+
+HTMLDATA = r"""
+<html>
+<body>
+<h1>Hap!</h1>
+<span class="price">not a number</span>
+</body>
+</html>
+"""
+
+DATAPLAN = {
+    "declare": {
+        "title": "string",
+        "price": "integer"
+    },
+    "define": [
+        {
+            "title": {
+                "query": "h1"
+            }
+        },
+        {
+            "price": {
+                "query": ".price"
+            }
+        }
+    ]
+}
+
+
+class TestAPI(TestCase):
+
+    def test_extract_source(self):
+        result = hap.extract(DATAPLAN, source=HTMLDATA)
+        self.assertEqual(result.records.get("title"), "Hap!")
+        self.assertIsNone(result.records.get("price"))
+        self.assertFalse(result.ok)
+        self.assertIsInstance(result.error, ExtractionError)
+        self.assertEqual(result.error.key, "price")
+        with self.assertRaises(ExtractionError):
+            result.raise_for_error()
+
+    def test_extract_dataplan_path(self):
+        FileWriter("/tmp/.hap.plan.json").write(DATAPLAN)
+        result = hap.extract("/tmp/.hap.plan.json", source=HTMLDATA)
+        self.assertEqual(result.records.get("title"), "Hap!")
+        remove("/tmp/.hap.plan.json")
+        result = hap.extract("/tmp/.hap.missing.json")
+        self.assertIsInstance(result.error, DataplanError)
+
+    def test_invalid_dataplan(self):
+        result = hap.extract({"declare": {}}, source=HTMLDATA)
+        self.assertIsInstance(result.error, DataplanError)
+        self.assertIn("define", str(result.error))
+        result = hap.extract(DATAPLAN, link="ftp://localhost/")
+        self.assertIsInstance(result.error, DataplanError)
+
+    def test_fetch_error(self):
+        result = hap.extract(DATAPLAN, link="file:///tmp/.hap.missing.html")
+        self.assertIsInstance(result.error, FetchError)
+        self.assertIsInstance(result.error, HapError)
+        self.assertEqual(result.error.link, "file:///tmp/.hap.missing.html")
+        self.assertEqual(result.records, {})
+
+    def test_unparsable_source(self):
+        for source in ("", b"", "<!-- comment -->", b"  \n"):
+            result = hap.extract(DATAPLAN, source=source)
+            self.assertIsInstance(result.error, FetchError)
+            self.assertIn("Cannot parse document", str(result.error))
+        open("/tmp/.hap.empty.html", "w").close()
+        result = hap.extract(DATAPLAN, link="file:///tmp/.hap.empty.html",
+                             no_cache=True)
+        remove("/tmp/.hap.empty.html")
+        self.assertIsInstance(result.error, FetchError)
+
+    def test_extract_encoding(self):
+        result = hap.extract(DATAPLAN, source="<h1>Š</h1>".encode(
+            "iso-8859-2"), encoding="iso-8859-2")
+        self.assertEqual(result.records.get("title"), "Š")
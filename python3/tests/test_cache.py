@@ -20,8 +20,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from os import remove
+from os import remove, listdir
 from shutil import rmtree
+from threading import Thread
 from unittest import TestCase
 
 from hap.cache import Cache
@@ -33,6 +34,10 @@ class TestCache(TestCase):
         filename = "github_com_lexndru_hap"
         cache_file = Cache.get_file("http://github.com/lexndru/hap")
         self.assertEqual(cache_file, filename)
+        pages = {Cache.get_file("http://github.com/lexndru/hap?page={}"
+                                .format(page)) for page in range(3)}
+        self.assertEqual(len(pages), 3)
+        self.assertTrue(all(p.startswith(filename + "_q") for p in pages))
 
     def test_file_friendly(self):
         bad_filename = "~!bad@#$%^filename&*()1234567890"
@@ -70,3 +75,54 @@ class TestCache(TestCase):
         self.assertFalse(ok)
         self.assertEqual(data, "empty file")
         remove("/tmp/.hap.tmp")
+
+    def test_checksum(self):
+        Cache.directory = ".cache_test"
+        link = "http://github.com/lexndru/hap"
+        success, _ = Cache.write_link(link, b"<html>hap</html>")
+        self.assertTrue(success)
+        success, data = Cache.read_link(link)
+        self.assertTrue(success)
+        self.assertEqual(data, b"<html>hap</html>")
+        filepath = Cache.file_path(Cache.get_file(link))
+        with open(filepath, "rb") as fd:
+            raw = fd.read()
+        with open(filepath, "wb") as fd:
+            fd.write(raw[:-3])
+        success, data = Cache.read_link(link)
+        self.assertFalse(success)
+        self.assertEqual(data, "checksum mismatch")
+        with open(filepath, "wb") as fd:
+            fd.write(raw.replace(b"hap", b"pah"))
+        success, data = Cache.read_link(link)
+        self.assertFalse(success)
+        self.assertEqual(data, "checksum mismatch")
+        with open(filepath, "w") as fd:
+            fd.write("<html>no header</html>")
+        success, data = Cache.read_link(link)
+        self.assertFalse(success)
+        self.assertEqual(data, "missing cache header")
+        rmtree(Cache.directory)
+
+    def test_concurrent_write_read(self):
+        Cache.directory = ".cache_test"
+        link, errors = "http://github.com/lexndru/hap", []
+        pages = ["<html>{}</html>".format(str(n) * 50000) for n in range(4)]
+
+        def writer(page):
+            for _ in range(20):
+                Cache.write_link(link, page)
+
+        def reader():
+            for _ in range(50):
+                ok, data = Cache.read_link(link)
+                if ok and data not in pages:
+                    errors.append(data[:32])
+        threads = [Thread(target=writer, args=(p,)) for p in pages]
+        threads += [Thread(target=reader) for _ in range(4)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        self.assertEqual(errors, [])
+        self.assertEqual(listdir(Cache.directory),
+                         [Cache.get_file(link)])
+        rmtree(Cache.directory)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from codecs import BOM_UTF8, BOM_UTF16_LE
+from unittest import TestCase
+
+from hap.charset import Charset
+
+
+class TestCharset(TestCase):
+
+    def test_byte_order_mark(self):
+        self.assertEqual(Charset.detect(BOM_UTF8 + b"<p>x</p>", "koi8-r"),
+                         "utf-8")
+        self.assertEqual(Charset.detect(BOM_UTF16_LE + "<p>".encode(
+            "utf-16-le")), "utf-16")
+
+    def test_declared_before_meta(self):
+        page = b'<meta charset="iso-8859-2"><p>\xe9</p>'
+        self.assertEqual(Charset.detect(page, "koi8-r"), "koi8-r")
+        self.assertEqual(Charset.detect(page), "iso-8859-2")
+        self.assertEqual(Charset.detect(page, "bogus"), "iso-8859-2")
+
+    def test_http_equiv(self):
+        page = b'<meta http-equiv="Content-Type" ' \
+               b'content="text/html; charset=Shift_JIS">'
+        self.assertEqual(Charset.detect(page), "shift_jis")
+
+    def test_sniff_is_bounded(self):
+        page = b" " * Charset.sniff_size + b'<meta charset="koi8-r">\xe9'
+        self.assertEqual(Charset.detect(page), "utf-8")
+
+    def test_fallback(self):
+        self.assertEqual(Charset.detect("<p>é</p>".encode("utf8")), "utf-8")
+        self.assertEqual(Charset.detect(b"<p>\xe9</p>"), "windows-1252")
+        cut = "<p>é</p>".encode("utf8")[:4]
+        self.assertEqual(Charset.detect(cut), "utf-8")
+
+    def test_names(self):
+        self.assertEqual(Charset.name("ISO-8859-1"), "windows-1252")
+        self.assertEqual(Charset.name(" UTF-8 "), "utf-8")
+        self.assertIsNotNone(Charset.name("euc_jp"))
+        self.assertIsNone(Charset.name("bogus"))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from unittest import TestCase
+
+from benchmarks.compare import Comparison, OK, REGRESSION, IMPROVEMENT, \
+    MISSING, NEW, NOISY
+
+
+def report(**benchmarks):
+    return {"benchmarks": {
+        name: {"group": name.split(".")[0], "samples": samples}
+        for name, samples in benchmarks.items()
+    }}
+
+
+STABLE = [1.00, 1.01, 0.99, 1.02, 1.00, 0.98, 1.01]
+SLOWER = [1.30, 1.31, 1.29, 1.32, 1.30, 1.28, 1.31]
+FASTER = [0.50, 0.51, 0.49, 0.52, 0.50, 0.48, 0.51]
+
+
+class TestCompare(TestCase):
+
+    def status(self, base, cand, **kwargs):
+        cmp = Comparison(report(**{"parser.run": base}),
+                         report(**{"parser.run": cand}), **kwargs)
+        return cmp.rows()[0][1]
+
+    def test_stable(self):
+        self.assertEqual(OK, self.status(STABLE, list(reversed(STABLE))))
+
+    def test_regression(self):
+        self.assertEqual(REGRESSION, self.status(STABLE, SLOWER))
+
+    def test_improvement(self):
+        self.assertEqual(IMPROVEMENT, self.status(STABLE, FASTER))
+
+    def test_noise_is_tolerated(self):
+        noisy = [1.0, 1.5, 0.7, 1.4, 0.8, 1.3, 0.9]
+        self.assertEqual(OK, self.status(noisy, [s * 1.12 for s in noisy]))
+
+    def test_min_repeat(self):
+        self.assertEqual(NOISY, self.status(STABLE[:3], SLOWER[:3]))
+
+    def test_failed(self):
+        base = report(**{"parser.a": STABLE, "cache.b": STABLE,
+                         "fetch.c": STABLE})
+        cand = report(**{"parser.a": STABLE, "cache.b": SLOWER,
+                         "parser.d": STABLE})
+        cmp = Comparison(base, cand)
+        rows = {row[0]: row[1] for row in cmp.rows()}
+        self.assertEqual(rows, {"parser.a": OK, "cache.b": REGRESSION,
+                                "fetch.c": MISSING, "parser.d": NEW})
+        self.assertTrue(cmp.failed(cmp.rows()))
+        cmp = Comparison(base, cand, groups=["parser"])
+        self.assertFalse(cmp.failed(cmp.rows()))
+        cmp = Comparison(base, cand, groups=["fetch"], strict=True)
+        self.assertTrue(cmp.failed(cmp.rows()))
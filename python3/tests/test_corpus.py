@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import tarfile
+
+from io import BytesIO
+from json import dumps, loads
+from os import makedirs, path
+from shutil import rmtree
+from subprocess import run, PIPE
+from sys import executable
+from tempfile import mkdtemp
+from unittest import TestCase
+from zipfile import ZipFile
+
+from hap.batch import Batch
+from hap.corpus import CorpusReader
+
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+DATAPLAN = {
+    "declare": {"title": "string"},
+    "define": [{"title": {"query": "h1"}}],
+}
+
+MEMBERS = {
+    "pages/a.html": "<h1>Ä</h1>".encode("utf8"),
+    "pages/b.htm": b"<meta charset='iso-8859-1'><h1>\xc4</h1>",
+    "pages/deep/c.xhtml": b"<h1>C</h1>",
+    "pages/style.css": b"h1 {}",
+}
+
+HTML = ("text/html", "application/xhtml+xml")
+
+
+class TestCorpus(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.tree = path.join(self.directory, "tree")
+        for name, data in MEMBERS.items():
+            filepath = path.join(self.tree, name)
+            makedirs(path.dirname(filepath), exist_ok=True)
+            with open(filepath, "wb") as fd:
+                fd.write(data)
+        self.tar = path.join(self.directory, "pages.tar.gz")
+        with tarfile.open(self.tar, "w:gz") as archive:
+            for name, data in MEMBERS.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, BytesIO(data))
+        self.zip = path.join(self.directory, "pages.zip")
+        with ZipFile(self.zip, "w") as archive:
+            archive.writestr("pages/", b"")
+            for name, data in MEMBERS.items():
+                archive.writestr(name, data)
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_members(self):
+        for location in (self.tar, self.zip):
+            members = dict(CorpusReader(location).members())
+            self.assertEqual(members, MEMBERS)
+        self.assertEqual(dict(CorpusReader(self.tree).members()), MEMBERS)
+
+    def test_documents(self):
+        for location in (self.tree, self.tar, self.zip):
+            reader = CorpusReader(location)
+            names = [n for n, _, _ in reader.documents(mimetypes=HTML)]
+            self.assertEqual(len(names), 3)
+            names = [n for n, _, _ in reader.documents(r"deep/")]
+            self.assertEqual(names, ["pages/deep/c.xhtml"])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            list(CorpusReader(path.join(self.directory, "none")).members())
+        broken = path.join(self.directory, "broken.tar")
+        with open(broken, "wb") as fd:
+            fd.write(b"not an archive")
+        with self.assertRaises(ValueError):
+            list(CorpusReader(broken).members())
+
+    def test_batch(self):
+        for workers in (1, 2):
+            documents = CorpusReader(self.tar).documents(mimetypes=HTML)
+            batch = Batch(DATAPLAN, workers, chunk_size=2, backlog=1)
+            titles = {r["link"]: r["records"]["title"]
+                      for r in batch.run(documents)}
+            self.assertEqual(titles, {"pages/a.html": "Ä",
+                                      "pages/b.htm": "Ä",
+                                      "pages/deep/c.xhtml": "C"})
+
+    def test_command_line(self):
+        script = "import sys; sys.argv[0] = 'hap'; " \
+                 "from hap.bootstrap import main; main()"
+        proc = run([executable, "-c", script, "--corpus", self.zip,
+                    "--match", r"\.html?$", "--workers", "2"],
+                   cwd=ROOT, stdout=PIPE, stderr=PIPE,
+                   input=dumps(DATAPLAN).encode("utf8"))
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        lines = [loads(line) for line in proc.stdout.decode().splitlines()]
+        self.assertEqual(sorted(r["link"] for r in lines),
+                         ["pages/a.html", "pages/b.htm"])
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from json import dumps, loads
+from os import path
+from shutil import rmtree
+from subprocess import run, PIPE
+from sys import executable
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from hap.cache import Cache
+from hap.crawl import BloomFilter, Crawler, Frontier, Pagination, crawl
+from hap.error import DataplanError
+
+from benchmarks.replay import Cassette, ReplayServer
+
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+SHOP = "http://shop/list?page={}"
+
+BLOG = "http://blog/page/{}"
+
+STORE = "http://store/list?page={}"
+
+PAGES = {
+    "index.html": """<a class="item" href="item1.html">1</a>
+        <a class="item" href="item2.html#reviews">2</a>
+        <a class="item" href="http://example.com/item.html">Out</a>
+        <a class="next" href="page2.html">Next</a>""",
+    "page2.html": """<a class="item" href="item3.html">3</a>
+        <a class="item" href="./item1.html">1</a>
+        <a class="next" href="index.html">First</a>""",
+    "item1.html": "<h1>One</h1>",
+    "item2.html": "<h1>Two</h1>",
+    "item3.html": "<h1>Three</h1><a class='item' href='item4.html'>4</a>",
+}
+
+
+class TestCrawl(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        for name, content in PAGES.items():
+            with open(path.join(self.directory, name), "w") as fd:
+                fd.write(content)
+        self.dataplan = {
+            "link": "file://" + path.join(self.directory, "index.html"),
+            "declare": {"title": "string"},
+            "define": [{"title": {"query": "h1"}}],
+            "crawl": {"next": "a.next", "follow": {"query": "a.item"}},
+        }
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def crawl(self, **settings) -> dict:
+        self.dataplan["crawl"].update(settings)
+        pages = Crawler(self.dataplan, workers=2).run()
+        return {path.basename(p["link"]): p for p in pages}
+
+    def test_crawl(self):
+        for _ in range(2):
+            pages = self.crawl()
+            self.assertEqual(sorted(pages), [
+                "index.html", "item1.html", "item2.html", "item3.html",
+                "page2.html"])
+            self.assertEqual(pages["page2.html"]["depth"], 0)
+            self.assertEqual(pages["item3.html"]["depth"], 1)
+            self.assertEqual(pages["item2.html"]["records"]["title"], "Two")
+            self.assertIsNone(pages["index.html"]["records"]["title"])
+
+    def test_limits(self):
+        pages = self.crawl(max_depth=2)
+        self.assertEqual(pages["item4.html"]["depth"], 2)
+        self.assertTrue(len(pages["item4.html"]["errors"]) > 0)
+        self.assertEqual(len(self.crawl(max_pages=3)), 3)
+        self.assertEqual(sorted(self.crawl(max_depth=0)),
+                         ["index.html", "page2.html"])
+
+    def test_bad_page(self):
+        with open(path.join(self.directory, "item2.html"), "w") as fd:
+            fd.write("")
+        pages = self.crawl()
+        self.assertEqual(len(pages), 5)
+        self.assertIn("Cannot parse document",
+                      pages["item2.html"]["errors"][0])
+
+    def test_bloom(self):
+        pages = self.crawl(bloom=1000)
+        self.assertEqual(len(pages), 5)
+        bloom = BloomFilter(100, 0.01)
+        for i in range(100):
+            bloom.add(str(i))
+        self.assertTrue(all(str(i) in bloom for i in range(100)))
+        misses = sum(1 for i in range(100, 1100) if str(i) in bloom)
+        self.assertLess(misses, 50)
+
+    def test_normalize(self):
+        self.assertEqual(Frontier.normalize("HTTP://Example.COM:80?b=2&a=1#t"),
+                         "http://example.com/?a=1&b=2")
+        self.assertEqual(Frontier.normalize("https://example.com:8443/a"),
+                         "https://example.com:8443/a")
+        self.assertIsNone(Frontier.normalize("mailto:me@example.com"))
+        self.assertIsNone(Frontier.normalize("javascript:void(0)"))
+        frontier = Frontier(max_pages=2)
+        self.assertTrue(frontier.add("http://example.com/", 0))
+        self.assertFalse(frontier.add("http://example.com/", 1))
+        self.assertTrue(frontier.add("http://example.com/a", 1))
+        self.assertFalse(frontier.add("http://example.com/b", 1))
+
+    def test_invalid(self):
+        self.dataplan["crawl"] = {"follow": {"match": "item"}}
+        with self.assertRaises(DataplanError):
+            crawl(self.dataplan)
+        self.dataplan["crawl"] = ["a"]
+        with self.assertRaises(DataplanError):
+            crawl(self.dataplan)
+        for settings in ({"max_depth": "2"}, {"max_pages": -1},
+                         {"prefetch": 1.5}, {"bloom": True},
+                         {"next": {"query_xpath": "//a["}},
+                         {"next": "a[", "follow": "a"},
+                         {"follow": {"query": "a", "match": "("}}):
+            self.dataplan["crawl"] = settings
+            with self.assertRaises(DataplanError):
+                crawl(self.dataplan)
+        self.dataplan["crawl"] = {"next": "a.next", "max_pages": None}
+        self.assertEqual(crawl(self.dataplan), (2, 0))
+
+    def test_command_line(self):
+        script = "import sys; sys.argv[0] = 'hap'; " \
+                 "from hap.bootstrap import main; main()"
+        proc = run([executable, "-c", script, "--no-cache"], cwd=ROOT,
+                   stdout=PIPE, stderr=PIPE,
+                   input=dumps(self.dataplan).encode("utf8"))
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        lines = [loads(line) for line in proc.stdout.decode().splitlines()]
+        self.assertEqual(len(lines), 5)
+
+
+class TestPrefetch(TestCase):
+
+    def setUp(self):
+        self.cassette = Cassette()
+        for number in (1, 2, 3):
+            listing = "<a class='item' href='/shop/item/{0}'>{0}</a>".format(
+                number)
+            if number < 3:
+                listing += "<a class='next' href='?page={}'>Next</a>".format(
+                    number + 1)
+            self.cassette.add(SHOP.format(number), listing)
+            if number == 3:
+                self.cassette.add(SHOP.format(4), listing)
+        for number in (1, 2):
+            self.cassette.add(BLOG.format(number), "<h1>Post</h1><a class="
+                              "'next' href='{}'>Next</a>".format(number + 1))
+        for number in (3, 4, 5):
+            self.cassette.add(BLOG.format(number), "<html></html>")
+        for number in range(1, 6):
+            self.cassette.add(STORE.format(number), "<h1>Page {}</h1><a "
+                              "class='next' href='?page={}'>Next</a>".format(
+                                  number, number + 1))
+        self.dataplan = {
+            "declare": {"title": "string"},
+            "define": [{"title": {"query": "h1"}}],
+            "crawl": {"next": "a.next", "follow": "a.item", "max_depth": 0},
+        }
+        Cache.directory = ".cache_test"
+
+    def tearDown(self):
+        Cache.directory = ".cache"
+        rmtree(".cache_test", ignore_errors=True)
+
+    def crawl(self, server, link, workers=4, no_cache=False, **settings):
+        dataplan = dict(self.dataplan, link=server.url_for(link))
+        dataplan["crawl"] = dict(dataplan["crawl"], **settings)
+        pages = Crawler(dataplan, workers=workers, no_cache=no_cache).run()
+        return sorted(p["link"][-1] for p in pages)
+
+    def test_pagination(self):
+        self.assertEqual(Pagination.parse("http://a/b?page=12&q=x"),
+                         (("http://a/b?page=", "&q=x"), 12))
+        self.assertEqual(Pagination.parse("http://a/page/3/"),
+                         (("http://a/page/", "/"), 3))
+        self.assertIsNone(Pagination.parse("http://a/b?pages=1"))
+        self.assertIsNone(Pagination.parse("http://a/pages/1"))
+
+    def test_repeated(self):
+        with ReplayServer(self.cassette) as server:
+            pages = self.crawl(server, SHOP.format(1))
+            self.assertEqual(pages, ["1", "2", "3"])
+            self.assertEqual(server.hits, 3)
+        with ReplayServer(self.cassette) as server:
+            pages = self.crawl(server, SHOP.format(1), prefetch=2)
+            self.assertEqual(pages, ["1", "2", "3"])
+            self.assertLessEqual(server.hits, 5)
+
+    def test_cached_queries(self):
+        with ReplayServer(self.cassette) as server:
+            for _ in range(2):
+                pages = self.crawl(server, SHOP.format(1))
+                self.assertEqual(pages, ["1", "2", "3"])
+            self.assertEqual(server.hits, 3)
+
+    def test_prefetch_queries(self):
+        with ReplayServer(self.cassette) as server:
+            for _ in range(2):
+                dataplan = dict(self.dataplan, link=server.url_for(
+                    STORE.format(1)))
+                dataplan["crawl"] = dict(dataplan["crawl"], prefetch=3)
+                pages = Crawler(dataplan, workers=4).run()
+                titles = {p["link"][-1]: p["records"]["title"] for p in pages}
+                self.assertEqual(titles, {str(n): "Page {}".format(n)
+                                          for n in range(1, 6)})
+
+    def test_empty(self):
+        with ReplayServer(self.cassette) as server:
+            pages = self.crawl(server, BLOG.format(1), prefetch=3)
+            self.assertEqual(pages, ["1", "2"])
+            self.assertLessEqual(server.hits, 6)
@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import socket
+
+from json import loads
+from mmap import mmap
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep, time
+from unittest import TestCase
+
+import hap
+
+from hap.cache import Cache, ResultMemo
+from hap.parser import HTMLParser
+from hap.client import Client, Payload
+from hap.retry import RetryPolicy, CircuitBreaker
+from hap.error import DataplanError, FetchError, BodyTooLargeError, \
+    UnsupportedContentError, classify_failure
+
+from benchmarks.replay import Cassette, ReplayServer
+
+
+REMOTE = "http://localhost/page"
+
+DATAPLAN = {
+    "declare": {"title": "string"},
+    "define": [{"title": {"query": "h1"}}],
+}
+
+
+def dataplan(**config):
+    return dict(DATAPLAN, config=config)
+
+
+class HTTPError(Exception):
+
+    def __init__(self, code):
+        self.code = code
+
+
+class URLError(OSError):
+
+    def __init__(self, reason):
+        self.reason = reason
+
+
+class TestFetch(TestCase):
+
+    def setUp(self):
+        Cache.directory = ".cache_test"
+        CircuitBreaker.breakers.clear()
+        self.cassette = Cassette()
+        self.cassette.add(REMOTE, "<html><body><h1>Page</h1></body></html>")
+        self.cassette.add(REMOTE + "/gone", "gone", status=404)
+        self.cassette.add(REMOTE, "<html><body><h1>Found</h1></body></html>",
+                          method="POST")
+        self.cassette.add(REMOTE + "/latin2", "<h1>Žluťoučký</h1>".encode(
+            "iso-8859-2"), headers=[("Content-Type",
+                                     "text/html; charset=ISO-8859-2")])
+        self.cassette.add(REMOTE + "/json", "{}", headers=[
+            ("Content-Type", "application/json")])
+        self.cassette.add(REMOTE + "/fragment", "<div><h1>x</h1></div>")
+        self.cassette.add(REMOTE + "/long", "<html><body><h1>Long</h1>" +
+                          "<p>padding</p>" * 100000 + "</body></html>")
+
+    def tearDown(self):
+        rmtree(".cache_test", ignore_errors=True)
+
+    def test_classify_failure(self):
+        self.assertEqual(classify_failure(HTTPError(404)), "4xx")
+        self.assertEqual(classify_failure(HTTPError(429)), "429")
+        self.assertEqual(classify_failure(HTTPError(503)), "5xx")
+        self.assertEqual(classify_failure(URLError(socket.gaierror())), "dns")
+        self.assertEqual(classify_failure(URLError(socket.timeout())),
+                         "timeout")
+        self.assertEqual(classify_failure(socket.timeout()), "timeout")
+        self.assertEqual(classify_failure(ConnectionResetError()),
+                         "connection")
+        self.assertEqual(classify_failure(ValueError()), "error")
+
+    def test_failure_backoff(self):
+        self.assertEqual(Cache.failure_ttl("5xx", 1), 30)
+        self.assertEqual(Cache.failure_ttl("5xx", 3), 120)
+        self.assertEqual(Cache.failure_ttl("5xx", 20), 30 * 60)
+        self.assertEqual(Cache.failure_ttl("unknown", 1), 60)
+        self.assertEqual(Cache.failure_ttl("5xx", 2, {"5xx": (1, 10)}), 2)
+
+    def test_negative_cache(self):
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE + "/gone")
+            result = hap.extract(DATAPLAN, link=link)
+            self.assertIsInstance(result.error, FetchError)
+            self.assertEqual(result.error.failure, "4xx")
+            result = hap.extract(DATAPLAN, link=link)
+            self.assertEqual(result.error.failure, "4xx")
+            self.assertIn("cached 4xx failure", str(result.error))
+            self.assertEqual(server.hits, 1)
+            hap.extract(DATAPLAN, link=link, no_cache=True)
+            self.assertEqual(server.hits, 2)
+            hap.extract(dataplan(negative_cache=False), link=link)
+            self.assertEqual(server.hits, 3)
+            ok, entry = Cache.read_failure(link)
+            self.assertTrue(ok)
+            self.assertEqual(entry["failures"], 1)
+
+    def test_negative_cache_expiry(self):
+        with ReplayServer(self.cassette, error_rate=1.0) as server:
+            link = server.url_for(REMOTE)
+            plan = dataplan(negative_cache={"5xx": [0.1, 1]}, retries=0)
+            result = hap.extract(plan, link=link)
+            self.assertEqual(result.error.failure, "5xx")
+            hap.extract(plan, link=link)
+            self.assertEqual(server.hits, 1)
+            sleep(0.15)
+            server.error_rate = 0
+            result = hap.extract(plan, link=link)
+            self.assertTrue(result.ok)
+            self.assertEqual(server.hits, 2)
+            ok, _ = Cache.read_failure(link)
+            self.assertFalse(ok)
+
+    def test_invalid_negative_cache(self):
+        policies = {"5xx": ["ten", 60], "4xx": [True, 1], "dns": -1,
+                    "timeout": 5}
+        psr = HTMLParser(DATAPLAN)
+        psr.prepare_failure_policies(policies)
+        self.assertEqual(psr.failure_policies["5xx"],
+                         Cache.failure_policies["5xx"])
+        self.assertEqual(psr.failure_policies["4xx"],
+                         Cache.failure_policies["4xx"])
+        self.assertEqual(psr.failure_policies["dns"],
+                         Cache.failure_policies["dns"])
+        self.assertEqual(psr.failure_policies["timeout"], (5.0, 5.0))
+        for entry in (b"[1]", b'{"until": "x", "failures": "x"}'):
+            Cache.commit(Cache.failure_path(REMOTE), entry)
+            self.assertEqual(Cache.read_failure(REMOTE),
+                             (False, "Invalid failure entry"))
+            self.assertTrue(Cache.write_failure(REMOTE, "5xx", "boom")[0])
+            ok, entry = Cache.read_failure(REMOTE)
+            self.assertTrue(ok)
+            self.assertEqual(entry["failures"], 1)
+
+    def test_timeouts(self):
+        self.assertEqual(Client.timeouts(5), (5.0, 5.0))
+        self.assertEqual(Client.timeouts({"read": 2}),
+                         (Client.connect_timeout, 2.0))
+        self.assertEqual(Client.timeouts(None),
+                         (Client.connect_timeout, Client.read_timeout))
+
+    def test_malformed_config(self):
+        for config in ({"timeout": {"read": "x"}},
+                       {"retries": {"retries": "x"}},
+                       {"circuit_breaker": {"reset": "x"}},
+                       {"concurrency": {"max": "x"}}):
+            result = hap.extract(dataplan(**config), link=REMOTE)
+            self.assertIsInstance(result.error, DataplanError)
+            self.assertIn("Invalid", str(result.error))
+
+    def test_retry_policy(self):
+        policy = RetryPolicy.from_config({"retries": 2, "backoff": 1,
+                                          "max_backoff": 3})
+        self.assertTrue(policy.should_retry("5xx", 2))
+        self.assertFalse(policy.should_retry("5xx", 3))
+        self.assertFalse(policy.should_retry("4xx", 1))
+        self.assertFalse(policy.should_retry("5xx", 1, "POST"))
+        for attempt in range(1, 6):
+            self.assertLessEqual(policy.delay(attempt), 3)
+        self.assertEqual(policy.delay(1, "2"), 2)
+        self.assertEqual(policy.delay(1, "60"), 3)
+        self.assertEqual(RetryPolicy.from_config(0).retries, 0)
+
+    def test_read_timeout(self):
+        with ReplayServer(self.cassette, error_rate=1.0, errors=["timeout"],
+                          stall=2) as server:
+            plan = dataplan(timeout={"read": 0.2}, retries=0)
+            began = time()
+            result = hap.extract(plan, link=server.url_for(REMOTE))
+            self.assertLess(time() - began, 1.5)
+            self.assertEqual(result.error.failure, "timeout")
+
+    def test_retries(self):
+        retries = {"retries": 2, "backoff": 0.01}
+        with ReplayServer(self.cassette, error_rate=1.0) as server:
+            link = server.url_for(REMOTE)
+            result = hap.extract(dataplan(retries=retries), link=link)
+            self.assertEqual(result.error.failure, "5xx")
+            self.assertEqual(server.hits, 3)
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE + "/gone")
+            result = hap.extract(dataplan(retries=retries), link=link)
+            self.assertEqual(result.error.failure, "4xx")
+            self.assertEqual(server.hits, 1)
+
+    def test_circuit_breaker(self):
+        plan = dataplan(retries=0, negative_cache=False,
+                        circuit_breaker={"threshold": 2, "reset": 0.2})
+        with ReplayServer(self.cassette, error_rate=1.0) as server:
+            link = server.url_for(REMOTE)
+            for _ in range(2):
+                hap.extract(plan, link=link)
+            result = hap.extract(plan, link=link)
+            self.assertEqual(result.error.failure, "circuit")
+            self.assertEqual(server.hits, 2)
+            sleep(0.25)
+            server.error_rate = 0
+            self.assertTrue(hap.extract(plan, link=link).ok)
+            self.assertEqual(server.hits, 3)
+
+    def test_circuit_breaker_settings(self):
+        breaker = CircuitBreaker.of("host", {"threshold": 2})
+        breaker.record("5xx")
+        self.assertIs(CircuitBreaker.of("host", {"threshold": 1,
+                                                 "reset": 5}), breaker)
+        self.assertEqual((breaker.threshold, breaker.reset), (1, 5.0))
+        self.assertEqual(breaker.failures, 1)
+        CircuitBreaker.of("host")
+        self.assertEqual((breaker.threshold, breaker.reset), (1, 5.0))
+        breaker.record("5xx")
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_payload(self):
+        self.assertIsNone(Payload().variant)
+        form = Payload.from_config({"form": {"q": "hap", "page": 2}})
+        self.assertEqual(form.method, "POST")
+        self.assertEqual(form.data, b"q=hap&page=2")
+        self.assertEqual(form.content_type, Payload.FORM)
+        raw = Payload.from_config({"payload": "q=hap", "method": "put"})
+        self.assertEqual((raw.method, raw.data), ("PUT", b"q=hap"))
+        one = Payload.from_config({"json": {"q": "hap"}})
+        two = Payload.from_config({"json": {"q": "pah"}})
+        self.assertEqual(one.content_type, Payload.JSON)
+        self.assertNotEqual(one.variant, two.variant)
+        self.assertTrue(one.variant.startswith("POST_"))
+        self.assertIsNotNone(Payload.from_config({"method": "HEAD"}).variant)
+        with self.assertRaises(ValueError):
+            Payload.from_config({"file": "/nonexistent/payload"})
+
+    def test_post_request(self):
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE)
+            plan = dataplan(request={"json": {"q": "hap"}})
+            result = hap.extract(plan, link=link)
+            self.assertEqual(result.records["title"], "Found")
+            headers, body = server.last_request
+            self.assertEqual(loads(body.decode()), {"q": "hap"})
+            self.assertEqual(headers["Content-Type"], Payload.JSON)
+            hap.extract(plan, link=link)
+            self.assertEqual(server.hits, 1)
+            plan = dataplan(request={"json": {"q": "pah"}})
+            hap.extract(plan, link=link)
+            self.assertEqual(server.hits, 2)
+            result = hap.extract(DATAPLAN, link=link)
+            self.assertEqual(result.records["title"], "Page")
+            self.assertEqual(server.hits, 3)
+            result = hap.extract(dataplan(payload="q=hap"), link=link)
+            self.assertEqual(result.records["title"], "Found")
+            self.assertEqual(server.last_request[1], b"q=hap")
+
+    def test_streamed_payload(self):
+        directory = mkdtemp()
+        try:
+            filepath = path.join(directory, "query.bin")
+            with open(filepath, "wb") as fd:
+                fd.write(b"x" * 200000)
+            plan = dataplan(request={"file": filepath,
+                                     "content_type": "text/plain"})
+            with ReplayServer(self.cassette) as server:
+                result = hap.extract(plan, link=server.url_for(REMOTE),
+                                     no_cache=True)
+                self.assertTrue(result.ok)
+                headers, body = server.last_request
+                self.assertEqual(len(body), 200000)
+                self.assertEqual(headers["Content-Type"], "text/plain")
+            plan = dataplan(request={"file": filepath + ".missing"})
+            result = hap.extract(plan, link=REMOTE)
+            self.assertIsInstance(result.error, DataplanError)
+        finally:
+            rmtree(directory)
+
+    def test_post_is_not_retried(self):
+        with ReplayServer(self.cassette, error_rate=1.0) as server:
+            plan = dataplan(request={"form": {"q": "hap"}},
+                            retries={"retries": 2, "backoff": 0.01})
+            result = hap.extract(plan, link=server.url_for(REMOTE))
+            self.assertEqual(result.error.failure, "5xx")
+            self.assertEqual(server.hits, 1)
+
+    def test_stream_probes_geometrically(self):
+        class Probing(HTMLParser):
+            probes = 0
+
+            def probe(self, root):
+                Probing.probes += 1
+                return super(Probing, self).probe(root)
+
+        plan = dict(DATAPLAN, define=[{"title": {"query": "h2"}}])
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE + "/long")
+            psr = Probing(dict(plan, link=link, config={
+                "stream": {"chunk_size": 4096}}), no_cache=True).run()
+            self.assertIsNone(psr.get_records()["title"])
+            self.assertFalse(psr.truncated)
+            self.assertGreater(len(psr.source), 1000000)
+            self.assertLessEqual(Probing.probes, 12)
+            for size in (0, -1, "x", True):
+                psr = HTMLParser(dict(DATAPLAN, link=link, config={
+                    "stream": {"chunk_size": size}}), no_cache=True)
+                self.assertEqual(psr.run().get_records()["title"], "Long")
+                self.assertEqual(psr.chunk_size, HTMLParser.chunk_size)
+
+    def test_stream_stops_early(self):
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE + "/long")
+            plan = dict(dataplan(stream={"chunk_size": 4096}), link=link)
+            psr = HTMLParser(plan).run()
+            self.assertEqual(psr.get_records()["title"], "Long")
+            self.assertTrue(psr.truncated)
+            self.assertLessEqual(len(psr.source), 3 * 4096)
+            ok, _ = Cache.read_link(link)
+            self.assertFalse(ok)
+            psr = HTMLParser(dict(DATAPLAN, link=link)).run()
+            self.assertFalse(psr.truncated)
+            self.assertGreater(len(psr.source), 1000000)
+
+    def test_stream_reads_missing_fields_to_the_end(self):
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE + "/long")
+            plan = dict(dataplan(stream=True), link=link, declare={
+                "title": "string", "footer": "string"})
+            plan["define"] = DATAPLAN["define"] + [
+                {"footer": {"query": "footer"}}]
+            psr = HTMLParser(plan, no_cache=True).run()
+            self.assertFalse(psr.truncated)
+            self.assertGreater(len(psr.source), 1000000)
+            self.assertEqual(psr.get_records()["title"], "Long")
+
+    def test_max_body(self):
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE + "/long")
+            plan = dataplan(max_body=100000, negative_cache=False)
+            result = hap.extract(plan, link=link)
+            self.assertIsInstance(result.error, BodyTooLargeError)
+            self.assertEqual(result.error.failure, "size")
+            plan = dict(dataplan(max_body={"size": 100000,
+                                           "action": "truncate"}), link=link)
+            psr = HTMLParser(plan).run()
+            self.assertTrue(psr.truncated)
+            self.assertEqual(len(psr.source), 100000)
+            self.assertEqual(psr.get_records()["title"], "Long")
+            ok, _ = Cache.read_link(link)
+            self.assertFalse(ok)
+
+    def test_spooled_body(self):
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE + "/long")
+            plan = dict(dataplan(spool=65536, huge_tree=True), link=link)
+            psr = HTMLParser(plan).run()
+            self.assertIsInstance(psr.source, mmap)
+            self.assertEqual(psr.get_records()["title"], "Long")
+            ok, cache = Cache.read_link(link)
+            self.assertTrue(ok)
+            self.assertEqual(len(cache), len(psr.source))
+
+    def test_spool_every_body(self):
+        with ReplayServer(self.cassette) as server:
+            plan = dict(dataplan(spool=0), link=server.url_for(REMOTE))
+            psr = HTMLParser(plan, no_cache=True).run()
+            self.assertIsInstance(psr.source, mmap)
+            self.assertEqual(psr.get_records()["title"], "Page")
+
+    def test_invalid_max_body(self):
+        for limit in ({"action": "truncate"},
+                      {"size": "x", "action": "truncate"},
+                      {"size": 0, "action": "truncate"}):
+            psr = HTMLParser(DATAPLAN)
+            psr.prepare_max_body(limit)
+            self.assertIsNone(psr.max_body)
+            self.assertFalse(psr.truncate_body)
+
+    def test_declared_charset(self):
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE + "/latin2")
+            for _ in range(2):
+                result = hap.extract(DATAPLAN, link=link)
+                self.assertEqual(result.records["title"], "Žluťoučký")
+            self.assertEqual(server.hits, 1)
+            ok, (cache, charset) = Cache.load_link(link)
+            self.assertIsInstance(cache, bytes)
+            self.assertEqual(charset, "iso-8859-2")
+
+    def test_unsupported_content(self):
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE + "/json")
+            result = hap.extract(DATAPLAN, link=link)
+            self.assertIsInstance(result.error, UnsupportedContentError)
+            self.assertEqual(result.error.mimetype, "application/json")
+
+    def test_local_file(self):
+        directory = mkdtemp()
+        try:
+            filepath = path.join(directory, "page.html")
+            with open(filepath, "wb") as fd:
+                fd.write("<h1>Ťitle</h1>".encode("utf8"))
+            plan = dict(DATAPLAN, link="file://" + filepath)
+            psr = HTMLParser(plan).run()
+            self.assertIsInstance(psr.source, mmap)
+            self.assertIsNone(psr.memo)
+            self.assertEqual(psr.get_records()["title"], "Ťitle")
+            psr = HTMLParser(plan).run()
+            self.assertIsNotNone(psr.memo)
+            self.assertIsNone(psr.source_code)
+            self.assertEqual(psr.get_records()["title"], "Ťitle")
+            psr = HTMLParser(plan, no_cache=True).run()
+            self.assertIsNone(psr.memo)
+            with open(filepath, "wb") as fd:
+                fd.write(b"<h1>Changed</h1>")
+            psr = HTMLParser(plan).run()
+            self.assertIsNone(psr.memo)
+            self.assertEqual(psr.get_records()["title"], "Changed")
+            other = dict(plan, define=[{"title": {"query": "p"}}])
+            self.assertIsNone(HTMLParser(other).run().memo)
+        finally:
+            ResultMemo.entries.clear()
+            rmtree(directory)
+
+    def test_mapped_fragment(self):
+        fragment = "<div>" + "<p>padding</p>" * 500 + "<h1>x</h1></div>"
+        plan = dict(DATAPLAN, define=[{"title": {"query_xpath": "h1/text()"}}])
+        self.assertEqual(hap.extract(plan, fragment).records["title"], "x")
+        directory = mkdtemp()
+        try:
+            filepath = path.join(directory, "fragment.html")
+            with open(filepath, "w") as fd:
+                fd.write(fragment)
+            link = "file://" + filepath
+            result = hap.extract(plan, link=link, no_cache=True)
+            self.assertEqual(result.records["title"], "x")
+            with open(filepath, "w") as fd:
+                fd.write("<!-- moved -->")
+            result = hap.extract(plan, link=link, no_cache=True)
+            self.assertIsInstance(result.error, FetchError)
+        finally:
+            rmtree(directory)
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE + "/fragment")
+            psr = HTMLParser(dict(plan, link=link, config={"spool": 4}),
+                             no_cache=True).run()
+            self.assertIsInstance(psr.source, mmap)
+            self.assertEqual(psr.get_records()["title"], "x")
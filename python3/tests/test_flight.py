@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from multiprocessing import Process
+from shutil import rmtree
+from threading import Thread, Lock
+from time import sleep
+from unittest import TestCase
+
+import hap
+
+from hap.cache import Cache
+from hap.flight import SingleFlight
+
+from benchmarks.replay import Cassette, ReplayServer
+
+
+REMOTE = "http://localhost/hub"
+
+DATAPLAN = {
+    "declare": {"title": "string"},
+    "define": [{"title": {"query": "h1"}}],
+}
+
+
+def run_threads(target, n):
+    threads = [Thread(target=target) for _ in range(n)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+
+class TestFlight(TestCase):
+
+    def setUp(self):
+        Cache.directory = ".cache_test"
+        self.cassette = Cassette()
+        self.cassette.add(REMOTE, "<html><body><h1>Hub</h1></body></html>")
+
+    def tearDown(self):
+        rmtree(".cache_test", ignore_errors=True)
+
+    def test_single_flight(self):
+        flights, calls, results, lock = SingleFlight(), [], [], Lock()
+
+        def work():
+            calls.append(1)
+            sleep(0.1)
+            return "body"
+
+        def caller():
+            value = flights.do("key", work)
+            with lock:
+                results.append(value)
+        run_threads(caller, 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results)[0], ("body", False))
+        self.assertEqual(results.count(("body", True)), 7)
+
+    def test_single_flight_error(self):
+        flights, errors = SingleFlight(), []
+
+        def work():
+            sleep(0.1)
+            raise ValueError("boom")
+
+        def caller():
+            try:
+                flights.do("key", work)
+            except ValueError as e:
+                errors.append(e)
+        run_threads(caller, 4)
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(flights.calls, {})
+
+    def test_coalesce_threads(self):
+        with ReplayServer(self.cassette, latency=0.2) as server:
+            link, results = server.url_for(REMOTE), []
+            run_threads(lambda: results.append(
+                hap.extract(DATAPLAN, link=link, no_cache=True)), 6)
+            self.assertEqual(server.hits, 1)
+        self.assertEqual([r.records["title"] for r in results], ["Hub"] * 6)
+
+    def test_distinct_queries(self):
+        for page in range(1, 4):
+            self.cassette.add("{}?page={}".format(REMOTE, page),
+                              "<h1>Page {}</h1>".format(page))
+        with ReplayServer(self.cassette, latency=0.2) as server:
+            links, results, lock = [server.url_for(REMOTE + "?page={}".format(
+                page)) for page in range(1, 4)], dict(), Lock()
+
+            def caller(link):
+                result = hap.extract(DATAPLAN, link=link, no_cache=True)
+                with lock:
+                    results[link] = result.records["title"]
+            threads = [Thread(target=caller, args=(link,)) for link in links]
+            [t.start() for t in threads]
+            [t.join() for t in threads]
+            self.assertEqual(server.hits, 3)
+        self.assertEqual([results[link] for link in links],
+                         ["Page 1", "Page 2", "Page 3"])
+
+    def test_coalesce_processes(self):
+        with ReplayServer(self.cassette, latency=0.2) as server:
+            link = server.url_for(REMOTE)
+            workers = [Process(target=hap.extract, args=(DATAPLAN, None, link))
+                       for _ in range(4)]
+            [w.start() for w in workers]
+            [w.join() for w in workers]
+            self.assertEqual(server.hits, 1)
+            ok, _ = Cache.read_link(link)
+            self.assertTrue(ok)
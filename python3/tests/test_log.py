@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import logging
+
+from subprocess import check_output
+from sys import executable
+from unittest import TestCase
+
+from hap.log import Log
+
+
+class Expensive(object):
+
+    formatted = 0
+
+    def __str__(self):
+        Expensive.formatted += 1
+        return "expensive"
+
+
+class TestLog(TestCase):
+
+    def setUp(self):
+        self.level = Log.logger.level
+        Expensive.formatted = 0
+
+    def tearDown(self):
+        Log.logger.setLevel(self.level)
+
+    def test_lazy_debug(self):
+        Log.logger.setLevel(logging.INFO)
+        self.assertFalse(Log.is_debug())
+        Log.debug("Performing %s", Expensive())
+        self.assertEqual(Expensive.formatted, 0)
+
+    def test_debug_enabled(self):
+        Log.logger.setLevel(logging.DEBUG)
+        self.assertTrue(Log.is_debug())
+        with self.assertLogs(level=logging.DEBUG) as logs:
+            Log.debug("Performing %s", Expensive())
+        self.assertEqual(logs.output, ["DEBUG:root:Performing expensive"])
+
+    def test_fatal(self):
+        with self.assertRaises(SystemExit) as context:
+            with self.assertLogs(level=logging.ERROR):
+                Log.fatal("Missing required section: '%s'", "link")
+        self.assertEqual(str(context.exception),
+                         "Missing required section: 'link'")
+
+    def test_optimize_strips_debug(self):
+        script = "import dis; from hap.parser import HTMLParser as P; " \
+                 "print(any(i.argval == 'Log' " \
+                 "for i in dis.get_instructions(P.perform)))"
+        stripped = check_output([executable, "-O", "-c", script])
+        self.assertEqual(stripped.strip(), b"False")
+        kept = check_output([executable, "-c", script])
+        self.assertEqual(kept.strip(), b"True")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from unittest import TestCase
+
+import hap
+
+from hap.proxy import ProxyPool, ProxyManager
+from hap.retry import CircuitBreaker
+
+from benchmarks.replay import Cassette, ReplayServer
+
+
+REMOTE = "http://localhost/page"
+
+DATAPLAN = {
+    "link": REMOTE,
+    "declare": {"title": "string"},
+    "define": [{"title": {"query": "h1"}}],
+}
+
+DEAD_PROXY = "http://127.0.0.1:9"
+
+
+def dataplan(proxies):
+    return dict(DATAPLAN, config={"proxies": proxies})
+
+
+class TestProxy(TestCase):
+
+    def setUp(self):
+        ProxyManager.pools.clear()
+        CircuitBreaker.breakers.clear()
+        self.cassette = Cassette()
+        self.cassette.add(REMOTE, "<html><body><h1>Page</h1></body></html>")
+
+    def test_round_robin(self):
+        pool = ProxyPool(["a", "b", "c"])
+        picked = list()
+        for _ in range(6):
+            proxy = pool.acquire()
+            picked.append(proxy.url)
+            pool.release(proxy, 0.1)
+        self.assertEqual(picked, ["a", "b", "c", "a", "b", "c"])
+
+    def test_least_loaded(self):
+        pool = ProxyPool(["a", "b"], ProxyPool.LEAST_LOADED)
+        first = pool.acquire()
+        self.assertNotEqual(pool.acquire().url, first.url)
+        pool.release(first, 0.1)
+        self.assertEqual(pool.acquire().url, first.url)
+
+    def test_unhealthy_proxy_rests(self):
+        pool = ProxyPool(["a", "b"])
+        dead = pool.proxies[0]
+        for _ in range(dead.threshold):
+            dead.in_flight += 1
+            pool.release(dead, 0.1, "connection")
+        self.assertFalse(dead.healthy)
+        for _ in range(4):
+            proxy = pool.acquire()
+            self.assertEqual(proxy.url, "b")
+            pool.release(proxy, 0.1)
+
+    def test_manager(self):
+        self.assertIsNone(ProxyManager.pool("http", None))
+        self.assertIsNone(ProxyManager.pool("https", {"http": "p"}))
+        pool = ProxyManager.pool("http", {"http": "p"})
+        self.assertEqual([p.url for p in pool.proxies], ["p"])
+        self.assertIs(ProxyManager.pool("http", {"http": ["p"]}), pool)
+
+    def test_requests_through_proxies(self):
+        with ReplayServer(self.cassette) as one, \
+                ReplayServer(self.cassette) as two:
+            plan = dataplan({"http": [one.address, two.address]})
+            for _ in range(4):
+                result = hap.extract(plan, no_cache=True)
+                self.assertEqual(result.records["title"], "Page")
+            self.assertEqual((one.hits, two.hits), (2, 2))
+            self.assertEqual(ProxyManager.snapshot()[one.address]
+                             ["requests"], 2)
+
+    def test_failover(self):
+        with ReplayServer(self.cassette) as live:
+            plan = dataplan({"http": [DEAD_PROXY, live.address]})
+            for _ in range(4):
+                self.assertTrue(hap.extract(plan, no_cache=True).ok)
+            self.assertEqual(live.hits, 4)
+            dead = ProxyManager.snapshot()[DEAD_PROXY]
+            self.assertEqual(dead["errors"], 3)
+            self.assertFalse(dead["healthy"])
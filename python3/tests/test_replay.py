@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from time import perf_counter
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from unittest import TestCase
+
+from benchmarks.replay import Cassette, ReplayServer
+
+
+REMOTE = "http://localhost/mockup?page=1"
+
+
+class TestReplay(TestCase):
+
+    def setUp(self):
+        self.cassette = Cassette()
+        self.cassette.add(REMOTE, "<html><body>Hap!</body></html>")
+
+    def test_replay_and_record(self):
+        with ReplayServer(self.cassette) as server:
+            local = server.url_for(REMOTE)
+            response = urlopen(local)
+            self.assertEqual(response.getcode(), 200)
+            self.assertEqual(response.info().get_content_type(), "text/html")
+            self.assertEqual(response.read(),
+                             b"<html><body>Hap!</body></html>")
+            copy = Cassette()
+            recorded = copy.record(local)
+            self.assertEqual(recorded["status"], 200)
+            self.assertEqual(recorded["body"],
+                             self.cassette.find("GET", REMOTE)["body"])
+            with self.assertRaises(HTTPError) as context:
+                urlopen(server.url_for("http://localhost/missing"))
+            self.assertEqual(context.exception.code, 404)
+
+    def test_latency_and_bandwidth(self):
+        with ReplayServer(self.cassette, latency=0.05, bandwidth=300) as srv:
+            start = perf_counter()
+            urlopen(srv.url_for(REMOTE)).read()
+            self.assertGreater(perf_counter() - start, 0.1)
+
+    def test_error_injection(self):
+        with ReplayServer(self.cassette, error_rate=1.0,
+                          errors=[503]) as server:
+            with self.assertRaises(HTTPError) as context:
+                urlopen(server.url_for(REMOTE))
+            self.assertEqual(context.exception.code, 503)
+        with ReplayServer(self.cassette, error_rate=1.0,
+                          errors=["timeout"], stall=1) as server:
+            with self.assertRaises(OSError):
+                urlopen(server.url_for(REMOTE), timeout=0.1)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from json import dumps
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread, Lock
+from time import sleep
+from unittest import TestCase
+
+from hap.scheduler import Scheduler, parse_interval
+from hap.throttle import RateLimiter
+
+from benchmarks.replay import Cassette, ReplayServer
+
+
+HTMLDATA = "<html><body><h1>Hap!</h1></body></html>"
+
+
+def dataplan(link, **meta):
+    return {
+        "meta": meta,
+        "link": link,
+        "declare": {"title": "string"},
+        "define": [{"title": {"query": "h1"}}],
+    }
+
+
+class TestScheduler(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.document = path.join(self.directory, "page.html")
+        with open(self.document, "w") as fd:
+            fd.write(HTMLDATA)
+        self.emitted, self.lock = list(), Lock()
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def write(self, name, data):
+        with open(path.join(self.directory, name), "w") as fd:
+            fd.write(dumps(data))
+
+    def emit(self, data):
+        with self.lock:
+            self.emitted.append(data)
+
+    def test_parse_interval(self):
+        self.assertEqual(parse_interval(90), 90.0)
+        self.assertEqual(parse_interval("90s"), 90.0)
+        self.assertEqual(parse_interval("15m"), 900.0)
+        self.assertEqual(parse_interval("1.5h"), 5400.0)
+        self.assertEqual(parse_interval("1d"), 86400.0)
+        self.assertIsNone(parse_interval("soon"))
+        self.assertIsNone(parse_interval(0))
+        self.assertIsNone(parse_interval(True))
+
+    def test_periodic_runs(self):
+        link = "file://" + self.document
+        self.write("fast.json", dataplan(link, interval=0.1))
+        self.write("slow.json", dataplan(link, interval="1h"))
+        self.write("broken.json", dataplan("ftp://nowhere", interval=0.1))
+        scheduler = Scheduler(self.directory, workers=2, jitter=0,
+                              no_cache=True, emit=self.emit)
+        thread = Thread(target=scheduler.run, daemon=True)
+        thread.start()
+        sleep(0.6)
+        scheduler.close()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        runs = [e["dataplan"] for e in self.emitted]
+        fast = path.join(self.directory, "fast.json")
+        slow = path.join(self.directory, "slow.json")
+        self.assertGreaterEqual(runs.count(fast), 3)
+        self.assertEqual(runs.count(slow), 1)
+        self.assertEqual(self.emitted[0]["records"]["title"], "Hap!")
+
+    def test_throttled_host_is_deferred(self):
+        RateLimiter.buckets.clear()
+        cassette = Cassette()
+        cassette.add("http://localhost/page", HTMLDATA)
+        with ReplayServer(cassette) as server:
+            plan = dataplan(server.url_for("http://localhost/page"),
+                            interval=0.05)
+            plan["config"] = {"rate_limit": 2}
+            self.write("remote.json", plan)
+            self.write("local.json", dataplan("file://" + self.document,
+                                              interval=0.05))
+            scheduler = Scheduler(self.directory, workers=1, jitter=0,
+                                  no_cache=True, emit=self.emit)
+            thread = Thread(target=scheduler.run, daemon=True)
+            thread.start()
+            sleep(0.6)
+            scheduler.close()
+            thread.join(1)
+            self.assertLessEqual(server.hits, 3)
+        runs = [e["dataplan"] for e in self.emitted]
+        local = path.join(self.directory, "local.json")
+        self.assertGreaterEqual(runs.count(local), 5)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from json import dumps, loads
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
+from urllib.error import HTTPError
+from urllib.request import urlopen, Request
+from unittest import TestCase
+
+from hap.server import ExtractionService, create_server
+
+
+HTMLDATA = r"""
+<html>
+<body>
+<a href="https://github.com/lexndru/hap" title="Hap GitHub" id="github">Hap</a>
+<p>This is a sentence about dogs.</p>
+</body>
+</html>
+"""
+
+DATAPLAN = {
+    "declare": {
+        "topic": "string",
+        "url": "string"
+    },
+    "define": [
+        {
+            "url": {
+                "query_xpath": "//*/a[@title='Hap GitHub']/@href"
+            }
+        },
+        {
+            "paragraph": [
+                {
+                    "query": "p"
+                },
+                {
+                    "pattern": "This is .* about (?P<topic>.+)\\."
+                }
+            ]
+        }
+    ]
+}
+
+
+class TestServer(TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        with open(path.join(self.root, "plan.json"), "w") as fd:
+            fd.write(dumps(DATAPLAN))
+        self.service = ExtractionService(self.root, workers=2, no_cache=True)
+        self.server = create_server("127.0.0.1:0", self.service)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+        rmtree(self.root)
+
+    def post(self, data):
+        body = data if isinstance(data, bytes) else dumps(data).encode()
+        request = Request(self.url + "/extract", data=body)
+        try:
+            response = urlopen(request)
+        except HTTPError as e:
+            response = e
+        return response.getcode(), loads(response.read().decode())
+
+    def test_health(self):
+        data = loads(urlopen(self.url + "/health").read().decode())
+        self.assertEqual(data.get("status"), "ok")
+        data = loads(urlopen(self.url + "/stats").read().decode())
+        self.assertIsInstance(data.get("concurrency"), dict)
+
+    def test_inline_dataplan(self):
+        status, data = self.post({"dataplan": DATAPLAN, "html": HTMLDATA})
+        self.assertEqual(status, 200)
+        records = data.get("records")
+        self.assertEqual(records.get("topic"), "dogs")
+        self.assertEqual(records.get("url"), "https://github.com/lexndru/hap")
+
+    def test_dataplan_reference(self):
+        for _ in range(2):
+            status, data = self.post({"dataplan": "plan.json",
+                                      "html": HTMLDATA})
+            self.assertEqual(status, 200)
+            self.assertEqual(data["records"].get("topic"), "dogs")
+        status, data = self.post({"dataplan": "../plan.json",
+                                  "html": HTMLDATA})
+        self.assertEqual(status, 400)
+
+    def test_bad_requests(self):
+        status, _ = self.post(b"not json")
+        self.assertEqual(status, 400)
+        status, _ = self.post({"dataplan": 42})
+        self.assertEqual(status, 400)
+        status, data = self.post({"dataplan": {"declare": {}},
+                                  "html": HTMLDATA})
+        self.assertEqual(status, 422)
+        self.assertIn("define", data.get("error"))
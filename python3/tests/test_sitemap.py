@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import gzip
+
+from json import dumps, loads
+from os import environ, path
+from shutil import rmtree
+from subprocess import run, PIPE
+from sys import executable
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from hap.batch import run_links
+from hap.cache import Cache
+from hap.error import FetchError
+from hap.sitemap import Sitemap
+
+from benchmarks.replay import Cassette, ReplayServer
+
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+DATAPLAN = {
+    "declare": {"title": "string"},
+    "define": [{"title": {"query": "h1"}}],
+}
+
+
+def urlset(*entries):
+    return "<?xml version='1.0'?><urlset xmlns='{}'>{}</urlset>".format(
+        NS, "".join("<url><loc>{}</loc>{}</url>".format(loc, "<lastmod>{}"
+                    "</lastmod>".format(mod) if mod else "")
+                    for loc, mod in entries))
+
+
+def sitemapindex(*entries):
+    return "<?xml version='1.0'?><sitemapindex xmlns='{}'>{}" \
+           "</sitemapindex>".format(NS, "".join(
+               "<sitemap><loc>{}</loc><lastmod>{}</lastmod></sitemap>".format(
+                   loc, mod) for loc, mod in entries))
+
+
+class TestSitemap(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        Cache.directory = path.join(self.directory, "cache")
+
+    def tearDown(self):
+        Cache.directory = ".cache"
+        rmtree(self.directory)
+
+    def write(self, name, content, compress=False):
+        filepath = path.join(self.directory, name)
+        data = content.encode("utf8")
+        with open(filepath, "wb") as fd:
+            fd.write(gzip.compress(data) if compress else data)
+        return filepath
+
+    def index(self):
+        old = self.write("old.xml", urlset(("http://a/old", "2017-01-01")))
+        new = self.write("new.xml.gz", urlset(
+            ("http://a/1", "2018-06-01T10:00:00Z"),
+            ("http://a/2", "2018-01-01"),
+            ("http://a/3", None)), compress=True)
+        return self.write("index.xml", sitemapindex(
+            ("file://" + old, "2017-01-01"),
+            ("file://" + new, "2018-06-01"),
+            ("file://" + self.directory + "/index.xml", "2018-06-01")))
+
+    def test_lastmod(self):
+        self.assertEqual(Sitemap.lastmod("1970-01-02"), 86400)
+        self.assertEqual(Sitemap.lastmod("1970-01-01T01:00:00+01:00"), 0)
+        self.assertEqual(Sitemap.lastmod("1970-01-01T00:01:00Z"), 60)
+        self.assertEqual(Sitemap.lastmod("1970"), 0)
+        self.assertEqual(Sitemap.lastmod("1970-02"), 31 * 86400)
+        self.assertEqual(Sitemap.lastmod("1970-01-01T00:01Z"), 60)
+        self.assertEqual(Sitemap.lastmod("1970-01-01T00:00:01.5Z"), 1.5)
+        self.assertEqual(Sitemap.lastmod("1970-01-01T00:00:00.25-00:30"),
+                         1800.25)
+        self.assertEqual(Sitemap.lastmod("1970-01-01T01:00:00+0100"), 0)
+        self.assertIsNone(Sitemap.lastmod("1970-13-01"))
+        self.assertIsNone(Sitemap.lastmod("1970-01-01T25:00Z"))
+        self.assertIsNone(Sitemap.lastmod("1970-01-01T00:00+01"))
+        self.assertIsNone(Sitemap.lastmod("yesterday"))
+        self.assertIsNone(Sitemap.lastmod(None))
+
+    def test_links(self):
+        index = self.index()
+        self.assertEqual(list(Sitemap(index).links()), [
+            "http://a/old", "http://a/1", "http://a/2", "http://a/3"])
+        since = Sitemap.lastmod("2018-03-01")
+        self.assertEqual(list(Sitemap(index, since).links()),
+                         ["http://a/1", "http://a/3"])
+        self.assertEqual(list(Sitemap(index).links(r"/\d$")),
+                         ["http://a/1", "http://a/2", "http://a/3"])
+
+    def test_errors(self):
+        broken = self.write("broken.xml", "<urlset><url><loc>")
+        with self.assertRaises(FetchError):
+            list(Sitemap(broken).links())
+        index = self.write("index.xml", sitemapindex(
+            ("file://" + broken, "2018-01-01"),
+            ("file://" + self.write("ok.xml", urlset(("http://a/", None))),
+             "2018-01-01")))
+        sitemap = Sitemap(index)
+        self.assertEqual(list(sitemap.links()), ["http://a/"])
+        self.assertEqual(len(sitemap.failures), 1)
+
+    def test_state(self):
+        self.assertIsNone(Sitemap.last_run("http://a/sitemap.xml"))
+        Sitemap.save_run("http://a/sitemap.xml", 100.0)
+        Sitemap.save_run("http://b/sitemap.xml", 200.0)
+        self.assertEqual(Sitemap.last_run("http://a/sitemap.xml"), 100.0)
+
+    def test_remote(self):
+        cassette = Cassette()
+        with ReplayServer(cassette) as server:
+            pages = [server.url_for("http://shop/p/{}".format(i))
+                     for i in range(5)]
+            for i in range(5):
+                cassette.add("http://shop/p/{}".format(i),
+                             "<h1>Product {}</h1>".format(i))
+            cassette.add("http://shop/sitemap.xml.gz", gzip.compress(urlset(
+                *[(page, None) for page in pages]).encode("utf8")))
+            sitemap = Sitemap(server.url_for("http://shop/sitemap.xml.gz"))
+            results = list()
+            total, failed = run_links(DATAPLAN, sitemap.links(), 2,
+                                      True, results.append)
+            self.assertEqual((total, failed), (5, 0))
+            self.assertEqual(sorted(r["records"]["title"] for r in results),
+                             ["Product {}".format(i) for i in range(5)])
+
+    def hap(self, sitemap, *args):
+        script = "import sys; sys.argv[0] = 'hap'; " \
+                 "from hap.bootstrap import main; main()"
+        proc = run([executable, "-c", script, "--sitemap", sitemap] +
+                   list(args), cwd=self.directory, stdout=PIPE, stderr=PIPE,
+                   input=dumps(DATAPLAN).encode("utf8"),
+                   env=dict(environ, PYTHONPATH=ROOT))
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        return [loads(line) for line in proc.stdout.decode().splitlines()]
+
+    def test_command_line(self):
+        page = self.write("page.html", "<h1>Page</h1>")
+        sitemap = self.write("sitemap.xml", urlset(
+            ("file://" + page, "2018-06-01")))
+
+        def hap(*args):
+            return self.hap(sitemap, *args)
+
+        self.assertEqual(hap("--since", "2018-01-01")[0]["records"]["title"],
+                         "Page")
+        self.assertEqual(len(hap("--since", "2019-01-01")), 0)
+        self.assertEqual(len(hap()), 1)
+        self.assertEqual(len(hap()), 0)
+        self.assertEqual(len(hap("--no-cache")), 1)
+
+    def test_incomplete_run(self):
+        page = self.write("page.html", "<h1>Page</h1>")
+        missing = path.join(self.directory, "missing.html")
+        sitemap = self.write("sitemap.xml", urlset(
+            ("file://" + page, "2018-06-01"),
+            ("file://" + missing, "2018-06-01")))
+        self.assertEqual(len(self.hap(sitemap)), 2)
+        self.assertEqual(len(self.hap(sitemap)), 2)
+        self.write("missing.html", "<h1>Found</h1>")
+        self.assertEqual(len(self.hap(sitemap)), 2)
+        self.assertEqual(len(self.hap(sitemap)), 0)
+
+        index = self.write("index.xml", sitemapindex(
+            ("file://" + self.write("ok.xml", urlset(
+                ("file://" + page, "2018-06-01"))), "2018-06-01"),
+            ("file://" + missing + ".xml", "2018-06-01")))
+        self.assertEqual(len(self.hap(index)), 1)
+        self.assertEqual(len(self.hap(index)), 1)
+        self.assertIsNone(Sitemap.last_run(index))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from json import dumps
+from os import path, remove
+from subprocess import run, PIPE
+from sys import executable
+from tempfile import mkstemp
+from unittest import TestCase
+
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+HEAVY_MODULES = ("lxml", "urllib.request", "http.client", "uuid",
+                 "concurrent.futures")
+
+
+def imported_modules(*args, stdin=None):
+    """Modules loaded by a Hap! invocation, listed from sys.modules at exit.
+    """
+
+    script = "import atexit, sys; atexit.register(lambda: sys.stderr.write(" \
+             "'\\nmodules: ' + ' '.join(sys.modules) + '\\n')); " \
+             "sys.argv[0] = 'hap'; from hap.bootstrap import main; main()"
+    proc = run([executable, "-c", script] + list(args), cwd=ROOT,
+               stdout=PIPE, stderr=PIPE, input=stdin)
+    for line in proc.stderr.decode().splitlines():
+        if line.startswith("modules: "):
+            return line[len("modules: "):].split()
+    raise AssertionError(proc.stderr.decode())
+
+
+class TestStartup(TestCase):
+
+    def assertNotImported(self, modules, *names):
+        for name in names:
+            loaded = [m for m in modules
+                      if m == name or m.startswith(name + ".")]
+            self.assertEqual(loaded, [], "{} imported".format(name))
+
+    def test_version(self):
+        modules = imported_modules("--version")
+        self.assertIn("hap.bootstrap", modules)
+        self.assertNotImported(modules, "hap.log", *HEAVY_MODULES)
+
+    def test_sample(self):
+        modules = imported_modules("--sample")
+        self.assertIn("hap.log", modules)
+        self.assertNotImported(modules, *HEAVY_MODULES)
+
+    def test_local_run(self):
+        fd, filepath = mkstemp(suffix=".html")
+        with open(fd, "w") as f:
+            f.write("<h1>Hap!</h1>")
+        try:
+            plan = dumps({"link": "file://" + filepath,
+                          "declare": {"title": "string"},
+                          "define": [{"title": {"query": "h1"}}]})
+            modules = imported_modules("--no-cache", stdin=plan.encode())
+        finally:
+            remove(filepath)
+        self.assertIn("hap.parser", modules)
+        self.assertNotImported(modules, "urllib.request", "http.client",
+                               "uuid", "concurrent.futures")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from shutil import rmtree
+from threading import Lock, Thread
+from time import monotonic, sleep
+from unittest import TestCase
+
+import hap
+
+from hap.cache import Cache
+from hap.throttle import TokenBucket, RateLimiter, AdaptiveWindow, \
+    Concurrency
+
+from benchmarks.replay import Cassette, ReplayServer
+
+
+REMOTE = "http://localhost/page"
+
+DATAPLAN = {
+    "declare": {"title": "string"},
+    "define": [{"title": {"query": "h1"}}],
+}
+
+
+class TestThrottle(TestCase):
+
+    def setUp(self):
+        Cache.directory = ".cache_test"
+        RateLimiter.buckets.clear()
+        Concurrency.windows.clear()
+        self.cassette = Cassette()
+        self.cassette.add(REMOTE, "<html><body><h1>Page</h1></body></html>")
+
+    def tearDown(self):
+        rmtree(".cache_test", ignore_errors=True)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(10, burst=2)
+        self.assertEqual(bucket.delay(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.delay(), 0.1, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, places=2)
+
+    def test_settings(self):
+        self.assertEqual(RateLimiter.settings(), (None, 1))
+        self.assertEqual(RateLimiter.settings(2), (2.0, 1.0))
+        self.assertEqual(RateLimiter.settings({"rate": 5, "burst": 10}),
+                         (5.0, 10.0))
+        self.assertEqual(RateLimiter.settings(0), (None, 1.0))
+        self.assertEqual(RateLimiter.settings("fast"), (None, 1))
+        self.assertIsNone(RateLimiter.bucket("localhost"))
+
+    def test_hosts_are_independent(self):
+        RateLimiter.acquire("slow", 1)
+        self.assertGreater(RateLimiter.delay("slow", 1), 0.9)
+        self.assertEqual(RateLimiter.delay("fast", 1), 0)
+
+    def test_switching_limits_keeps_the_bucket(self):
+        bucket = RateLimiter.bucket("shared", {"rate": 1, "burst": 2})
+        RateLimiter.acquire("shared", {"rate": 1, "burst": 2})
+        RateLimiter.acquire("shared", {"rate": 1, "burst": 2})
+        self.assertIs(RateLimiter.bucket("shared", 2), bucket)
+        self.assertEqual((bucket.rate, bucket.burst), (2.0, 1.0))
+        self.assertGreater(RateLimiter.delay("shared", 2), 0.4)
+        self.assertIs(RateLimiter.bucket("shared", {"rate": 1, "burst": 2}),
+                      bucket)
+        self.assertGreater(RateLimiter.delay("shared", {"rate": 1,
+                                                        "burst": 2}), 0.9)
+
+    def test_fetch_rate_limit(self):
+        plan = dict(DATAPLAN, config={"rate_limit": 20})
+        with ReplayServer(self.cassette) as server:
+            link = server.url_for(REMOTE)
+            began = monotonic()
+            for _ in range(4):
+                self.assertTrue(hap.extract(plan, link=link,
+                                            no_cache=True).ok)
+            self.assertGreaterEqual(monotonic() - began, 0.14)
+            self.assertEqual(server.hits, 4)
+
+    def test_adaptive_window(self):
+        window = AdaptiveWindow("example.com", initial=2, maximum=3)
+        for _ in range(8):
+            window.acquire()
+            window.acquire()
+            window.release(0.01)
+            window.release(0.01)
+        self.assertEqual(window.limit, 3)
+        window.acquire()
+        window.release(0.01, "429")
+        self.assertEqual(window.limit, 1)
+        window.decreased_at = 0
+        window.acquire()
+        window.release(0.01, "4xx")
+        self.assertEqual(window.limit, 1)
+        window.acquire()
+        window.release(1.0)
+        self.assertLess(window.window, 1.5)
+
+    def test_latency_growth_backs_off(self):
+        window = AdaptiveWindow("example.com", initial=8)
+        window.acquire()
+        window.release(0.01)
+        for _ in range(10):
+            window.acquire()
+            window.release(0.5)
+            window.decreased_at = 0
+        self.assertEqual(window.limit, 1)
+
+    def test_fixed_concurrency(self):
+        window = Concurrency.window("fixed", 3)
+        self.assertEqual((window.minimum, window.maximum), (3, 3))
+        window = Concurrency.window("adaptive")
+        self.assertEqual(window.limit, 4)
+        self.assertIn("fixed", Concurrency.snapshot())
+
+    def test_window_bounds_requests_in_flight(self):
+        window = AdaptiveWindow("example.com", initial=2, maximum=2)
+        peak, lock = [0], Lock()
+
+        def request():
+            window.acquire()
+            with lock:
+                peak[0] = max(peak[0], window.in_flight)
+            sleep(0.02)
+            window.release(0.02)
+
+        threads = [Thread(target=request) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(window.in_flight, 0)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Alexandru Catrina <alex@codeissues.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import gzip
+
+from json import dumps, loads
+from os import path
+from shutil import rmtree
+from subprocess import run, PIPE
+from sys import executable
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from hap.batch import Batch, extract_item
+from hap.warc import WARCReader
+
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+DATAPLAN = {
+    "declare": {"title": "string"},
+    "define": [{"title": {"query": "h1"}}],
+}
+
+
+def http_response(body, content_type="text/html; charset=utf-8",
+                  headers=(), status="200 OK"):
+    head = ["HTTP/1.1 " + status, "Content-Type: " + content_type]
+    head += list(headers)
+    return ("\r\n".join(head) + "\r\n\r\n").encode("ascii") + body
+
+
+def warc_record(kind, uri, block, content_type="application/http; "
+                                               "msgtype=response"):
+    head = "WARC/1.0\r\nWARC-Type: {}\r\nWARC-Target-URI: {}\r\n" \
+           "Content-Type: {}\r\nContent-Length: {}\r\n\r\n".format(
+               kind, uri, content_type, len(block))
+    return head.encode("ascii") + block + b"\r\n\r\n"
+
+
+def chunked(body):
+    return b"%x\r\n%s\r\n0\r\n\r\n" % (len(body), body)
+
+
+class TestWARC(TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.archive = path.join(self.directory, "crawl.warc.gz")
+        records = [
+            warc_record("warcinfo", "", b"software: test",
+                        "application/warc-fields"),
+            warc_record("request", "http://example.com/a",
+                        b"GET /a HTTP/1.1\r\n\r\n",
+                        "application/http; msgtype=request"),
+            warc_record("response", "http://example.com/a", http_response(
+                "<h1>Ä</h1>".encode("utf8"))),
+            warc_record("response", "http://example.com/b", http_response(
+                "<h1>Ä</h1>".encode("iso-8859-1"),
+                "text/html; charset=iso-8859-1")),
+            warc_record("response", "http://example.com/c", http_response(
+                chunked(gzip.compress(b"<h1>C</h1>")), headers=(
+                    "Transfer-Encoding: chunked",
+                    "Content-Encoding: gzip"))),
+            warc_record("response", "http://example.com/empty",
+                        http_response(b"")),
+            warc_record("response", "http://example.com/data.json",
+                        http_response(b"{}", "application/json")),
+        ]
+        with open(self.archive, "wb") as fd:
+            for record in records:
+                fd.write(gzip.compress(record))
+
+    def tearDown(self):
+        rmtree(self.directory)
+
+    def test_records(self):
+        kinds = [r.type for r in WARCReader(self.archive).records()]
+        self.assertEqual(kinds, ["warcinfo", "request"] + ["response"] * 5)
+
+    def test_responses(self):
+        reader = WARCReader(self.archive)
+        urls = [r.url for r in reader.responses()]
+        self.assertEqual(len(urls), 5)
+        html = reader.responses(mimetypes=("text/html",))
+        self.assertEqual([r.url[-1] for r in html], ["a", "b", "c", "y"])
+        matched = list(reader.responses(match=r"/c$"))
+        self.assertEqual(matched[0].body, b"<h1>C</h1>")
+        self.assertEqual(matched[0].status, 200)
+
+    def test_statuses(self):
+        archive = path.join(self.directory, "statuses.warc")
+        with open(archive, "wb") as fd:
+            for status in ("200 OK", "301 Moved", "404 Not Found",
+                           "503 Unavailable", "abc"):
+                fd.write(warc_record("response", "http://example.com/" +
+                                     status[:3], http_response(
+                                         b"<h1>x</h1>", status=status)))
+        reader = WARCReader(archive)
+        self.assertEqual([r.status for r in reader.responses()], [200])
+        self.assertEqual([r.status for r in reader.responses(
+            successful=False)], [200, 301, 404, 503])
+
+    def test_malformed_records(self):
+        archive = path.join(self.directory, "malformed.warc")
+        with open(archive, "wb") as fd:
+            fd.write(warc_record("response", "http://example.com/a",
+                                 http_response(b"<h1>A</h1>")))
+            fd.write(b"WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI:"
+                     b" http://example.com/\xff\r\nContent-Length: many"
+                     b"\r\n\r\n<h1>lost</h1>\r\n\r\n")
+            fd.write(warc_record("response", "http://example.com/b",
+                                 http_response(b"<h1>B</h1>")))
+            fd.write(warc_record("response", "http://example.com/c",
+                                 http_response(b"<h1>C</h1>"))
+                     .replace(b"/c", b"/\xe9"))
+        self.assertEqual([r.url for r in WARCReader(archive).responses()],
+                         ["http://example.com/a", "http://example.com/b",
+                          "http://example.com/\ufffd"])
+
+    def test_uncompressed(self):
+        plain = path.join(self.directory, "crawl.warc")
+        with gzip.open(self.archive) as src, open(plain, "wb") as dst:
+            dst.write(src.read())
+        self.assertEqual(len(list(WARCReader(plain).records())), 7)
+
+    def test_batch(self):
+        documents = WARCReader(self.archive).documents(
+            mimetypes=("text/html",))
+        for workers in (1, 2):
+            batch = Batch(DATAPLAN, workers, chunk_size=1, backlog=1)
+            results = {r["link"]: r for r in batch.run(documents)}
+            documents = WARCReader(self.archive).documents(
+                mimetypes=("text/html",))
+            empty = results.pop("http://example.com/empty")
+            self.assertIn("Cannot parse document", empty["errors"][0])
+            titles = {k[-1]: r["records"]["title"]
+                      for k, r in results.items()}
+            self.assertEqual(titles, {"a": "Ä", "b": "Ä", "c": "C"})
+
+    def test_item_errors(self):
+        result = extract_item(DATAPLAN, ("http://example.com/", 42, None))
+        self.assertEqual(result["records"], {})
+        self.assertEqual(len(result["errors"]), 1)
+
+    def test_command_line(self):
+        script = "import sys; sys.argv[0] = 'hap'; " \
+                 "from hap.bootstrap import main; main()"
+        proc = run([executable, "-c", script, "--warc", self.archive,
+                    "--match", "example.com/[ab]", "--workers", "2"],
+                   cwd=ROOT, stdout=PIPE, stderr=PIPE,
+                   input=dumps(DATAPLAN).encode("utf8"))
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        lines = [loads(line) for line in proc.stdout.decode().splitlines()]
+        self.assertEqual(sorted(r["link"] for r in lines),
+                         ["http://example.com/a", "http://example.com/b"])
+        proc = run([executable, "-c", script, "--warc", self.archive,
+                    "--match", "example.com/[ab"], cwd=ROOT, stdout=PIPE,
+                   stderr=PIPE, input=dumps(DATAPLAN).encode("utf8"))
+        self.assertEqual(proc.returncode, 1)
+        self.assertIn(b"Invalid --match", proc.stderr)
+        self.assertNotIn(b"Traceback", proc.stderr)